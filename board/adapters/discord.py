@@ -1,4 +1,8 @@
+import asyncio
 import json
+import math
+import signal
+import time
 
 import discord
 
@@ -12,17 +16,60 @@ class Bot(Client):
         'add_reactions'
     ]
     CHANNEL_NAME = 'マルチ募集'
+    # Edits of the same message within this seconds are saved once
+    EDIT_DEBOUNCE_SEC = 2.0
+    # Stats are stored to Redis in this interval, see `shard_stats()`
+    STATS_INTERVAL_SEC = 60
+    # Other shards skip creating the channel while it is locked
+    PREPARE_LOCK_SEC = 60
+    # Guilds prepared at once in `on_ready`
+    PREPARE_CONCURRENCY = 10
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.edit_debounce_sec = self.EDIT_DEBOUNCE_SEC
+        # message id -> task saving the latest edit
+        self._pending_edits = {}
+        self._stats_task = None
+        self._control_thread = None
+        # guild id -> ids of channels named `channel_name`
+        self._board_channels = {}
+        self.rest_stats = {
+            'edits': 0,
+            'edits_collapsed': 0,
+            'reaction_calls': 0,
+            # Calls which the previous remove-and-add on each edit would make
+            'calls_avoided': 0,
+        }
+        self.event_stats = {
+            'messages': 0,
+            'saves': 0,
+            'deletes': 0,
+        }
 
     async def on_ready(self):
         if not getattr(self, 'board_url', None):
             raise ValueError('board_url is not set')
 
+        if self._stats_task is None:
+            self._stats_task = self.loop.create_task(self.report_stats())
+        if self._control_thread is None:
+            self.watch_plugins()
+
         if self.master:
             await self.master.create_dm()
             await self.cleanup(self.master.dm_channel)
 
-        for guild in self.guilds:
-            await self.prepare(guild)
+        semaphore = asyncio.Semaphore(self.PREPARE_CONCURRENCY)
+        async def prepare(guild):
+            async with semaphore:
+                await self.prepare(guild)
+        results = await asyncio.gather(
+            *[prepare(guild) for guild in self.guilds], return_exceptions=True
+        )
+        for guild, result in zip(self.guilds, results):
+            if isinstance(result, Exception):
+                self.logger.error('Could not prepare %s: %r', guild, result)
         self.logger.info(
             'Successfully logged in as %s.  Invitation: %s',
             self.user.name,
@@ -33,54 +80,179 @@ class Bot(Client):
         self.logger.info('Bot joined to %s', guild)
         await self.prepare(guild)
 
+    async def on_guild_remove(self, guild):
+        self._board_channels.pop(guild.id, None)
+
+    async def on_guild_channel_create(self, channel):
+        self._board_channels.pop(channel.guild.id, None)
+
+    async def on_guild_channel_delete(self, channel):
+        self._board_channels.pop(channel.guild.id, None)
+
+    async def on_guild_channel_update(self, before, after):
+        if before.name != after.name:
+            self._board_channels.pop(after.guild.id, None)
+
+    def board_channel_ids(self, guild):
+        """Ids of channels named `channel_name`, cached until channels change"""
+        ids = self._board_channels.get(guild.id)
+        if ids is None:
+            ids = frozenset(c.id for c in guild.channels if c.name == self.channel_name)
+            self._board_channels[guild.id] = ids
+        return ids
+
     async def on_message(self, message):
         if not self.is_target(message):
             return
+        self.event_stats['messages'] += 1
 
         if (self.user.mentioned_in(message) or self.role_mentioned_in(message)) and \
            'url' in message.content.lower():
+            await self.set_reaction(message, False)
             await self.usage(message=message)
             return
 
         data = self.extract_data(message)
         if not data:
+            await self.set_reaction(message, False)
             return
         if data.get('error'):
+            await self.set_reaction(message, False)
             await self.reply(message, data['error'])
         else:
             try:
                 data = self.manager.validate(data)
-                response = self.manager.save(data)
+                response = await self.manager.save(data)
             except ValueError as ex:
+                await self.set_reaction(message, False)
                 await self.reply(message, str(ex))
             else:
                 created = json.loads(response).get('data')[0]
                 await self.on_board_save(message, created)
 
     async def on_board_save(self, message, saved):
-        await message.add_reaction(self.REACTION)
+        self.event_stats['saves'] += 1
+        await self.set_reaction(message, True)
         completed_message = self.manager.report_for("saved", saved)
         if completed_message:
             await self.reply(message, completed_message)
 
     async def on_message_delete(self, message):
+        pending = self._pending_edits.pop(message.id, None)
+        if pending:
+            pending.cancel()
         if not self.is_target(message):
             return
-        if not [reaction for reaction in message.reactions if reaction.me]:
+        if not self.has_reaction(message):
             return
 
         data = self.extract_data(message)
         if not data:
             return
 
-        self.manager.destroy(data)
+        await self.manager.destroy(data)
+        self.event_stats['deletes'] += 1
 
     async def on_message_edit(self, before, after):
         if before.content == after.content:
             return
+        pending = self._pending_edits.pop(after.id, None)
+        if not self.is_target(after):
+            # Earlier edits would be ignored by `on_message` as well
+            if pending:
+                pending.cancel()
+            return
+
+        self.rest_stats['edits'] += 1
+        if pending:
+            pending.cancel()
+            self.rest_stats['edits_collapsed'] += 1
+            # remove_reaction, add_reaction and reply of the replaced edit
+            self.rest_stats['calls_avoided'] += 3
+        self._pending_edits[after.id] = self.loop.create_task(self._save_edit(after))
 
-        await after.remove_reaction(self.REACTION, self.user)
-        await self.on_message(after)
+    async def _save_edit(self, message):
+        """Save the latest content after `edit_debounce_sec`"""
+        await asyncio.sleep(self.edit_debounce_sec)
+        del self._pending_edits[message.id]
+        had_reaction = self.has_reaction(message)
+        reaction_calls = self.rest_stats['reaction_calls']
+        await self.on_message(message)
+        if had_reaction and self.rest_stats['reaction_calls'] == reaction_calls:
+            # Kept instead of remove_reaction and add_reaction
+            self.rest_stats['calls_avoided'] += 2
+
+    def watch_plugins(self):
+        """Reload plugins on SIGHUP and on messages of CONTROL_CHANNEL"""
+        manager = self.manager
+        # `apply_control` may read Redis, so it runs in the executor of
+        # AsyncBoardManager and not in the event loop
+        self.loop.add_signal_handler(
+            signal.SIGHUP,
+            lambda: self.loop.create_task(manager.apply_control({'action': 'reload'}))
+        )
+        pubsub = manager.redis.pubsub(ignore_subscribe_messages=True)
+        def handler(message):
+            asyncio.run_coroutine_threadsafe(
+                manager.apply_control(json.loads(message['data'])), self.loop
+            )
+        pubsub.subscribe(**{manager.CONTROL_CHANNEL: handler})
+        self._control_thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def has_reaction(self, message):
+        return any(
+            reaction.me and reaction.emoji == self.REACTION
+            for reaction in message.reactions
+        )
+
+    async def set_reaction(self, message, state):
+        """Add or remove my reaction only if it changes"""
+        if self.has_reaction(message) == state:
+            return
+        self.rest_stats['reaction_calls'] += 1
+        if state:
+            await message.add_reaction(self.REACTION)
+        else:
+            await message.remove_reaction(self.REACTION, self.user)
+
+    async def report_stats(self):
+        last = None
+        while not self.is_closed():
+            await asyncio.sleep(self.STATS_INTERVAL_SEC)
+            try:
+                await self.manager.save_stats(self.shard_name, self.shard_stats())
+            except Exception as ex:
+                self.logger.warning('Could not save stats: %s', ex)
+            stats = dict(self.rest_stats)
+            if stats == last:
+                continue
+            last = stats
+            calls = stats['reaction_calls'] + stats['calls_avoided']
+            self.logger.info(
+                'Edits: %d (%d collapsed), reaction calls: %d, avoided: %d (%.0f%%)',
+                stats['edits'], stats['edits_collapsed'],
+                stats['reaction_calls'], stats['calls_avoided'],
+                100.0 * stats['calls_avoided'] / calls if calls else 0,
+            )
+
+    @property
+    def shard_name(self):
+        return 'shard:{}'.format(self.shard_id or 0)
+
+    def shard_stats(self):
+        """Stats of this shard, aggregated by the shard launcher"""
+        latency = self.latency
+        return {
+            'shard_id': self.shard_id or 0,
+            'shard_count': self.shard_count or 1,
+            'guilds': len(self.guilds),
+            # nan or inf until the first heartbeat
+            'latency': latency if math.isfinite(latency) else None,
+            'events': dict(self.event_stats),
+            'rest': dict(self.rest_stats),
+            'parse': self.manager.parse_stats(),
+            'updated_at': time.time(),
+        }
 
     async def usage(self, message=None, channel=None):
         if not message and not channel:
@@ -109,11 +281,16 @@ class Bot(Client):
 
     def extract_data(self, message):
         content = message.clean_content.replace('@' + self.user.name, '')
-        result = self.manager.parse(content, message)
+        # None in DMs, which are targets if the bot is mentioned
+        guild = getattr(message.channel, 'guild', None)
+        result = self.manager.parse(content, message, guild=guild.id if guild else None)
         if not result:
             return None
         if result.get('error'):
             return result
+        if guild is None:
+            # Rooms are posted to the board of a guild
+            return None
 
         result.update({
             'owner': {
@@ -121,8 +298,8 @@ class Bot(Client):
                 'name': message.author.display_name,
             },
             'guild': {
-                'id': message.channel.guild.id,
-                'name': message.channel.guild.name
+                'id': guild.id,
+                'name': guild.name
             },
             'time': message.edited_at or message.created_at
         })
@@ -145,10 +322,10 @@ class Bot(Client):
         self._description = str(value) if value else None
 
     def role_mentioned_in(self, message):
-        for role in message.role_mentions:
-            if role in message.channel.guild.me.roles:
-                return True
-        return False
+        if not message.raw_role_mentions:
+            return False
+        my_roles = {role.id for role in message.channel.guild.me.roles}
+        return not my_roles.isdisjoint(message.raw_role_mentions)
 
     def is_target(self, message):
         if message.author.bot or message.author.system:
@@ -168,12 +345,16 @@ class Bot(Client):
             self.logger.debug('%s does not have guild.', message.channel)
             return False
 
-        return message.channel.name == self.channel_name
+        return message.channel.id in self.board_channel_ids(message.channel.guild)
 
     async def prepare(self, guild):
-        channel = discord.utils.find(lambda c: c.name == self.channel_name, guild.channels)
-        if channel:
+        if self.board_channel_ids(guild):
+            return
+        lock = 'prepare:{}'.format(guild.id)
+        if not await self.manager.acquire_lock(lock, self.shard_name, self.PREPARE_LOCK_SEC):
+            self.logger.info('%s is being prepared by another process', guild)
             return
+        channel = None
         try:
             channel = await guild.create_text_channel(self.channel_name)
         except discord.errors.Forbidden:
@@ -186,13 +367,17 @@ class Bot(Client):
                     guild=guild.name, url=self.invite_url)
             )
         if channel:
-            await channel.send(self.description)
+            await channel.send(self.description_for(guild))
             await self.usage(channel=channel)
 
     @property
     def description(self):
+        return self.description_for()
+
+    def description_for(self, guild=None):
+        """Usage of the plugin selected for the guild"""
         return (
-            self.manager.description +
+            self.manager.description_for(guild.id if guild else None) +
             """\n掲示板サーバーへの書き込みが完了するとボットがリアクション{reaction}をつけてリプライでもお知らせします。
 部屋番号が含まれない投稿や他人宛のメンションは無視します。"""
         ).format(
@@ -0,0 +1,49 @@
+import asyncio
+import concurrent.futures
+import functools
+import logging
+
+class AsyncBoardManager:
+    """Awaitable facade of BoardManager for asyncio applications.
+
+    Methods doing Redis round trips run in a thread pool, so that the event
+    loop (and the discord gateway heartbeat) does not wait for Redis.
+    Other attributes like `parse()` and `validate()` are CPU only and
+    passed through to the wrapped manager.
+
+    Replies are still parsed while holding the GIL, so this helps only as
+    far as the network round trip dominates, and `max_workers` should stay
+    small.  See tools/bench-loop-lag.py."""
+
+    # Methods which talk to Redis
+    BLOCKING_METHODS = (
+        'save', 'save_many', 'destroy', 'get_all', 'get_all_as_json', 'sweep',
+        'acquire_lock', 'save_stats', 'get_stats', 'apply_control',
+    )
+
+    def __init__(self, manager, max_workers=4, loop=None, logger=None):
+        self.logger = logger or logging.getLogger(__name__)
+        self.manager = manager
+        self.loop = loop
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='board'
+        )
+        max_connections = manager.redis.connection_pool.max_connections
+        if max_connections < max_workers:
+            self.logger.warning(
+                'Redis pool has %d connections for %d workers', max_connections, max_workers
+            )
+
+    def __getattr__(self, name):
+        if name in self.BLOCKING_METHODS:
+            return functools.partial(self._run, getattr(self.manager, name))
+        return getattr(self.manager, name)
+
+    async def _run(self, func, *args, **kwargs):
+        loop = self.loop or asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs)
+        )
+
+    def close(self):
+        self.executor.shutdown(wait=True)
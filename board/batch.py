@@ -0,0 +1,35 @@
+class EventBatch:
+    """Partial and delete events merged per room until they are sent.
+
+    A later partial for the same room replaces the earlier one.  When a
+    room which no client knows is created and deleted in the same batch,
+    both events are dropped.
+
+    Events are kept as `(item, room)` pairs, where `item` is sent to
+    clients and `room` is the full room used to route it."""
+
+    def __init__(self):
+        self.partial = {}
+        self.deleted = {}
+        self.size = 0
+
+    def __len__(self):
+        """Number of merged events"""
+        return self.size
+
+    def add(self, data_type, item, room=None, is_new=False):
+        """Merge an event of one room.
+        `is_new` tells that no client can know the room, because neither
+        sent events nor the snapshot had it."""
+        room_id = item['id']
+        self.size += 1
+        if data_type == 'partial':
+            self.partial[room_id] = (item, item)
+        elif data_type == 'delete':
+            if self.partial.pop(room_id, None) and is_new:
+                return
+            self.deleted[room_id] = (item, room or item)
+
+    def events(self):
+        """Deleted and partial pairs.  Deletes must be applied first."""
+        return list(self.deleted.values()), list(self.partial.values())
@@ -0,0 +1,104 @@
+"""Wire formats of messages sent to WebSocket clients.
+
+'json' sends rooms as they are.  'compact' sends each list of rooms as
+a table, so that keys are not repeated for every room:
+
+    {"type": "partial", "seq": 3, "data": {
+        "cols": ["id", "time", ["owner", "id"], ["owner", "name"], ["guild", "name"]],
+        "enums": [null, null, null, null, ["team"]],
+        "rows": [["1234567", 1499794027, "12345", "name", 0], ...]
+    }}
+
+Nested objects like `owner` are split into a column per key, given as
+`[key, subkey]`.  Columns whose values repeat in the message are sent
+as indexes into `enums`.  A null cell means that the room has no value.
+Clients choose it by `?format=compact` of the WebSocket request."""
+import json
+import urllib.parse
+
+ENCODINGS = ('json', 'compact')
+
+def from_environ(environ):
+    """Read `?format=<encoding>` of the WebSocket request.
+    Unknown values fall back to 'json'."""
+    query = urllib.parse.parse_qs((environ or {}).get('QUERY_STRING', ''))
+    encoding = (query.get('format') or ['json'])[0]
+    return encoding if encoding in ENCODINGS else 'json'
+
+def dumps(message, encoding='json'):
+    """Serialize a message dict like `{'type': 'partial', 'data': [...]}`"""
+    if encoding != 'compact':
+        return json.dumps(message)
+    message = dict(message)
+    for name in ('data', 'delete'):
+        if name in message:
+            message[name] = pack(message[name])
+    # Non-ASCII names are 3 bytes in UTF-8 instead of 6 bytes escaped
+    return json.dumps(message, ensure_ascii=False, separators=(',', ':'))
+
+def pack(rooms):
+    """Table of room dicts"""
+    columns = {}
+    for room in rooms:
+        for key, value in room.items():
+            if isinstance(value, dict) and value:
+                for subkey in value:
+                    columns.setdefault((key, subkey), None)
+            else:
+                columns.setdefault(key, None)
+    columns = list(columns)
+
+    rows = [[_lookup(room, column) for column in columns] for room in rooms]
+    enums = []
+    for i in range(len(columns)):
+        values = [row[i] for row in rows if row[i] is not None]
+        index = {}
+        if all(_internable(value) for value in values):
+            for value in values:
+                index.setdefault(value, len(index))
+        if not index or len(index) == len(values):
+            # Not internable, or no value is repeated
+            enums.append(None)
+            continue
+        for row in rows:
+            if row[i] is not None:
+                row[i] = index[row[i]]
+        enums.append(list(index))
+
+    return {
+        'cols': [list(column) if isinstance(column, tuple) else column for column in columns],
+        'enums': enums,
+        'rows': rows,
+    }
+
+def unpack(table):
+    """Room dicts of a table.  Same as the decoder of application.js"""
+    columns, enums = table['cols'], table['enums']
+    rooms = []
+    for row in table['rows']:
+        room = {}
+        for column, values, value in zip(columns, enums, row):
+            if value is None:
+                continue
+            if values is not None:
+                value = values[value]
+            if isinstance(column, list):
+                room.setdefault(column[0], {})[column[1]] = value
+            else:
+                room[column] = value
+        rooms.append(room)
+    return rooms
+
+def _internable(value):
+    # True == 1 in dict keys
+    return isinstance(value, (str, int)) and not isinstance(value, bool)
+
+def _lookup(room, column):
+    if isinstance(column, tuple):
+        value = room.get(column[0])
+        return value.get(column[1]) if isinstance(value, dict) else None
+    value = room.get(column)
+    if isinstance(value, dict) and value:
+        # Split into columns of other rooms
+        return None
+    return value
@@ -1,12 +1,16 @@
 import calendar
+import collections
 import datetime
 import json
 import logging
+import re
 import time
 import importlib
 
 import redis
 
+from . import scripts
+from .pool import create_pool
 from .exceptions import PluginError
 
 class DefaultPlugin:
@@ -29,6 +33,13 @@ class DefaultPlugin:
         return {}
 
 class DefaultValidator:
+    # owner / guild: Based on discord specs
+    MAX_LENGTH = {
+        'owner': 32,
+        'guild': 100,
+        'message': 30,
+    }
+
     @staticmethod
     def validate(data, cleaned_by_others=None):
         """Expected data scheme.
@@ -47,68 +58,317 @@ class DefaultValidator:
         }
         """
         cleaned = {}
+        _validate_default(data, cleaned)
+        return cleaned
 
-        # owner / guild: Based on discord specs
-        max_length = {
-            'owner': 32,
-            'guild': 100,
-            'message': 30,
-        }
-        for attr in ('owner', 'guild'):
-            attr_values = data.get(attr)
-            if not attr_values:
-                raise ValueError('%s.id must not be empty.' % attr)
-            attr_id = attr_values.get('id')
-
-            if isinstance(attr_id, int):
-                attr_id = str(attr_id)
-            if not attr_id:
-                raise ValueError('%s.id must not be empty.' % attr)
-            cleaned[attr] = {'id': str(attr_id)}
-
-            attr_displayname = data[attr].get('name')
-            if attr_displayname:
-                cleaned[attr]['name'] = str(attr_displayname)[0:max_length[attr]]
-
-        time_data = data.get('time')
-        if not time_data:
-            time_data = time.time()
-        elif isinstance(time_data, str):
-            pass
-        elif isinstance(time_data, datetime.datetime):
-            if time_data.tzinfo:
-                time_data = time_data.timestamp()
+    @classmethod
+    def compile(cls):
+        """Return a function which validates `data` into `cleaned` in place.
+        The schema is looked up only once here."""
+        attrs = tuple((attr, cls.MAX_LENGTH[attr]) for attr in ('owner', 'guild'))
+        message_length = cls.MAX_LENGTH['message']
+        now = time.time
+        timegm = calendar.timegm
+        datetime_type = datetime.datetime
+
+        def validate(data, cleaned):
+            for attr, max_length in attrs:
+                attr_values = data.get(attr)
+                if not attr_values:
+                    raise ValueError('%s.id must not be empty.' % attr)
+                if not isinstance(attr_values, dict):
+                    raise ValueError('%s must be an object.' % attr)
+                attr_id = attr_values.get('id')
+                if type(attr_id) is not str:
+                    if isinstance(attr_id, int):
+                        attr_id = str(attr_id)
+                    if not attr_id:
+                        raise ValueError('%s.id must not be empty.' % attr)
+                    attr_id = str(attr_id)
+                elif not attr_id:
+                    raise ValueError('%s.id must not be empty.' % attr)
+                values = {'id': attr_id}
+                attr_displayname = attr_values.get('name')
+                if attr_displayname:
+                    values['name'] = str(attr_displayname)[0:max_length]
+                cleaned[attr] = values
+
+            time_data = data.get('time')
+            if type(time_data) is int and time_data:
+                cleaned['time'] = time_data
             else:
-                time_data = calendar.timegm(time_data.utctimetuple())
+                if not time_data:
+                    time_data = now()
+                elif isinstance(time_data, datetime_type):
+                    if time_data.tzinfo:
+                        time_data = time_data.timestamp()
+                    else:
+                        time_data = timegm(time_data.utctimetuple())
+                try:
+                    cleaned['time'] = int(time_data)
+                except (TypeError, ValueError):
+                    raise ValueError('time is not a valid time') from None
+
+            message = data.get('message')
+            if message:
+                cleaned['message'] = str(message)[0:message_length]
+
+        return validate
+
+_validate_default = DefaultValidator.compile()
+
+def compile_validators(validators):
+    """Chain validators into one function `validate(data)`.
+
+    Validators with `compile()` return a function updating `cleaned` in
+    place.  Others are called through `validate(data, cleaned)` as before.
+    Validators are run in order, and the first error stops the chain."""
+    steps = []
+    for validator in validators:
+        if hasattr(validator, 'compile'):
+            steps.append(validator.compile())
+        else:
+            steps.append(_update_with(validator.validate))
+    steps = tuple(steps)
+
+    def validate(data):
+        if not isinstance(data, dict):
+            raise ValueError('data must be an object.')
+        cleaned = {}
+        for step in steps:
+            step(data, cleaned)
+        return cleaned
+
+    return validate
+
+def _update_with(validate):
+    def step(data, cleaned):
+        cleaned.update(validate(data, cleaned))
+    return step
+
+def compile_prefilter(spec):
+    """Function `accept(content)` telling whether the parser may match.
+
+    `spec` is `Parser.PREFILTER` of a plugin, like
+    `{'min_length': 7, 'max_length': 500, 'any_chars': '0123456789'}`.
+    All keys are optional.  Returns None if nothing to check."""
+    if not spec:
+        return None
+    min_length = spec.get('min_length') or 0
+    max_length = spec.get('max_length')
+    any_chars = frozenset(spec.get('any_chars') or '')
+
+    def accept(content):
+        if len(content) < min_length:
+            return False
+        if max_length is not None and len(content) > max_length:
+            return False
+        if any_chars and any_chars.isdisjoint(content):
+            return False
+        return True
+
+    return accept
+
+class ParseCache:
+    """LRU of parse results keyed by content.
+    Results are returned as shallow copies, as callers update them.
+    None (not a room) is not cached, so that ordinary chat does not evict
+    rooms."""
+
+    def __init__(self, size=256):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'filtered': 0}
+
+    def get(self, content):
+        """Returns `(found, result)`"""
         try:
-            cleaned['time'] = int(time_data)
-        except ValueError:
-            raise ValueError('time is not a valid time') from None
+            result = self.entries[content]
+        except KeyError:
+            self.stats['misses'] += 1
+            return False, None
+        self.entries.move_to_end(content)
+        self.stats['hits'] += 1
+        return True, self._copy(result)
+
+    def put(self, content, result):
+        if result is None:
+            return None
+        self.entries[content] = self._copy(result)
+        self.entries.move_to_end(content)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return result
 
-        message = data.get('message')
-        if message:
-            cleaned['message'] = str(message)[0:max_length['message']]
+    def clear(self):
+        self.entries.clear()
 
-        return cleaned
+    @staticmethod
+    def _copy(result):
+        return dict(result) if isinstance(result, dict) else result
+
+class LoadedPlugin(collections.namedtuple(
+        'LoadedPlugin', 'name parser validate prefilter cache description')):
+    """Parser plugin compiled with validators.
+    It is replaced as a whole on reload, so calls in progress keep using
+    the previous one."""
+    __slots__ = ()
+
+    def parse(self, content, *args, **kwargs):
+        """Parse content by the plugin.
+        Contents rejected by `PREFILTER` of the plugin are not parsed."""
+        cache = self.cache
+        if self.prefilter is not None and not self.prefilter(content):
+            if cache is not None:
+                cache.stats['filtered'] += 1
+            return None
+        if cache is None:
+            return self.parser.parse_content(content, *args, **kwargs)
+        found, result = cache.get(content)
+        if found:
+            return result
+        return cache.put(content, self.parser.parse_content(content, *args, **kwargs))
+
+class PluginRegistry:
+    """Plugins by module name and the plugin selected for each guild.
+
+    Guilds without selection use `default`.  `reload()` builds new plugins
+    before swapping them in, and a failed import keeps the previous one."""
+
+    def __init__(self, validators=(), cache_size=0, logger=None):
+        self.logger = logger or logging.getLogger(__name__)
+        self.validators = list(validators)
+        self.cache_size = cache_size
+        self.default = None
+        self.plugins = {}
+        # guild id (str) -> plugin name
+        self.guilds = {}
+
+    @property
+    def names(self):
+        return list(self.plugins)
+
+    def load(self, plugin, reload=False):
+        """Load a module (or module name) and return its name"""
+        if isinstance(plugin, str):
+            plugin = importlib.import_module(plugin)
+        if reload:
+            plugin = importlib.reload(plugin)
+        parser = plugin.Parser()
+        cache = None
+        if self.cache_size and getattr(parser, 'PARSE_CACHE', True):
+            cache = ParseCache(self.cache_size)
+        if not plugin.__doc__:
+            self.logger.warning('%s has no description.', plugin.__name__)
+        name = plugin.__name__
+        self.plugins[name] = LoadedPlugin(
+            name, parser,
+            compile_validators(self.validators + [parser]),
+            compile_prefilter(getattr(parser, 'PREFILTER', None)),
+            cache,
+            plugin.__doc__ or '',
+        )
+        if self.default is None:
+            self.default = name
+        self.logger.debug('Plugin %s loaded.', name)
+        return name
+
+    def reload(self, name=None):
+        """Reload one or all plugins.  Returns names which failed"""
+        failed = []
+        for plugin in [name] if name else self.names:
+            try:
+                self.load(plugin, reload=True)
+            except Exception:
+                self.logger.exception('Could not reload %s, keep the previous one', plugin)
+                failed.append(plugin)
+        return failed
+
+    def add_validator(self, validator):
+        """Run `validator` before the validator of each plugin"""
+        self.validators.append(validator)
+        for name, plugin in list(self.plugins.items()):
+            self.plugins[name] = plugin._replace(
+                validate=compile_validators(self.validators + [plugin.parser])
+            )
+
+    def set_guilds(self, guilds):
+        """Replace plugin selections.  Unknown plugins are ignored"""
+        selected = {}
+        for guild_id, name in guilds.items():
+            if name not in self.plugins:
+                self.logger.warning('Unknown plugin %s for guild %s', name, guild_id)
+                continue
+            selected[str(guild_id)] = name
+        self.guilds = selected
+
+    def for_guild(self, guild_id=None):
+        name = self.guilds.get(str(guild_id)) if guild_id is not None else None
+        return self.plugins[name or self.default]
 
 class BoardManager:
     CHANNEL = 'newroom'
+    # Plugin reloads and selections for all processes
+    CONTROL_CHANNEL = 'board-control'
     DEFAULT_CONFIG = {
         'expire_sec': 120,
         'prefix': 'room',
+        'storage': 'keys',
+        'notifications': 'auto',
+        'expire_by': 'ttl',
+        # Connection pool, see `board.pool.create_pool()`
+        'redis_blocking_pool': False,
+        'redis_max_connections': None,
+        'redis_pool_timeout': 20,
+        'redis_socket_timeout': None,
+        'redis_health_check_interval': 0,
+        # Rooms cached per content, for parsers slower than a cache lookup.
+        # 0 to disable.  See tools/bench-parse.py
+        'parse_cache_size': 0,
+        # Module names of plugins selectable per guild, besides `plugin`
+        'plugins': None,
+        'events': 'pubsub',
+        # Approximate max events in the stream on Redis before 6.2, which
+        # cannot trim events older than expire_sec (events='stream' only)
+        'stream_maxlen': 10000,
     }
 
     KEY_GLUE = ':'
+    # Index keys must not match `generate_key()` patterns
+    INDEX_SUFFIX = '-index'
+    LOCK_SUFFIX = '-lock'
+    STATS_SUFFIX = '-stats'
+    PLUGINS_SUFFIX = '-plugins'
+    EVENTS_SUFFIX = '-events'
+    # 'keys': look up rooms of the owner with KEYS on every save and destroy
+    #         (legacy, O(N) over the keyspace).  get_all uses SCAN
+    # 'index': maintain a sorted set of rooms and a set per owner
+    STORAGES = ('keys', 'index')
+    # 'ttl': rooms are removed by EXPIRE of Redis
+    # 'sweeper': rooms are removed by `sweep()` (requires index storage)
+    EXPIRE_METHODS = ('ttl', 'sweeper')
+    # 'pubsub': events are published to CHANNEL, and lost while no one subscribes
+    # 'stream': events are appended to a capped stream and read by `read_events()`
+    EVENT_LOGS = ('pubsub', 'stream')
+    # Keys are kept longer than expire_sec in case no sweeper is running
+    SWEEPER_TTL_FACTOR = 2
+    # Keyevent notifications for generic commands (DEL) and expired keys
+    NOTIFY_FLAGS = 'Egx'
+    # Keys per MGET, so that one reply does not block Redis for long
+    MGET_CHUNK = 1000
+    # Hint of keys per SCAN call (keys storage)
+    SCAN_COUNT = 1000
+    # Errors of EVAL, EVALSHA or SCRIPT LOAD themselves.  An unknown or denied
+    # command inside a script is reported as "Error running script"
+    SCRIPTING_ERROR = re.compile(
+        r"(?:unknown command|permissions to run the) [`'](?:eval|evalsha|script)\b"
+        r"|\b(?:eval|evalsha|scripting) (?:is )?disabled"
+    )
+    # Redis version which trims streams by MINID
+    STREAM_MINID_VERSION = (6, 2)
 
     def __init__(self, redis_url, config, logger=None):
         self.logger = logger or logging.getLogger(__name__)
-        self.redis = redis.from_url(redis_url)
-        try:
-            self.redis.config_get('notify-keyspace-events')
-            self.notifications_available = True
-        except:
-            self.notifications_available = False
-        self.notifications_available = False
         self.config = dict(self.DEFAULT_CONFIG)
         if config:
             for k, v in config.items():
@@ -116,79 +376,505 @@ class BoardManager:
                     # Do not override with None
                     self.config[k] = v
 
-        self.validators = []
+        self.redis = redis.Redis(connection_pool=create_pool(
+            redis_url,
+            blocking=self.config['redis_blocking_pool'],
+            max_connections=self.config['redis_max_connections'],
+            timeout=self.config['redis_pool_timeout'],
+            socket_timeout=self.config['redis_socket_timeout'],
+            health_check_interval=self.config['redis_health_check_interval'],
+        ))
+
+        self._replace_script = self.redis.register_script(scripts.REPLACE)
+        self._sweep_script = self.redis.register_script(scripts.SWEEP)
+        self._get_all_script = self.redis.register_script(scripts.GET_ALL)
+        self.scripting_available = True
+
+        self.plugins = PluginRegistry(
+            cache_size=self.config['parse_cache_size'], logger=self.logger
+        )
         self.add_validator(DefaultValidator)
         self.load_plugin(config['plugin'])
+        extra_plugins = self.config['plugins'] or []
+        if isinstance(extra_plugins, str):
+            extra_plugins = [name.strip() for name in extra_plugins.split(',') if name.strip()]
+        for name in extra_plugins:
+            self.plugins.load(name)
 
         self.expire_sec = self.config['expire_sec']
         self.prefix = self.config['prefix']
+        self.load_guild_plugins()
+        self.storage = self.config['storage']
+        if self.storage not in self.STORAGES:
+            raise ValueError('Unknown storage: {!r}'.format(self.storage))
+        self.expire_by = self.config['expire_by']
+        if self.expire_by not in self.EXPIRE_METHODS:
+            raise ValueError('Unknown expire_by: {!r}'.format(self.expire_by))
+        if self.expire_by == 'sweeper' and self.storage != 'index':
+            raise ValueError('Sweeper requires index storage')
+        if self.storage == 'index' and not self.redis.exists(self.index_key):
+            self.rebuild_index()
+        self.events = self.config['events']
+        if self.events not in self.EVENT_LOGS:
+            raise ValueError('Unknown events: {!r}'.format(self.events))
+
+        self.stream_minid_available = False
+        if self.events == 'stream':
+            self.stream_minid_available = self._is_minid_supported()
+
+        self.notifications_available = False
+        if self.events == 'stream':
+            # Keyevents cannot be written to the stream
+            self.logger.info('Delete events are appended to %s by BoardManager', self.events_key)
+        elif self.expire_by == 'sweeper':
+            # Rooms are deleted by SWEEP, which publishes one event per batch
+            # instead of a keyevent per room
+            self.logger.info('Delete events are published by BoardManager and the sweeper')
+        elif self.config['notifications'] != 'off':
+            self.notifications_available = self.enable_notifications()
+
+    def enable_notifications(self):
+        """Let Redis publish `del` and `expired` keyevents of rooms.
+        If enabled, BoardManager does not publish delete events by itself.
+        Returns False if CONFIG is forbidden, like on managed Redis."""
+        try:
+            current = self.redis.config_get('notify-keyspace-events')
+            current = self._decode_message(current).get('notify-keyspace-events', '')
+            if self._has_notify_flags(current):
+                return True
+            flags = ''.join(sorted(set(current + self.NOTIFY_FLAGS)))
+            self.redis.config_set('notify-keyspace-events', flags)
+        except redis.exceptions.ResponseError as ex:
+            self.logger.warning('Keyspace notifications are not available: %s', ex)
+            return False
+        self.logger.info('Keyspace notifications are enabled: %s', flags)
+        return True
+
+    @classmethod
+    def _has_notify_flags(cls, flags):
+        if 'E' not in flags:
+            return False
+        # 'A' is an alias of 'g$lshzxe'
+        return 'A' in flags or all(flag in flags for flag in cls.NOTIFY_FLAGS)
+
+    @property
+    def keyevent_pattern(self):
+        """Channel pattern of keyevents in the selected database"""
+        db = self.redis.connection_pool.connection_kwargs.get('db', 0)
+        return '__keyevent@{}__:*'.format(db)
+
+    def is_room_key(self, key):
+        """Whether the key is generated by `generate_key`.
+        Index keys are not room keys."""
+        values = key.split(self.KEY_GLUE)
+        return len(values) == 3 and values[0] == self.prefix
 
     def load_plugin(self, plugin):
-        if isinstance(plugin, str):
-            plugin = importlib.import_module(plugin)
-        self._parser = plugin.Parser()
-        self.add_validator(self._parser)
-        if not plugin.__doc__:
-            self.logger.warning('%s has no description.', plugin.__class__)
-        self.description = plugin.__doc__
-        self.logger.debug('Plugin %s loaded.', plugin.__class__)
+        """Load the plugin for guilds without selection"""
+        self.plugins.default = self.plugins.load(plugin)
 
     def add_validator(self, instance):
         if isinstance(instance, type):
             instance = instance()
-        self.validators.append(instance)
+        self.plugins.add_validator(instance)
         self.logger.debug('Validator %s added.', instance.__class__)
 
+    @property
+    def validators(self):
+        return self.plugins.validators
+
+    @property
+    def events_key(self):
+        """Stream of events (events='stream' only)"""
+        return self.prefix + self.EVENTS_SUFFIX
+
+    @property
+    def event_target(self):
+        """Channel or stream which scripts write events to"""
+        return self.events_key if self.events == 'stream' else self.CHANNEL
+
+    def _is_minid_supported(self):
+        """Whether XADD can trim the stream by MINID"""
+        try:
+            version = self.redis.info('server').get('redis_version', '')
+        except redis.exceptions.ResponseError as ex:
+            self.logger.warning('Could not get the version of Redis: %s', ex)
+            return False
+        try:
+            supported = tuple(map(int, version.split('.')[:2])) >= self.STREAM_MINID_VERSION
+        except ValueError:
+            supported = False
+        if not supported:
+            self.logger.info('Events are trimmed by MAXLEN on Redis %s', version)
+        return supported
+
+    @property
+    def _stream_trim(self):
+        """Strategy and threshold of XADD to trim the event stream.
+        `['', '']` if events are published to the channel."""
+        if self.events != 'stream':
+            return ['', '']
+        if self.stream_minid_available:
+            # Events older than rooms are useless.  IDs are milliseconds
+            return ['MINID', '{}-0'.format(int((time.time() - self.expire_sec) * 1000))]
+        return ['MAXLEN', self.config['stream_maxlen']]
+
+    def emit(self, client, message):
+        """Publish an event message, or append it to the stream.
+        `client` may be a pipeline."""
+        if self.events == 'stream':
+            # XADD of redis-py does not know MINID
+            trim, threshold = self._stream_trim
+            client.execute_command(
+                'XADD', self.events_key, trim, '~', threshold, '*', 'data', message
+            )
+        else:
+            client.publish(self.CHANNEL, message)
+
+    def read_events(self, last_id, count=100, block=None):
+        """Events appended after `last_id` as `(id, event)` pairs.
+        Waits at most `block` milliseconds if there are none.
+        The event is None for a malformed entry, so that readers can skip
+        its ID."""
+        reply = self.redis.xread({self.events_key: last_id}, count=count, block=block)
+        events = []
+        for _, entries in reply or []:
+            for entry_id, fields in entries:
+                entry_id = entry_id.decode('utf-8')
+                try:
+                    event = json.loads(fields[b'data'])
+                except (KeyError, TypeError, ValueError) as ex:
+                    self.logger.warning('Malformed event %s: %s', entry_id, ex)
+                    event = None
+                events.append((entry_id, event))
+        return events
+
+    def event_ids(self):
+        """IDs of the first and the last event in the stream.
+        `(None, None)` if the stream is empty."""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.xrange(self.events_key, count=1)
+        pipe.xrevrange(self.events_key, count=1)
+        first, last = pipe.execute()
+        if not first:
+            return None, None
+        return first[0][0].decode('utf-8'), last[0][0].decode('utf-8')
+
+    @property
+    def guild_plugins_key(self):
+        """Hash of guild id -> plugin name"""
+        return self.prefix + self.PLUGINS_SUFFIX
+
+    def load_guild_plugins(self):
+        guilds = self.redis.hgetall(self.guild_plugins_key)
+        self.plugins.set_guilds({
+            k.decode('utf-8'): v.decode('utf-8') for k, v in guilds.items()
+        })
+
+    def select_plugin(self, guild_id, name=None):
+        """Use the plugin for the guild in all processes.  None for the default"""
+        if name is None:
+            self.redis.hdel(self.guild_plugins_key, str(guild_id))
+        elif name not in self.plugins.plugins:
+            raise ValueError('Unknown plugin: {!r}'.format(name))
+        else:
+            self.redis.hset(self.guild_plugins_key, str(guild_id), name)
+        self.publish_control('guilds')
+
+    def publish_control(self, action, **kwargs):
+        """Ask all processes subscribing CONTROL_CHANNEL to `apply_control()`"""
+        if action == 'reload' and kwargs.get('plugin') not in (None, *self.plugins.names):
+            raise ValueError('Unknown plugin: {!r}'.format(kwargs['plugin']))
+        self.redis.publish(self.CONTROL_CHANNEL, json.dumps(dict(kwargs, action=action)))
+
+    def apply_control(self, message):
+        """Apply a message of CONTROL_CHANNEL to this process"""
+        action = message.get('action')
+        if action == 'reload':
+            failed = self.plugins.reload(message.get('plugin'))
+            self.logger.info('Plugins reloaded.  Failed: %s', failed or '-')
+        elif action == 'guilds':
+            self.load_guild_plugins()
+            self.logger.info('Plugins of guilds reloaded: %d guilds', len(self.plugins.guilds))
+        else:
+            self.logger.warning('Unknown control message: %r', message)
+
     def get_all(self):
+        if self.storage == 'index' and self.scripting_available:
+            try:
+                values = self._get_all_script(keys=[self.index_key], args=[time.time()])
+            except redis.exceptions.ResponseError as ex:
+                if not self._is_scripting_error(ex):
+                    raise
+                self._disable_scripting(ex)
+            else:
+                return [json.loads(value) for value in values]
+
+        keys = self.get_all_keys()
+        if not keys:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for i in range(0, len(keys), self.MGET_CHUNK):
+            pipe.mget(keys[i:i + self.MGET_CHUNK])
         return [
             json.loads(value)
-            for value in self.redis.mget(self.get_all_keys())
+            for values in pipe.execute() for value in values
+            # Expired after `get_all_keys()`
+            if value is not None
         ]
 
+    def pool_stats(self):
+        """Utilization of the connection pool"""
+        pool = self.redis.connection_pool
+        if not hasattr(pool, 'get_stats'):
+            return None
+        return pool.get_stats()
+
     def get_all_as_json(self):
         return json.dumps({'type': 'all', 'data': self.get_all()})
 
     def get_all_keys(self):
-        return self.redis.keys(self.generate_key())
+        if self.storage == 'index':
+            return self.redis.zrangebyscore(self.index_key, time.time(), '+inf')
+        # SCAN may return a key more than once
+        return list(dict.fromkeys(
+            self.redis.scan_iter(match=self.generate_key(), count=self.SCAN_COUNT)
+        ))
+
+    def get_owner_keys(self, data):
+        if self.storage == 'index':
+            return list(self.redis.smembers(self.owner_index_key(data)))
+        return self.redis.keys(self.generate_key(data, fields='owner'))
+
+    @property
+    def index_key(self):
+        """Sorted set of all room keys scored by their expiration time"""
+        return self.prefix + self.INDEX_SUFFIX
+
+    def owner_index_key(self, data):
+        """Set of room keys owned by the owner of `data`"""
+        return self.KEY_GLUE.join([self.index_key, str(data['owner']['id'])])
+
+    def acquire_lock(self, name, owner, ttl=60):
+        """Lock `name` for `ttl` seconds across processes.
+        Returns False if someone else holds it."""
+        key = self.KEY_GLUE.join([self.prefix + self.LOCK_SUFFIX, str(name)])
+        return bool(self.redis.set(key, str(owner), nx=True, px=int(ttl * 1000)))
+
+    @property
+    def stats_key(self):
+        """Hash of stats reported by each process, like bot shards"""
+        return self.prefix + self.STATS_SUFFIX
+
+    def save_stats(self, name, stats):
+        self.redis.hset(self.stats_key, name, json.dumps(stats))
+
+    def get_stats(self):
+        return {
+            k.decode('utf-8'): json.loads(v)
+            for k, v in self.redis.hgetall(self.stats_key).items()
+        }
+
+    def rebuild_index(self):
+        """Build index from existing room keys.
+        Use SCAN instead of KEYS so that it is safe on a live server."""
+        now = time.time()
+        count = 0
+        pipe = self.redis.pipeline()
+        cursor = None
+        while cursor != 0:
+            cursor, keys = self.redis.scan(cursor or 0, match=self.generate_key())
+            if not keys:
+                continue
+            # TTL of the whole batch in one round trip
+            ttl_pipe = self.redis.pipeline(transaction=False)
+            for key in keys:
+                ttl_pipe.ttl(key)
+            for key, ttl in zip(keys, ttl_pipe.execute()):
+                if ttl is None or ttl < 0:
+                    ttl = self.key_ttl
+                ttl -= self.key_ttl - self.expire_sec
+                owner = self.split_key(self._decode_message([key])[0])['owner']
+                owner_key = self.owner_index_key({'owner': {'id': owner}})
+                pipe.zadd(self.index_key, {key: now + ttl})
+                pipe.sadd(owner_key, key)
+                pipe.expire(owner_key, self.key_ttl)
+                count += 1
+        pipe.execute()
+        self.logger.info('Index %s is built with %d rooms.', self.index_key, count)
+        return count
 
     def destroy(self, data):
         data = self.validate(data)
-        keys = self.redis.keys(
-            self.generate_key(data)
-        )
-        if keys:
-            self.redis.delete(*keys)
-            if not self.notifications_available:
-                msg = json.dumps({'type': 'delete', 'data': [data]})
-                self.redis.publish(self.CHANNEL, msg)
+        # Same as keyevent notifications
+        msg = json.dumps({'type': 'delete', 'data': [{'id': data['id']}]})
+        self.replace('destroy', data, msg)
 
     def save(self, data):
+        self.check_required(data)
+
+        msg = json.dumps({'type': 'partial', 'data': [data]})
+        evicted = self.replace('save', data, json.dumps(data), msg)
+        if evicted:
+            self.logger.debug("Owner had keys %s", repr(evicted))
+        return msg
+
+    def save_many(self, rooms):
+        """Save validated rooms in one pipelined batch.
+        Delete and partial events are published once for all rooms.
+        If an owner has several rooms, only the last one is saved.
+        Returns the published partial message, or None if rooms are empty."""
+        latest = {}
+        for data in rooms:
+            self.check_required(data)
+            owner_id = str(data['owner']['id'])
+            # Keep the order of the last appearance
+            latest.pop(owner_id, None)
+            latest[owner_id] = data
+        rooms = list(latest.values())
+        if not rooms:
+            return None
+
+        msg = json.dumps({'type': 'partial', 'data': rooms})
+        evicted = None
+        if self.scripting_available:
+            pipe = self.redis.pipeline(transaction=False)
+            for data in rooms:
+                keys, args = self._replace_args('save', data, json.dumps(data), publish=False)
+                self._replace_script(keys=keys, args=args, client=pipe)
+            try:
+                evicted = [key for keys in pipe.execute() for key in keys]
+            except redis.exceptions.ResponseError as ex:
+                if not self._is_scripting_error(ex):
+                    raise
+                self._disable_scripting(ex)
+        if evicted is None:
+            evicted = []
+            for data in rooms:
+                evicted.extend(self._save_fallback(data, json.dumps(data), publish=False))
+
+        pipe = self.redis.pipeline(transaction=False)
+        if evicted and not self.notifications_available:
+            json_data = [
+                {'id': self.split_key(k)['room']}
+                for k in self._decode_message(evicted)
+            ]
+            self.emit(pipe, json.dumps({'type': 'delete', 'data': json_data}))
+        self.emit(pipe, msg)
+        pipe.execute()
+        return msg
+
+    @staticmethod
+    def check_required(data):
         try:
            data['id']
            data['owner']['id']
         except KeyError:
             raise PluginError('Required keys are missing.  It seems that Plugin removed them or did not handle them at all.')
 
-        owner_keys = self.redis.keys(
-            self.generate_key(data, fields='owner')
+    def _replace_args(self, mode, data, payload, partial='', publish=True):
+        """KEYS and ARGV of `scripts.REPLACE`"""
+        keys = [self.generate_key(data), self.index_key, self.owner_index_key(data)]
+        args = [
+            mode, payload, self.expire_sec, time.time(), self.storage,
+            self.generate_key(data, fields='owner'), self.event_target,
+            1 if publish and not self.notifications_available else 0, partial,
+            self.key_ttl, 0 if self.expire_by == 'sweeper' else 1, *self._stream_trim,
+        ]
+        return keys, args
+
+    def replace(self, mode, data, payload, partial=''):
+        """Run `scripts.REPLACE` in one round trip.
+        Returns deleted keys."""
+        if self.scripting_available:
+            keys, args = self._replace_args(mode, data, payload, partial)
+            try:
+                return self._replace_script(keys=keys, args=args)
+            except redis.exceptions.ResponseError as ex:
+                if not self._is_scripting_error(ex):
+                    raise
+                self._disable_scripting(ex)
+        if mode == 'destroy':
+            return self._destroy_fallback(data, payload)
+        return self._save_fallback(data, payload, partial)
+
+    def _disable_scripting(self, ex):
+        self.scripting_available = False
+        self.logger.warning(
+            'Scripting is not available, fallback to separated commands: %s', ex
         )
+
+    def _destroy_fallback(self, data, msg):
+        key = self.generate_key(data)
+        pipe = self.redis.pipeline()
+        pipe.delete(key)
+        if self.storage == 'index':
+            pipe.zrem(self.index_key, key)
+            pipe.srem(self.owner_index_key(data), key)
+        if not pipe.execute()[0]:
+            return []
+        if not self.notifications_available:
+            self.emit(self.redis, msg)
+        return [key]
+
+    def _save_fallback(self, data, payload, msg='', publish=True):
+        """Same as `scripts.REPLACE` by separated commands.
+        Events are not published unless `publish` is set."""
+        owner_keys = self.get_owner_keys(data)
+        key = self.generate_key(data)
+        owner_key = self.owner_index_key(data)
+        now = time.time()
+
+        pipe = self.redis.pipeline()
         if owner_keys:
-            self.logger.debug("Owner has keys %s", repr(owner_keys))
-            if not self.notifications_available:
+            pipe.delete(*owner_keys)
+            if self.storage == 'index':
+                pipe.zrem(self.index_key, *owner_keys)
+                pipe.delete(owner_key)
+            if publish and not self.notifications_available:
                 json_data = [
                     {'id': self.split_key(k)['room']}
                     for k in self._decode_message(owner_keys)
                 ]
-                msg = json.dumps({'type': 'delete', 'data': json_data})
-                self.redis.publish(self.CHANNEL, msg)
-            self.redis.delete(*owner_keys)
+                self.emit(pipe, json.dumps({'type': 'delete', 'data': json_data}))
+        pipe.set(key, payload, ex=self.key_ttl)
+        if self.storage == 'index':
+            if self.expire_by != 'sweeper':
+                pipe.zremrangebyscore(self.index_key, '-inf', now)
+            pipe.zadd(self.index_key, {key: now + self.expire_sec})
+            pipe.sadd(owner_key, key)
+            pipe.expire(owner_key, self.key_ttl)
+        if publish:
+            self.emit(pipe, msg)
+        pipe.execute()
+        return owner_keys
 
-        key = self.generate_key(data)
-        self.redis.set(key, json.dumps(data))
-        self.redis.expire(key, self.expire_sec)
-        msg = json.dumps({'type': 'partial', 'data': [data]})
-        self.redis.publish(self.CHANNEL, msg)
-        return msg
+    @property
+    def key_ttl(self):
+        """TTL of room keys in Redis"""
+        if self.expire_by == 'sweeper':
+            return self.expire_sec * self.SWEEPER_TTL_FACTOR
+        return self.expire_sec
+
+    def sweep(self, limit=100):
+        """Delete at most `limit` rooms which have expired, and publish them
+        as one delete event.
+        Returns the number of deleted rooms and the lag in seconds between
+        the expiration time of the oldest one and now."""
+        now = time.time()
+        count, oldest = self._sweep_script(
+            keys=[self.index_key],
+            args=[now, limit, self.event_target, *self._stream_trim],
+        )
+        lag = now - float(oldest) if count else 0
+        return count, lag
+
+    @classmethod
+    def _is_scripting_error(cls, ex):
+        """Whether the error means EVAL/EVALSHA are disabled on the server.
+        Errors of commands called by a script are not, e.g. a command
+        denied by ACL, because the script may have run partly."""
+        return cls.SCRIPTING_ERROR.search(str(ex).lower()) is not None
 
     def generate_key(self, data=None, fields=None):
         default = {'owner', 'room'}
@@ -219,28 +905,43 @@ class BoardManager:
         return result
 
     def validate(self, data):
-        cleaned = {}
-        for validator in self.validators:
-            cleaned.update(validator.validate(data, cleaned))
-        return cleaned
+        return self.plugin_for(data).validate(data)
+
+    def plugin_for(self, data=None, guild=None):
+        """Plugin of the guild, given as `guild` or `data['guild']['id']`"""
+        if guild is None and isinstance(data, dict) and isinstance(data.get('guild'), dict):
+            guild = data['guild'].get('id')
+        return self.plugins.for_guild(guild)
 
     @property
     def parser(self):
-        return getattr(self, '_parser', None) or DefaultParser()
-
-    def parse(self, content, *args, **kwargs):
-        return self.parser.parse_content(content, *args, **kwargs)
+        if not self.plugins.plugins:
+            return DefaultPlugin()
+        return self.plugins.for_guild().parser
+
+    def parse(self, content, *args, guild=None, **kwargs):
+        return self.plugin_for(guild=guild).parse(content, *args, **kwargs)
+
+    def parse_stats(self):
+        stats = {}
+        for plugin in self.plugins.plugins.values():
+            if plugin.cache is None:
+                continue
+            for k, v in plugin.cache.stats.items():
+                stats[k] = stats.get(k, 0) + v
+        return stats or None
 
     def report_for(self, action, obj=None):
-        return self.parser.report_for(action, obj)
+        return self.plugin_for(obj).parser.report_for(action, obj)
 
     @property
     def description(self):
-        return (getattr(self, '_description', None) or "")
+        return self.description_for()
 
-    @description.setter
-    def description(self, value):
-        self._description = str(value) if value else None
+    def description_for(self, guild=None):
+        if not self.plugins.plugins:
+            return ""
+        return self.plugin_for(guild=guild).description
 
     @staticmethod
     def _decode_message(message):
@@ -0,0 +1,87 @@
+import threading
+import time
+
+import redis
+
+class PoolStatsMixin:
+    """Count checkouts of a connection pool to size `max_connections`.
+
+    `wait_sec_*` is the time spent in `get_connection()`, which includes
+    waiting for a free connection (blocking pool) and connecting.
+    Counters are updated under a lock, as the bot checks out connections
+    from several threads."""
+
+    def reset(self):
+        super().reset()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'checkouts': 0,
+            'in_use': 0,
+            'max_in_use': 0,
+            'created': 0,
+            'errors': 0,
+            'wait_sec_total': 0.0,
+            'wait_sec_max': 0.0,
+        }
+
+    def make_connection(self):
+        connection = super().make_connection()
+        with self._stats_lock:
+            self.stats['created'] += 1
+        return connection
+
+    def get_connection(self, command_name, *keys, **options):
+        started = time.monotonic()
+        try:
+            connection = super().get_connection(command_name, *keys, **options)
+        except redis.exceptions.ConnectionError:
+            with self._stats_lock:
+                self.stats['errors'] += 1
+            raise
+        wait_sec = time.monotonic() - started
+        with self._stats_lock:
+            stats = self.stats
+            stats['checkouts'] += 1
+            stats['in_use'] += 1
+            stats['max_in_use'] = max(stats['max_in_use'], stats['in_use'])
+            stats['wait_sec_total'] += wait_sec
+            stats['wait_sec_max'] = max(stats['wait_sec_max'], wait_sec)
+        return connection
+
+    def release(self, connection):
+        with self._stats_lock:
+            if self.stats['in_use'] > 0:
+                self.stats['in_use'] -= 1
+        super().release(connection)
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['max_connections'] = self.max_connections
+        stats['wait_sec_avg'] = (
+            stats['wait_sec_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        )
+        return stats
+
+class ConnectionPool(PoolStatsMixin, redis.ConnectionPool):
+    pass
+
+class BlockingConnectionPool(PoolStatsMixin, redis.BlockingConnectionPool):
+    """Waits for a free connection instead of raising an error.
+    Under the gevent worker, only the waiting greenlet is blocked."""
+
+def create_pool(url, blocking=False, max_connections=None, timeout=20,
+                socket_timeout=None, health_check_interval=0):
+    """Connection pool from a redis URL.
+    `timeout` is the max seconds to wait for a free connection (blocking only)."""
+    kwargs = {
+        'socket_timeout': socket_timeout,
+        'health_check_interval': health_check_interval or 0,
+    }
+    if blocking:
+        kwargs['max_connections'] = max_connections or 50
+        kwargs['timeout'] = timeout
+        return BlockingConnectionPool.from_url(url, **kwargs)
+    if max_connections:
+        kwargs['max_connections'] = max_connections
+    return ConnectionPool.from_url(url, **kwargs)
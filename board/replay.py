@@ -0,0 +1,111 @@
+import secrets
+import urllib.parse
+from collections import deque
+
+from .batch import EventBatch
+
+def parse_stream_id(entry_id):
+    """`(milliseconds, sequence)` of a stream entry ID, to compare IDs"""
+    milliseconds, _, sequence = entry_id.partition('-')
+    return int(milliseconds), int(sequence or 0)
+
+class ReplayLog:
+    """Recent events for reconnecting clients.
+
+    Each dispatched event gets a sequence number, which clients send back
+    as `?since=<epoch>:<seq>` when they reconnect.  Events after it are
+    merged and sent instead of the snapshot.
+
+    By default `epoch` changes with every process, so cursors of other
+    workers are not mixed up.  If `epoch` is given, the cursor is shared by
+    all workers: seqs are IDs of the event stream (events='stream'), which
+    every worker reads, so a client can resume on any worker.
+
+    Only the last `size` events are kept.  Older cursors and cursors of
+    other epochs must be answered by the snapshot."""
+
+    def __init__(self, size=1000, epoch=None):
+        self.shared = epoch is not None
+        self.epoch = epoch or secrets.token_hex(4)
+        self.seq = '0-0' if self.shared else 0
+        # The oldest cursor which can be resumed.  None until the next event
+        self.floor = self.seq
+        self.size = size
+        # (seq, deleted pairs, partial pairs)
+        self.entries = deque(maxlen=size or None)
+
+    def append(self, deleted, partial, seq=None):
+        """Record `(item, room)` pairs of an event and return its seq.
+        `seq` is the stream ID of the event if the cursor is shared."""
+        self.seq = seq if self.shared else self.seq + 1
+        if self.floor is None:
+            self.floor = self.seq
+        if self.size:
+            if len(self.entries) == self.size:
+                # Clients of the dropped event have all kept events
+                self.floor = self.entries[0][0]
+            self.entries.append((self.seq, deleted, partial))
+        return self.seq
+
+    def reset(self, seq=None):
+        """Forget all events, e.g. when events might have been lost, so
+        that no cursor until now can be resumed.  A shared cursor starts
+        again at `seq` if given, otherwise at the next event."""
+        self.entries.clear()
+        if not self.shared:
+            # The seq is skipped
+            self.seq += 1
+            self.floor = self.seq
+        elif seq is not None:
+            self.seq = self.floor = seq
+        else:
+            self.floor = None
+
+    @property
+    def cursor(self):
+        return '{}:{}'.format(self.epoch, self.seq)
+
+    @staticmethod
+    def parse_cursor(environ):
+        """`(epoch, seq)` of `?since=` in the WebSocket request, or None"""
+        query = urllib.parse.parse_qs((environ or {}).get('QUERY_STRING', ''))
+        epoch, _, seq = (query.get('since') or [''])[0].rpartition(':')
+        if not epoch or not seq:
+            return None
+        return epoch, seq
+
+    def _key(self, seq):
+        """Comparable value of a seq.  ValueError if it is malformed"""
+        if self.shared:
+            return parse_stream_id(str(seq))
+        if not str(seq).isdigit():
+            raise ValueError('Invalid seq: {!r}'.format(seq))
+        return int(seq)
+
+    def since(self, cursor, subscription=None):
+        """Merged `(deleted, partial)` pairs after the cursor, matching
+        `subscription` if given.  None if they are not available."""
+        if cursor is None or not self.size:
+            return None
+        epoch, seq = cursor
+        if epoch != self.epoch or self.floor is None:
+            return None
+        try:
+            seq = self._key(seq)
+        except ValueError:
+            return None
+        if not self._key(self.floor) <= seq <= self._key(self.seq):
+            # Trimmed, or not read by this worker yet
+            return None
+        batch = EventBatch()
+        for entry_seq, deleted, partial in self.entries:
+            # With a shared cursor, an event merged by this worker may
+            # include events which the client has.  They are sent again
+            if self._key(entry_seq) <= seq:
+                continue
+            for data_type, pairs in (('delete', deleted), ('partial', partial)):
+                for item, room in pairs:
+                    if subscription is None or subscription.match(room):
+                        # The client may know any room, so deletes are always kept
+                        batch.add(data_type, item, room=room)
+        return batch.events()
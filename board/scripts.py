@@ -0,0 +1,171 @@
+"""Lua scripts executed on the Redis server by BoardManager.
+Each script runs atomically, so that concurrent posts by the same owner
+cannot interleave.
+
+Events are published to a channel, or appended to a stream (XADD) if the
+trimming strategy of the stream is given.  XADD generates IDs from the clock, so those
+scripts are replicated by their effects."""
+
+# Evict old rooms of the owner, write a new room and publish the events.
+#
+# KEYS[1]: room key to write (save) or delete (destroy)
+# KEYS[2]: sorted set of all rooms (index storage only)
+# KEYS[3]: set of rooms of the owner (index storage only)
+# ARGV[1]: 'save' or 'destroy'
+# ARGV[2]: room as JSON (save) / delete event as JSON (destroy)
+# ARGV[3]: expire_sec
+# ARGV[4]: current unix time
+# ARGV[5]: storage, 'keys' or 'index'
+# ARGV[6]: pattern for KEYS lookup of the owner rooms (keys storage only)
+# ARGV[7]: channel to publish events, or stream to append them
+# ARGV[8]: '1' to publish delete events, '0' to leave it to keyspace events
+# ARGV[9]: partial event as JSON (save), '' not to publish
+# ARGV[10]: TTL of the room key, may be longer than expire_sec
+# ARGV[11]: '1' to drop due rooms from the index, '0' to leave them to SWEEP
+# ARGV[12]: 'MINID' or 'MAXLEN' to trim the event stream, '' to publish
+#           events to the channel
+# ARGV[13]: threshold of ARGV[12]
+#
+# Returns the list of deleted room keys.
+REPLACE = """
+local room_key, index_key, owner_key = KEYS[1], KEYS[2], KEYS[3]
+local mode, payload = ARGV[1], ARGV[2]
+local expire_sec, now = tonumber(ARGV[3]), tonumber(ARGV[4])
+local storage, pattern, channel = ARGV[5], ARGV[6], ARGV[7]
+local publish_deletes = ARGV[8] == '1'
+local ttl, prune = tonumber(ARGV[10]), ARGV[11] == '1'
+local trim, threshold = ARGV[12], ARGV[13]
+
+if trim ~= '' then
+    -- Always the case since Redis 7
+    if redis.replicate_commands then redis.replicate_commands() end
+end
+local function emit(message)
+    if trim == '' then
+        redis.call('PUBLISH', channel, message)
+    else
+        redis.call('XADD', channel, trim, '~', threshold, '*', 'data', message)
+    end
+end
+
+if mode == 'destroy' then
+    local deleted = {}
+    if redis.call('DEL', room_key) > 0 then
+        deleted[1] = room_key
+    end
+    if storage == 'index' then
+        redis.call('ZREM', index_key, room_key)
+        redis.call('SREM', owner_key, room_key)
+    end
+    if #deleted > 0 and publish_deletes then
+        emit(payload)
+    end
+    return deleted
+end
+
+local evicted
+if storage == 'index' then
+    evicted = redis.call('SMEMBERS', owner_key)
+else
+    evicted = redis.call('KEYS', pattern)
+end
+
+if #evicted > 0 then
+    redis.call('DEL', unpack(evicted))
+    if storage == 'index' then
+        redis.call('ZREM', index_key, unpack(evicted))
+        redis.call('DEL', owner_key)
+    end
+    if publish_deletes then
+        local rooms = {}
+        for i, key in ipairs(evicted) do
+            -- Same as BoardManager.split_key()['room']
+            rooms[i] = {id = string.match(key, '[^:]*$')}
+        end
+        emit(cjson.encode({type = 'delete', data = rooms}))
+    end
+end
+
+redis.call('SET', room_key, payload, 'EX', ttl)
+if storage == 'index' then
+    if prune then
+        redis.call('ZREMRANGEBYSCORE', index_key, '-inf', now)
+    end
+    redis.call('ZADD', index_key, now + expire_sec, room_key)
+    redis.call('SADD', owner_key, room_key)
+    redis.call('EXPIRE', owner_key, ttl)
+end
+if ARGV[9] ~= '' then
+    emit(ARGV[9])
+end
+
+return evicted
+"""
+
+# Delete rooms whose expiration time has passed, in a bounded batch.
+#
+# KEYS[1]: sorted set of all rooms
+# ARGV[1]: current unix time
+# ARGV[2]: max number of rooms to delete
+# ARGV[3]: channel to publish one delete event, or stream to append it
+# ARGV[4]: 'MINID' or 'MAXLEN' to trim the event stream, '' to publish
+#          events to the channel
+# ARGV[5]: threshold of ARGV[4]
+#
+# Returns the number of deleted rooms and the expiration time of the oldest one.
+SWEEP = """
+local index_key, now, limit = KEYS[1], ARGV[1], tonumber(ARGV[2])
+if ARGV[4] ~= '' then
+    -- Always the case since Redis 7
+    if redis.replicate_commands then redis.replicate_commands() end
+end
+local due = redis.call('ZRANGEBYSCORE', index_key, '-inf', now, 'WITHSCORES', 'LIMIT', 0, limit)
+if #due == 0 then
+    return {0, '0'}
+end
+
+local keys, rooms = {}, {}
+for i = 1, #due, 2 do
+    local key = due[i]
+    keys[#keys + 1] = key
+    -- Same as BoardManager.split_key() and owner_index_key()
+    local owner, room = string.match(key, '^[^:]*:([^:]*):([^:]*)$')
+    rooms[#rooms + 1] = {id = room}
+    redis.call('SREM', index_key .. ':' .. owner, key)
+end
+redis.call('ZREM', index_key, unpack(keys))
+redis.call('DEL', unpack(keys))
+
+local message = cjson.encode({type = 'delete', data = rooms})
+if ARGV[4] == '' then
+    redis.call('PUBLISH', ARGV[3], message)
+else
+    redis.call('XADD', ARGV[3], ARGV[4], '~', ARGV[5], '*', 'data', message)
+end
+
+return {#keys, due[2]}
+"""
+
+# Values of all rooms in the index in one round trip (index storage only).
+# Rooms of keys storage are scanned by BoardManager instead, because KEYS
+# in a script would block Redis over the whole keyspace.
+#
+# KEYS[1]: sorted set of all rooms
+# ARGV[1]: current unix time
+#
+# Returns the list of rooms as JSON.  Rooms expired in between are skipped.
+GET_ALL = """
+local keys = redis.call('ZRANGEBYSCORE', KEYS[1], ARGV[1], '+inf')
+
+local rooms = {}
+-- unpack() has a limit of arguments
+for i = 1, #keys, 1000 do
+    local values = redis.call('MGET', unpack(keys, i, math.min(i + 999, #keys)))
+    for j = 1, #values do
+        if values[j] then
+            rooms[#rooms + 1] = values[j]
+        end
+    end
+end
+return rooms
+"""
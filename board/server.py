@@ -1,27 +1,214 @@
+import functools
 import json
 import logging
+import os
+import socket
+import time
 
 import gevent
+import gevent.queue
+import redis
 from geventwebsocket.exceptions import WebSocketError
+from geventwebsocket.websocket import WebSocket
+
+from .batch import EventBatch
+from .encoding import dumps
+from . import encoding
+from .replay import ReplayLog, parse_stream_id
+from .snapshot import Snapshot
+from .subscription import Subscription
+from . import websocket
+from .websocket import Deflate, Frame
+
+# Queued by `Client.close()` to let the writer close the connection
+CLOSE = object()
+
+class Client:
+    """A registered WebSocket connection.
+
+    Messages are put into a bounded queue and written by one writer
+    greenlet, so that a slow client cannot block others or pile up
+    greenlets.  `overflow` decides what to do when the queue is full:
+    'drop_oldest' discards the oldest message, 'coalesce' replaces all
+    queued messages with the current snapshot, and 'disconnect' closes
+    the connection."""
+    OVERFLOW_POLICIES = ('drop_oldest', 'coalesce', 'disconnect')
+    # Max wait for the writer to write the close frame
+    CLOSE_TIMEOUT_SEC = 5
+
+    def __init__(self, server, ws, maxsize=64, overflow='coalesce'):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError('Unknown overflow policy: {!r}'.format(overflow))
+        self.server = server
+        self.ws = ws
+        self.subscription = Subscription.from_environ(ws.environ)
+        # Last event received before reconnecting, if any
+        self.since = ReplayLog.parse_cursor(ws.environ)
+        # 'json' or 'compact'.  See board.encoding
+        self.encoding = encoding.from_environ(ws.environ)
+        self.overflow = overflow
+        self.queue = gevent.queue.Queue(maxsize)
+        # Code of the close frame queued by `close()`
+        self.closing = None
+        self.writer = gevent.spawn(self._write_loop)
+        if isinstance(ws, websocket.DeflateWebSocket):
+            # Only the writer greenlet writes to the socket
+            ws.on_close = self.close
+            ws.on_ping = self._pong
+
+    @property
+    def closed(self):
+        return self.ws.closed
+
+    def send(self, data):
+        """Queue data without blocking"""
+        if self.closing is not None:
+            return
+        try:
+            self.queue.put_nowait(data)
+        except gevent.queue.Full:
+            self._handle_overflow(data)
+
+    def close(self, code=1000, wait=False):
+        """Close the connection with `code`.  Queued messages are dropped.
+
+        The close frame is written by the writer greenlet after the message
+        in progress, because gevent does not allow two greenlets to write
+        to one socket.  If `wait` is set, wait for the writer for up to
+        CLOSE_TIMEOUT_SEC, then abort the connection if it is stuck on a
+        client which does not read."""
+        if self.writer.dead or self.writer is gevent.getcurrent():
+            websocket.close(self.ws, self.closing or code)
+            return
+        if self.closing is None:
+            self.closing = code
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(CLOSE)
+        if wait:
+            self.writer.join(self.CLOSE_TIMEOUT_SEC)
+            if not self.writer.dead:
+                self.writer.kill()
+                websocket.abort(self.ws)
+
+    def _pong(self, payload):
+        self.send(Frame(payload, WebSocket.OPCODE_PONG))
+
+    def _handle_overflow(self, data):
+        self.server.log_socket(logging.DEBUG, 'Queue is full (%s)' % self.overflow, self.ws)
+        if self.overflow == 'disconnect':
+            self.server.unregister(self)
+            self.close(1008)
+            return
+        if self.overflow == 'coalesce':
+            # Snapshot already contains all queued messages and `data`
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            data = self.server.snapshot_frame(self.subscription, self.encoding)
+        else:
+            self.queue.get_nowait()
+        self.queue.put_nowait(data)
+
+    def _write_loop(self):
+        for data in self.queue:
+            if data is CLOSE:
+                websocket.close(self.ws, self.closing)
+                return
+            try:
+                if isinstance(data, Frame):
+                    data.send_to(self.ws, self.server.deflate)
+                else:
+                    self.ws.send(data)
+            except WebSocketError:
+                self.server.log_socket(logging.DEBUG, "WebSocketError", self.ws)
+                self.server.unregister(self)
+                self.close()
+                return
+            except:
+                # TODO: Gather error examples and add better handling
+                self.server.logger.error('Could not send data to %s', self.ws, exc_info=True)
 
 class PubSubServer:
     """Interface for registering and updating WebSocket clients."""
+    PONG = Frame(json.dumps({'type': 'pong'}))
+    # Seconds to wait before reconnecting to Redis, doubled on each failure
+    RECONNECT_MIN_SEC = 0.5
+    RECONNECT_MAX_SEC = 30
+    # Max wait of each XREAD.  Must be shorter than BOARD_REDIS_SOCKET_TIMEOUT
+    STREAM_BLOCK_MS = 5000
 
     def __init__(self, app, manager, logger=None):
         self.logger = logger or logging.getLogger(__name__)
         self.backend_secret = app.config.get('BOARD_BACKEND_SECRET')
+        self.heartbeat_sec = app.config.get('BOARD_HEARTBEAT_SEC') or None
+        # 0 for unlimited.  See `is_full()`
+        self.max_clients = app.config.get('BOARD_MAX_CLIENTS') or 0
+        # permessage-deflate of clients which negotiated it.  See board.worker
+        deflate_level = app.config.get('BOARD_DEFLATE_LEVEL', 6)
+        self.deflate = Deflate(
+            deflate_level, app.config.get('BOARD_DEFLATE_MIN_SIZE', 128)
+        ) if deflate_level else None
+        self.client_options = {
+            'maxsize': app.config.get('BOARD_SEND_QUEUE_SIZE') or 64,
+            'overflow': app.config.get('BOARD_SEND_OVERFLOW') or 'coalesce',
+        }
         self.manager = manager
-        self.clients = list()
-        if self.manager.notifications_available:
-            self.manager.redis.config_set('notify-keyspace-events', 'Egx')
+        # WebSocket -> Client
+        self.clients = dict()
+        # guild ID (None for all guilds) -> Subscription -> set of Client
+        self.guilds = dict()
+        self.snapshot = Snapshot(
+            manager, ttl=app.config.get('BOARD_SNAPSHOT_TTL'), logger=self.logger
+        )
+        self._snapshot_version = None
+        self._snapshot_frames = {}
+        # 0 to always send the snapshot to reconnecting clients.  With
+        # events='stream', cursors are stream IDs and valid in all workers
+        self.replay = ReplayLog(
+            app.config.get('BOARD_REPLAY_SIZE', 1000),
+            epoch=manager.events_key if manager.events == 'stream' else None,
+        )
+        self.replay_stats = {
+            'resumed': 0,
+            'expired': 0,
+        }
+
+        self.batch_window = (app.config.get('BOARD_BATCH_WINDOW_MS') or 0) / 1000
+        self.batch_size = app.config.get('BOARD_BATCH_SIZE') or 100
+        self.batch = EventBatch()
+        self._flusher = None
 
-        self.pubsub = self.manager.redis.pubsub()
-        self.pubsub.psubscribe(**{
-            '__keyevent@0__:*': self.keyevent_handler,
-            self.manager.CHANNEL: self.newroom_handler,
-        })
-        self.pubsub_thread = None
-        self.status = 'initial'
+        self.sweeper_tick = (app.config.get('BOARD_SWEEPER_TICK_MS') or 1000) / 1000
+        self.sweeper_batch = app.config.get('BOARD_SWEEPER_BATCH') or 500
+        self.sweeper = None
+
+        self.pubsub = None
+        self.listener = None
+        # Event stream (events='stream' only)
+        self.reader = None
+        self.stream_stats = {
+            'last_id': None,
+            'events': 0,
+            # Malformed entries
+            'skipped': 0,
+            'resyncs': 0,
+        }
+        self.health = {
+            'status': 'initial',
+            'since': time.time(),
+            'last_message_at': None,
+            'messages': 0,
+            'reconnects': 0,
+            'last_error': None,
+        }
+        self.sweeper_stats = {
+            'swept': 0,
+            'lag': 0,
+            'max_lag': 0,
+            'last_sweep_at': None,
+            # Ticks swept by other workers
+            'skipped': 0,
+        }
 
     def log_socket(self, level, prefix, ws):
         """Leave log message about a WebSocket client"""
@@ -43,35 +230,192 @@ class PubSubServer:
             info = "Unknown"
         self.logger.log(level, '%s %s', prefix, info)
 
-    def register(self, client):
-        """Register a WebSocket connection for Redis updates."""
-        self.log_socket(logging.INFO, 'New client', client)
-        self.clients.append(client)
+    def register(self, ws):
+        """Register a WebSocket connection for Redis updates.
+        Returns `Client` which owns the connection."""
+        self.log_socket(logging.INFO, 'New client', ws)
+        client = Client(self, ws, **self.client_options)
+        self.clients[ws] = client
+        subscription = client.subscription
+        self.guilds.setdefault(subscription.guild, {}) \
+            .setdefault(subscription, set()).add(client)
+        return client
+
+    def is_full(self):
+        """Whether this worker should refuse new clients.
+        Refused clients reconnect and are accepted by other workers."""
+        return bool(self.max_clients) and len(self.clients) >= self.max_clients
 
-    def send(self, client, data):
-        """Send given data to the registered client.
-        Automatically discards invalid connections."""
+    def unregister(self, client):
+        """Stop sending updates to the client."""
+        if not self.clients.pop(client.ws, None):
+            return
+        subscription = client.subscription
+        subscriptions = self.guilds[subscription.guild]
+        subscriptions[subscription].discard(client)
+        if not subscriptions[subscription]:
+            del subscriptions[subscription]
+            if not subscriptions:
+                del self.guilds[subscription.guild]
+        self.log_socket(logging.DEBUG, 'Client left', client.ws)
+
+    def listen(self, client):
+        """Block the current greenlet until the client disconnects.
+        Clients must send something (e.g. 'ping') in every `heartbeat_sec`,
+        otherwise they are regarded as dead."""
+        code = 1000
         try:
-            client.send(data)
-        except WebSocketError:
-            self.log_socket(logging.DEBUG, "WebSocketError", client)
-            try:
-                client.close()
-                self.clients.remove(client)
-            except:
-                # Already removed
-                pass
-        except:
-            # TODO: Gather error examples and add better handling
-            self.logger.error('Could not send data to %s', client, exc_info=True)
+            while not client.closed:
+                try:
+                    with gevent.Timeout(self.heartbeat_sec):
+                        message = client.ws.receive()
+                except gevent.Timeout:
+                    self.log_socket(logging.DEBUG, 'Heartbeat timeout', client.ws)
+                    code = 1001
+                    break
+                except WebSocketError:
+                    break
+                if message is None:
+                    break
+                if message == 'ping':
+                    client.send(self.PONG)
+        finally:
+            self.unregister(client)
+            # The handler closes the connection after return
+            client.close(code, wait=True)
+
+    def send_snapshot(self, client):
+        """Send all rooms to the client.  Redis is not used unless the
+        snapshot is too old."""
+        client.send(self.snapshot_frame(client.subscription, client.encoding))
+
+    def snapshot_frame(self, subscription=None, encoding='json'):
+        """`Frame` of the snapshot, rebuilt only when the snapshot changed.
+        It has the replay cursor of the last dispatched event."""
+        text = self.snapshot.encoded(
+            subscription, encoding, seq=self.replay.seq, epoch=self.replay.epoch
+        )
+        version = (self.snapshot.version, self.replay.seq)
+        if self._snapshot_version != version:
+            self._snapshot_version = version
+            self._snapshot_frames = {}
+        frame = self._snapshot_frames.get((subscription, encoding))
+        if frame is None:
+            frame = self._snapshot_frames[(subscription, encoding)] = Frame(text)
+        return frame
+
+    def resume(self, client):
+        """Send events which the reconnecting client missed.
+        Returns False if the snapshot must be sent instead."""
+        if client.since is None:
+            return False
+        pairs = self.replay.since(client.since, client.subscription)
+        if pairs is None:
+            self.replay_stats['expired'] += 1
+            return False
+        deleted, partial = [[item for item, _ in items] for items in pairs]
+        # Even without changes, the client learns that it is up to date
+        message = self._message(deleted, partial, self.replay.seq, merged=True)
+        client.send(Frame(dumps(message, client.encoding)))
+        self.replay_stats['resumed'] += 1
+        return True
 
     def send_all(self, data):
-        for client in self.clients:
-            gevent.spawn(self.send, client, data)
+        """Send data to all clients.  Text is encoded only once."""
+        if not isinstance(data, Frame):
+            data = Frame(data)
+        for client in list(self.clients.values()):
+            client.send(data)
+
+    def publish(self, event):
+        """Send the event to subscribed clients.
+        Events are merged for `batch_window` seconds if it is configured."""
+        data_type = event.get('type')
+        data = event.get('data') or []
+        if data_type not in ('partial', 'delete'):
+            self.logger.debug('Unknown event type %s', data_type)
+            return
+        batch = self.batch if self.batch_window else EventBatch()
+        for item in data:
+            known = self.snapshot.get(item['id'])
+            batch.add(data_type, item, room=known, is_new=known is None)
+
+        if not self.batch_window:
+            self._send(batch)
+        elif len(batch) >= self.batch_size:
+            self.flush()
+        elif self._flusher is None:
+            self._flusher = gevent.spawn_later(self.batch_window, self.flush)
+
+    def flush(self):
+        """Send merged events now"""
+        if self._flusher is not None and self._flusher is not gevent.getcurrent():
+            self._flusher.kill(block=False)
+        self._flusher = None
+        batch, self.batch = self.batch, EventBatch()
+        if len(batch):
+            self._send(batch)
+
+    def _send(self, batch):
+        """Update the snapshot by the batch and dispatch it.
+        The snapshot is updated only when events are sent, so that clients
+        receiving it in the batch window do not miss merged events."""
+        deleted, partial = batch.events()
+        for data_type, pairs in (('delete', deleted), ('partial', partial)):
+            if pairs:
+                self.snapshot.apply({'type': data_type, 'data': [item for item, _ in pairs]})
+        self.dispatch(deleted, partial)
+
+    def dispatch(self, deleted, partial):
+        """Send `(item, room)` pairs to subscribed clients.
+        One frame is built for each subscription and encoding."""
+        # Events are dispatched after they are read, see `_read_loop()`
+        seq = self.replay.append(deleted, partial, self.stream_stats['last_id'])
+        # Shared by all subscriptions which match every room
+        full_message, full_frames = None, {}
+        guilds = {None}
+        for _, room in deleted + partial:
+            guild = room.get('guild')
+            if not guild:
+                # Unknown room, it may be subscribed by anyone
+                guilds = set(self.guilds)
+                break
+            guilds.add(str(guild.get('id')))
+
+        for guild in guilds:
+            for subscription, clients in list(self.guilds.get(guild, {}).items()):
+                matched = [
+                    [item for item, room in pairs if subscription.match(room)]
+                    for pairs in (deleted, partial)
+                ]
+                if not any(matched):
+                    continue
+                if list(map(len, matched)) != [len(deleted), len(partial)]:
+                    message, frames = self._message(*matched, seq), {}
+                else:
+                    if full_message is None:
+                        full_message = self._message(*matched, seq)
+                    message, frames = full_message, full_frames
+                for client in list(clients):
+                    frame = frames.get(client.encoding)
+                    if frame is None:
+                        frame = frames[client.encoding] = Frame(dumps(message, client.encoding))
+                    client.send(frame)
+
+    @staticmethod
+    def _message(deleted, partial, seq, merged=False):
+        if (deleted and partial) or merged:
+            return {'type': 'batch', 'delete': deleted, 'data': partial, 'seq': seq}
+        if deleted:
+            return {'type': 'delete', 'data': deleted, 'seq': seq}
+        return {'type': 'partial', 'data': partial, 'seq': seq}
 
     def newroom_handler(self, message):
-        message = self.manager._decode_message(message)
-        self.send_all(message.get('data'))
+        self.publish(json.loads(message.get('data')))
+
+    def control_handler(self, message):
+        """Reload plugins without dropping WebSocket clients"""
+        self.manager.apply_control(json.loads(message.get('data')))
 
     def keyevent_handler(self, message):
         message = self.manager._decode_message(message)
@@ -90,6 +434,9 @@ class PubSubServer:
         data_type = None
 
         key = message.get('data')
+        if not self.manager.is_room_key(key):
+            # e.g. Index keys
+            return
         command = channel.split(':')[-1]
         if command in ['expired', 'del']:
             data_type = 'delete'
@@ -100,10 +447,207 @@ class PubSubServer:
         if not data_type:
             self.logger.debug('No action for %s', channel)
             return
-        msg = json.dumps({'type': data_type, 'data': data})
+        self.publish({'type': data_type, 'data': data})
+
+    @property
+    def status(self):
+        """'initial', 'running', 'reconnecting', 'stopped', or 'failed' if
+        the reader of the stream has died"""
+        if self.reader is not None and self.reader.dead and self.health['status'] != 'stopped':
+            return 'failed'
+        return self.health['status']
+
+    def health_status(self):
+        """Health of the listener and connection counts"""
+        return dict(
+            self.health,
+            status=self.status,
+            pid=os.getpid(),
+            clients=len(self.clients),
+            max_clients=self.max_clients,
+            guilds=len(self.guilds),
+            snapshot_version=self.snapshot.version,
+            replay=dict(self.replay_stats, seq=self.replay.seq, size=len(self.replay.entries)),
+            deflate=self.deflate_stats(),
+            sweeper=self.sweeper_stats if self.sweeper is not None else None,
+            stream=dict(
+                self.stream_stats, running=not self.reader.dead
+            ) if self.reader is not None else None,
+            redis_pool=self.manager.pool_stats(),
+        )
+
+    def deflate_stats(self):
+        """Compression work of this worker and clients using it"""
+        if self.deflate is None:
+            return None
+        return dict(
+            self.deflate.get_stats(),
+            clients=sum(1 for ws in self.clients if getattr(ws, 'deflate', False)),
+        )
 
-        self.send_all(msg)
+    def _set_status(self, status, error=None):
+        if self.health['status'] != status:
+            self.health['status'] = status
+            self.health['since'] = time.time()
+        if error is not None:
+            self.health['last_error'] = repr(error)
+
+    def _subscribe(self):
+        if self.pubsub is not None:
+            self.pubsub.close()
+        self.pubsub = self.manager.redis.pubsub(ignore_subscribe_messages=True)
+        patterns = {
+            self.manager.CONTROL_CHANNEL: functools.partial(self._handle, self.control_handler),
+        }
+        if self.manager.events == 'pubsub':
+            # Otherwise events are read from the stream by `_read_loop()`
+            patterns[self.manager.CHANNEL] = functools.partial(self._handle, self.newroom_handler)
+        if self.manager.notifications_available:
+            # Otherwise delete events are published to CHANNEL by BoardManager
+            patterns[self.manager.keyevent_pattern] = \
+                functools.partial(self._handle, self.keyevent_handler)
+        self.pubsub.psubscribe(**patterns)
+
+    def _handle(self, handler, message):
+        self.health['last_message_at'] = time.time()
+        self.health['messages'] += 1
+        try:
+            handler(message)
+        except Exception:
+            self.logger.error('Could not handle %s', message, exc_info=True)
+
+    def _listen_loop(self):
+        """Dispatch pub/sub messages as soon as they arrive.
+        Reconnect with exponential backoff when Redis is gone."""
+        delay = self.RECONNECT_MIN_SEC
+        while True:
+            try:
+                self._subscribe()
+                if self.health['status'] == 'reconnecting':
+                    if self.manager.events == 'pubsub':
+                        # Events might be lost while disconnected
+                        self._resync()
+                    self.logger.info('Reconnected to Redis')
+                self._set_status('running')
+                delay = self.RECONNECT_MIN_SEC
+                for _ in self.pubsub.listen():
+                    # Messages are handled by registered handlers
+                    pass
+            except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError) as ex:
+                self._set_status('reconnecting', ex)
+                self.health['reconnects'] += 1
+                self.logger.warning('Lost connection to Redis, retry in %.1f sec: %s', delay, ex)
+                gevent.sleep(delay)
+                delay = min(delay * 2, self.RECONNECT_MAX_SEC)
+
+    def _resync(self):
+        """Reload the snapshot and send it to all clients"""
+        self.replay.reset()
+        self.snapshot.refresh()
+        for client in list(self.clients.values()):
+            self.send_snapshot(client)
+
+    def _read_loop(self):
+        """Dispatch events of the stream after the last read ID.
+        Events are not lost while disconnected, unless they have been
+        trimmed.  Reconnect with exponential backoff when Redis is gone."""
+        stats = self.stream_stats
+        delay = self.RECONNECT_MIN_SEC
+        recovering = False
+        while True:
+            last_id = stats['last_id']
+            try:
+                events = self.manager.read_events(
+                    last_id, count=self.batch_size, block=self.STREAM_BLOCK_MS
+                )
+                # Only a reader which was away or fell behind can miss events
+                if recovering or len(events) >= self.batch_size:
+                    first_id, _ = self.manager.event_ids()
+                    if first_id is not None and parse_stream_id(first_id) > parse_stream_id(last_id):
+                        # Events after the last ID might have been trimmed
+                        stats['resyncs'] += 1
+                        self.logger.warning('Events after %s are trimmed, resync clients', last_id)
+                        self._resync()
+            except redis.exceptions.RedisError as ex:
+                recovering = True
+                self.logger.warning('Could not read events, retry in %.1f sec: %s', delay, ex)
+                gevent.sleep(delay)
+                delay = min(delay * 2, self.RECONNECT_MAX_SEC)
+                continue
+            if recovering:
+                self.logger.info('Reading events from %s', last_id)
+                recovering = False
+                delay = self.RECONNECT_MIN_SEC
+            for entry_id, event in events:
+                stats['last_id'] = entry_id
+                if event is None:
+                    stats['skipped'] += 1
+                    continue
+                stats['events'] += 1
+                try:
+                    self.publish(event)
+                except Exception:
+                    self.logger.error('Could not handle %s', event, exc_info=True)
+
+    def _reader_failed(self, reader):
+        self.health['last_error'] = repr(reader.exception)
+        self.logger.error('Event reader stopped: %r', reader.exception)
+
+    def _sweep_loop(self):
+        """Delete expired rooms every `sweeper_tick` seconds.
+        Deleted rooms are published as one delete event for each batch.
+        Workers take turns by a lock, so that one worker sweeps in a tick."""
+        owner = '{}:{}'.format(socket.gethostname(), os.getpid())
+        while True:
+            try:
+                if self.manager.acquire_lock('sweeper', owner, self.sweeper_tick):
+                    self._sweep()
+                else:
+                    self.sweeper_stats['skipped'] += 1
+            except redis.exceptions.RedisError as ex:
+                self.logger.warning('Could not sweep rooms: %s', ex)
+            gevent.sleep(self.sweeper_tick)
+
+    def _sweep(self):
+        """Sweep batches until no more rooms are due"""
+        stats = self.sweeper_stats
+        while True:
+            count, lag = self.manager.sweep(self.sweeper_batch)
+            stats['last_sweep_at'] = time.time()
+            stats['swept'] += count
+            stats['lag'] = lag
+            stats['max_lag'] = max(stats['max_lag'], lag)
+            if count:
+                self.logger.debug('Swept %d rooms, lag %.3f sec', count, lag)
+            if count < self.sweeper_batch:
+                return
+            # More rooms are due.  Yield to other greenlets and continue
+            gevent.sleep(0)
 
     def start(self):
-        self.status = 'running'
-        self.pubsub_thread = self.pubsub.run_in_thread(sleep_time=1)
+        """Start the listener of this worker.  Does nothing if running."""
+        if self.listener is not None and not self.listener.dead:
+            return
+        if self.manager.events == 'stream':
+            # Events after the snapshot are read again, rather than missed
+            _, last_id = self.manager.event_ids()
+            self.stream_stats['last_id'] = last_id or '0-0'
+            self.replay.reset(self.stream_stats['last_id'])
+        self.snapshot.refresh()
+        self.listener = gevent.spawn(self._listen_loop)
+        if self.manager.events == 'stream':
+            self.reader = gevent.spawn(self._read_loop)
+            self.reader.link_exception(self._reader_failed)
+        if self.manager.expire_by == 'sweeper':
+            self.sweeper = gevent.spawn(self._sweep_loop)
+
+    def stop(self):
+        if self.sweeper is not None:
+            self.sweeper.kill()
+        if self.reader is not None:
+            self.reader.kill()
+        if self.listener is not None:
+            self.listener.kill()
+        if self.pubsub is not None:
+            self.pubsub.close()
+        self._set_status('stopped')
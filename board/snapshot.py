@@ -0,0 +1,97 @@
+import logging
+import time
+
+from .encoding import dumps
+
+class Snapshot:
+    """In-process copy of all rooms for newly connected clients.
+
+    It is updated by the same events which are sent to clients, so that
+    `encoded()` usually returns a cached payload without Redis calls.
+    The whole copy is reloaded from Redis every `ttl` seconds to recover
+    from lost events."""
+
+    def __init__(self, manager, ttl=30, logger=None):
+        self.logger = logger or logging.getLogger(__name__)
+        self.manager = manager
+        self.ttl = ttl
+        self.rooms = {}
+        self.received_at = {}
+        self.version = 0
+        self.loaded_at = None
+        # (Subscription or None, encoding, fields) -> serialized message
+        self._encoded = {}
+
+    def refresh(self):
+        """Reload all rooms from Redis"""
+        rooms = self.manager.get_all()
+        now = time.monotonic()
+        self.rooms = {room['id']: room for room in rooms}
+        self.received_at = dict.fromkeys(self.rooms, now)
+        self.loaded_at = now
+        self._changed()
+        self.logger.debug('Snapshot reloaded with %d rooms', len(self.rooms))
+
+    def apply(self, event):
+        """Update rooms by an event dict like `{'type': 'partial', 'data': [...]}`"""
+        data_type = event.get('type')
+        data = event.get('data') or []
+        now = time.monotonic()
+        if data_type == 'all':
+            self.rooms = {}
+            self.received_at = {}
+            data_type = 'partial'
+        if data_type == 'partial':
+            for room in data:
+                self.rooms[room['id']] = room
+                self.received_at[room['id']] = now
+        elif data_type == 'delete':
+            for room in data:
+                self.rooms.pop(room['id'], None)
+                self.received_at.pop(room['id'], None)
+        else:
+            return
+        self._changed()
+
+    def encoded(self, subscription=None, encoding='json', **fields):
+        """Serialized `{'type': 'all'}` message in `encoding`.
+        Only rooms matching `subscription` are included if given.
+        `fields` are added to the message, e.g. the replay cursor."""
+        now = time.monotonic()
+        if self.loaded_at is None or (self.ttl and now - self.loaded_at > self.ttl):
+            self.refresh()
+        self.prune(now)
+        if subscription is not None and not subscription.filtered:
+            subscription = None
+        key = (subscription, encoding, tuple(sorted(fields.items())))
+        encoded = self._encoded.get(key)
+        if encoded is None:
+            rooms = [
+                room for room in self.rooms.values()
+                if subscription is None or subscription.match(room)
+            ]
+            encoded = dumps(dict({'type': 'all', 'data': rooms}, **fields), encoding)
+            self._encoded[key] = encoded
+        return encoded
+
+    def get(self, room_id, default=None):
+        return self.rooms.get(room_id, default)
+
+    def prune(self, now=None):
+        """Forget rooms which must have been expired in Redis"""
+        if now is None:
+            now = time.monotonic()
+        expired = [
+            room_id for room_id, received_at in self.received_at.items()
+            if now - received_at > self.manager.expire_sec
+        ]
+        if not expired:
+            return
+        for room_id in expired:
+            self.rooms.pop(room_id, None)
+            self.received_at.pop(room_id, None)
+        self._changed()
+
+    def _changed(self):
+        self.version += 1
+        self._encoded = {}
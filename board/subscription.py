@@ -0,0 +1,33 @@
+import urllib.parse
+from collections import namedtuple
+
+class Subscription(namedtuple('Subscription', ['guild', 'type'])):
+    """Rooms which a WebSocket client wants to receive.
+    None matches any value."""
+    __slots__ = ()
+
+    @classmethod
+    def from_environ(cls, environ):
+        """Read `?guild=<id>&type=<type>` of the WebSocket request"""
+        query = urllib.parse.parse_qs((environ or {}).get('QUERY_STRING', ''))
+        values = [(query.get(field) or [None])[0] or None for field in cls._fields]
+        return cls(*values)
+
+    @property
+    def filtered(self):
+        return self.guild is not None or self.type is not None
+
+    def match(self, room):
+        """Whether the room is sent to the client.
+        Rooms without the value (e.g. deleted room `{'id': ...}`) match."""
+        if self.guild is not None:
+            guild = room.get('guild')
+            if guild and str(guild.get('id')) != self.guild:
+                return False
+        if self.type is not None:
+            room_type = room.get('type')
+            if room_type is not None and str(room_type) != self.type:
+                return False
+        return True
+
+ALL = Subscription(None, None)
@@ -0,0 +1,272 @@
+"""Helpers on top of gevent-websocket"""
+import struct
+import time
+import zlib
+from socket import error
+
+from geventwebsocket.exceptions import ProtocolError, WebSocketError
+from geventwebsocket.handler import WebSocketHandler
+from geventwebsocket.websocket import (
+    Header, Stream, WebSocket, MSG_ALREADY_CLOSED, MSG_SOCKET_DEAD,
+)
+
+# RSV1 bit of RFC 7692, named RSV0 by gevent-websocket
+COMPRESSED = Header.RSV0_MASK
+# Removed from the end of each compressed message (RFC 7692 7.2.1)
+DEFLATE_TAIL = b'\x00\x00\xff\xff'
+DEFLATE_RESPONSE = 'permessage-deflate; server_no_context_takeover; client_no_context_takeover'
+
+class Deflate:
+    """permessage-deflate settings and statistics of the server.
+
+    Messages are compressed without context takeover.  A compressed frame
+    does not depend on earlier messages of the connection, so it is
+    compressed once and written to every client as it is."""
+
+    def __init__(self, level=1, min_size=512):
+        self.level = level
+        self.min_size = min_size
+        self.stats = {
+            'messages': 0,
+            'skipped': 0,
+            'raw_bytes': 0,
+            'deflated_bytes': 0,
+            'sec': 0,
+        }
+
+    def compress(self, payload):
+        """Compressed payload, or None if it is not worth it"""
+        if len(payload) < self.min_size:
+            self.stats['skipped'] += 1
+            return None
+        started = time.perf_counter()
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        data = compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        data = data[:-len(DEFLATE_TAIL)]
+        self.stats['sec'] += time.perf_counter() - started
+        self.stats['messages'] += 1
+        self.stats['raw_bytes'] += len(payload)
+        self.stats['deflated_bytes'] += len(data)
+        return data
+
+    def get_stats(self):
+        stats = dict(self.stats, level=self.level, min_size=self.min_size)
+        if stats['raw_bytes']:
+            stats['ratio'] = stats['deflated_bytes'] / stats['raw_bytes']
+        return stats
+
+class Frame:
+    """WebSocket text frame encoded only once.
+
+    `WebSocket.send` encodes the text and builds the frame header for
+    every call.  A broadcast message is the same for all clients, so the
+    complete frame is built here and written as it is to each socket.
+    The compressed frame for permessage-deflate clients is built on the
+    first use in the same way."""
+    __slots__ = ('data', 'offset', 'deflated')
+
+    def __init__(self, text, opcode=WebSocket.OPCODE_TEXT):
+        payload = text.encode('utf-8') if isinstance(text, str) else bytes(text)
+        header = Header.encode_header(True, opcode, b'', len(payload), 0)
+        self.data = bytes(header) + payload
+        self.offset = len(header)
+        self.deflated = None
+
+    def __len__(self):
+        return len(self.data)
+
+    def compressed(self, deflate):
+        """Frame data with the compressed payload, or the same data"""
+        if self.deflated is None:
+            opcode = self.data[0] & 0x0f
+            payload = None
+            if opcode in (WebSocket.OPCODE_TEXT, WebSocket.OPCODE_BINARY):
+                payload = deflate.compress(self.data[self.offset:])
+            if payload is None:
+                self.deflated = self.data
+            else:
+                header = Header.encode_header(True, opcode, b'', len(payload), COMPRESSED)
+                self.deflated = bytes(header) + payload
+        return self.deflated
+
+    def send_to(self, ws, deflate=None):
+        """Write the frame to `ws`, compressed by `deflate` if the client
+        accepted permessage-deflate.
+        Raises WebSocketError in the same way as `WebSocket.send`."""
+        if ws.closed:
+            raise WebSocketError(MSG_ALREADY_CLOSED)
+        data = self.data
+        if deflate is not None and getattr(ws, 'deflate', False):
+            data = self.compressed(deflate)
+        try:
+            ws.raw_write(data)
+        except error:
+            raise WebSocketError(MSG_SOCKET_DEAD)
+
+def negotiate_deflate(extensions):
+    """Response to the first acceptable permessage-deflate offer in
+    `Sec-WebSocket-Extensions`, or None.
+
+    Offers are accepted only if messages can be compressed with the full
+    window, because compressed frames are shared by all clients."""
+    for offer in (extensions or '').split(','):
+        name, *params = [value.strip() for value in offer.split(';')]
+        if name != 'permessage-deflate':
+            continue
+        params = dict(
+            (key.strip(), value.strip().strip('"'))
+            for key, _, value in (param.partition('=') for param in params)
+        )
+        if not set(params) <= {
+            'server_no_context_takeover', 'client_no_context_takeover',
+            'server_max_window_bits', 'client_max_window_bits',
+        }:
+            continue
+        if params.get('server_max_window_bits', '15') != '15':
+            continue
+        return DEFLATE_RESPONSE
+    return None
+
+class DeflateWebSocket(WebSocket):
+    """WebSocket which reads compressed messages if `deflate` is set"""
+    # Max size of an inflated message from a client
+    MAX_MESSAGE_SIZE = 64 * 1024
+
+    def __init__(self, *args, deflate=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.deflate = deflate
+        # Set by the owner of the connection to write replies to close and
+        # ping frames by its writer greenlet, because gevent does not allow
+        # the reader to write at the same time.  See board.server.Client
+        self.on_close = None
+        self.on_ping = None
+
+    def handle_close(self, header, payload):
+        """Validate the close frame in the same way as `WebSocket`, then
+        let `on_close` reply with the same code"""
+        if self.on_close is None:
+            return super().handle_close(header, payload)
+        code = 1000
+        if payload:
+            if len(payload) < 2:
+                raise ProtocolError('Invalid close frame: {0} {1}'.format(header, payload))
+            code, = struct.unpack('!H', payload[:2])
+            # UnicodeDecodeError is a UnicodeError, answered with 1007
+            payload[2:].decode('utf-8')
+            if not self._is_valid_close_code(code):
+                raise ProtocolError('Invalid close code {0}'.format(code))
+        self.on_close(code)
+
+    def handle_ping(self, header, payload):
+        if self.on_ping is None:
+            return super().handle_ping(header, payload)
+        self.on_ping(payload)
+
+    def close(self, code=1000, message=b''):
+        """Let `on_close` close the connection, e.g. when `receive()` found
+        a protocol error"""
+        if self.on_close is None or self.closed:
+            return super().close(code, message)
+        self.on_close(code)
+
+    def read_frame(self):
+        """Same as `WebSocket.read_frame`, but compressed messages are
+        inflated and returned as one frame"""
+        header, payload = self._read_raw_frame()
+        if not header.flags:
+            return header, payload
+        if header.opcode not in (self.OPCODE_TEXT, self.OPCODE_BINARY):
+            raise ProtocolError('Compressed control frame')
+
+        chunks = [payload]
+        while not header.fin:
+            fragment, payload = self._read_raw_frame()
+            if fragment.opcode == self.OPCODE_CONTINUATION:
+                chunks.append(payload)
+                header.fin = fragment.fin
+            elif fragment.opcode == self.OPCODE_PING:
+                self.handle_ping(fragment, payload)
+            elif fragment.opcode == self.OPCODE_PONG:
+                self.handle_pong(fragment, payload)
+            else:
+                raise ProtocolError('Unexpected opcode={0!r}'.format(fragment.opcode))
+
+        # client_no_context_takeover: each message starts a new stream
+        inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+        try:
+            payload = inflater.decompress(b''.join(chunks) + DEFLATE_TAIL, self.MAX_MESSAGE_SIZE)
+        except zlib.error as ex:
+            raise ProtocolError('Invalid compressed message: {}'.format(ex))
+        if inflater.unconsumed_tail:
+            raise ProtocolError('Message is too large')
+        header.flags = 0
+        header.length = len(payload)
+        return header, payload
+
+    def _read_raw_frame(self):
+        header = Header.decode_header(self.stream)
+        if header.flags & ~(COMPRESSED if self.deflate else 0):
+            raise ProtocolError
+
+        if not header.length:
+            return header, b''
+        try:
+            payload = self.raw_read(header.length)
+        except error:
+            payload = b''
+        if len(payload) != header.length:
+            raise WebSocketError('Unexpected EOF reading frame payload')
+        if header.mask:
+            payload = header.unmask_payload(payload)
+        return header, payload
+
+class DeflateWebSocketHandler(WebSocketHandler):
+    """WebSocketHandler which negotiates permessage-deflate (RFC 7692).
+    Used by `board.worker.DeflateWorker`."""
+
+    def upgrade_connection(self):
+        self.deflate = False
+        result = super().upgrade_connection()
+        if self.environ.get('wsgi.websocket') is None:
+            # Refused
+            return result
+        # WebSocket.__del__ would write a close frame before the 101 response
+        _detach(self.websocket)
+        self.websocket = DeflateWebSocket(self.environ, Stream(self), self, deflate=self.deflate)
+        self.environ['wsgi.websocket'] = self.websocket
+        return result
+
+    def start_response(self, status, headers, exc_info=None):
+        if str(status).startswith('101'):
+            response = negotiate_deflate(self.environ.get('HTTP_SEC_WEBSOCKET_EXTENSIONS'))
+            if response:
+                self.deflate = True
+                headers = list(headers) + [('Sec-WebSocket-Extensions', response)]
+        return super().start_response(status, headers, exc_info)
+
+def close(ws, code=1000, reason=''):
+    """Close `ws` with a status code.
+
+    `WebSocket.close` of gevent-websocket 0.10 writes only the message as
+    the payload of the close frame, so browsers never receive the code."""
+    if ws.closed:
+        return
+    payload = struct.pack('!H', code) + reason.encode('utf-8')[:123]
+    try:
+        Frame(payload, WebSocket.OPCODE_CLOSE).send_to(ws)
+    except WebSocketError:
+        pass
+    _detach(ws)
+
+def abort(ws):
+    """Mark `ws` as closed without writing a close frame, e.g. when the
+    client does not read and writing would block"""
+    if not ws.closed:
+        _detach(ws)
+
+def _detach(ws):
+    # Same as the end of `WebSocket.close` without writing another frame
+    ws.closed = True
+    ws.stream = None
+    ws.raw_write = None
+    ws.raw_read = None
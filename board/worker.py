@@ -0,0 +1,8 @@
+"""Gunicorn worker class of the web server.  See gunicorn.conf.py"""
+from geventwebsocket.gunicorn.workers import GeventWebSocketWorker
+
+from .websocket import DeflateWebSocketHandler
+
+class DeflateWorker(GeventWebSocketWorker):
+    """`flask_sockets.worker` which negotiates permessage-deflate"""
+    wsgi_handler = DeflateWebSocketHandler
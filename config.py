@@ -20,9 +20,70 @@ class Config:
     # each room will be automatically removed after this seconds
     BOARD_EXPIRE_SEC = 120
 
+    # Rooms for new clients are cached in each worker.
+    # The cache is fully reloaded from Redis after this seconds
+    BOARD_SNAPSHOT_TTL = int(os.environ.get('BOARD_SNAPSHOT_TTL', 30))
+
+    # WebSocket clients are disconnected if nothing is received in this seconds.
+    # Browsers send 'ping' every 30 seconds.  0 to disable
+    BOARD_HEARTBEAT_SEC = int(os.environ.get('BOARD_HEARTBEAT_SEC', 90))
+
+    # WebSocket clients per worker.  New clients are refused with 1013 and
+    # reconnect to other workers.  0 for unlimited
+    BOARD_MAX_CLIENTS = int(os.environ.get('BOARD_MAX_CLIENTS', 0))
+
+    # Messages waiting to be sent to each WebSocket client
+    BOARD_SEND_QUEUE_SIZE = int(os.environ.get('BOARD_SEND_QUEUE_SIZE', 64))
+    # 'drop_oldest', 'coalesce' or 'disconnect'.  See board.server.Client
+    BOARD_SEND_OVERFLOW = os.environ.get('BOARD_SEND_OVERFLOW', 'coalesce')
+
+    # zlib level of permessage-deflate, 0 not to compress.  Messages smaller
+    # than BOARD_DEFLATE_MIN_SIZE bytes are sent as they are
+    BOARD_DEFLATE_LEVEL = int(os.environ.get('BOARD_DEFLATE_LEVEL', 6))
+    BOARD_DEFLATE_MIN_SIZE = int(os.environ.get('BOARD_DEFLATE_MIN_SIZE', 128))
+
+    # Recent events kept in each worker.  Reconnecting clients receive the
+    # events they missed instead of all rooms.  0 to always send all rooms.
+    # With BOARD_EVENTS=stream clients can resume on any worker, otherwise
+    # only on the same worker
+    BOARD_REPLAY_SIZE = int(os.environ.get('BOARD_REPLAY_SIZE', 1000))
+
+    # Events are merged into one message per client in this milliseconds,
+    # or until this number of events are received.  0 to send immediately
+    BOARD_BATCH_WINDOW_MS = int(os.environ.get('BOARD_BATCH_WINDOW_MS', 100))
+    BOARD_BATCH_SIZE = int(os.environ.get('BOARD_BATCH_SIZE', 100))
+
     BOARD_BACKEND_SECRET = os.environ.get('BACKEND_SECRET')
+    # Max rooms in one bulk request to /party (JSON array or NDJSON)
+    BOARD_BULK_MAX = int(os.environ.get('BOARD_BULK_MAX', 500))
     BOARD_SOCKET_URL = os.environ.get('BOARD_SOCKET_URL')
     BOARD_PLUGIN = os.environ.get('BOARD_PLUGIN', 'plugins.example')
+    # Comma separated plugins which can be selected per guild by /admin/plugins
+    BOARD_PLUGINS = os.environ.get('BOARD_PLUGINS')
+    # 'keys' or 'index'.  See BoardManager.STORAGES.  'keys' runs KEYS on every
+    # post.  Must be the same as the discord bot
+    BOARD_STORAGE = os.environ.get('BOARD_STORAGE', 'keys')
+    # 'auto' uses keyspace notifications of Redis if CONFIG is allowed, or 'off'.
+    # Not used with BOARD_EXPIRE_BY=sweeper or BOARD_EVENTS=stream
+    BOARD_NOTIFICATIONS = os.environ.get('BOARD_NOTIFICATIONS', 'auto')
+    # 'ttl' or 'sweeper'.  'sweeper' requires 'index' storage
+    BOARD_EXPIRE_BY = os.environ.get('BOARD_EXPIRE_BY', 'ttl')
+    # Interval and max rooms of each sweep
+    BOARD_SWEEPER_TICK_MS = int(os.environ.get('BOARD_SWEEPER_TICK_MS', 1000))
+    BOARD_SWEEPER_BATCH = int(os.environ.get('BOARD_SWEEPER_BATCH', 500))
+    # 'pubsub' or 'stream'.  See BoardManager.EVENT_LOGS
+    BOARD_EVENTS = os.environ.get('BOARD_EVENTS', 'pubsub')
+    # Events older than BOARD_EXPIRE_SEC are trimmed from the stream.  Redis
+    # before 6.2 keeps about this number of events instead
+    BOARD_STREAM_MAXLEN = int(os.environ.get('BOARD_STREAM_MAXLEN', 10000))
+    # Redis connections of each worker.  Requests wait for a free connection
+    # up to BOARD_REDIS_POOL_TIMEOUT seconds.  The pub/sub listener holds one
+    BOARD_REDIS_BLOCKING_POOL = strtobool(os.environ.get('BOARD_REDIS_BLOCKING_POOL') or "True")
+    BOARD_REDIS_MAX_CONNECTIONS = int(os.environ.get('BOARD_REDIS_MAX_CONNECTIONS', 20))
+    BOARD_REDIS_POOL_TIMEOUT = float(os.environ.get('BOARD_REDIS_POOL_TIMEOUT', 5))
+    # Empty for no timeout.  The pub/sub listener reconnects when channels are quiet longer than this
+    BOARD_REDIS_SOCKET_TIMEOUT = float(os.environ.get('BOARD_REDIS_SOCKET_TIMEOUT') or 0) or None
+    BOARD_REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get('BOARD_REDIS_HEALTH_CHECK_INTERVAL', 30))
 
     DISCORD_TOKEN = os.environ.get('DISCORD_TOKEN')
     DISCORD_MASTER = os.environ.get('DISCORD_MASTER')
@@ -7,6 +7,7 @@ import config
 from distutils.util import strtobool
 
 from board.adapters.discord import Bot
+from board.aio import AsyncBoardManager
 from board.manager import BoardManager
 
 BOT_LABEL = 'board'
@@ -17,6 +18,19 @@ app_config = {
     'board': {
         'url': os.environ.get('BOARD_URL'),
         'plugin': os.environ.get('BOARD_PLUGIN', 'plugins.example'),
+        'plugins': os.environ.get('BOARD_PLUGINS'),
+        'storage': os.environ.get('BOARD_STORAGE', 'keys'),
+        'notifications': os.environ.get('BOARD_NOTIFICATIONS', 'auto'),
+        'expire_by': os.environ.get('BOARD_EXPIRE_BY', 'ttl'),
+        'events': os.environ.get('BOARD_EVENTS', 'pubsub'),
+        'stream_maxlen': int(os.environ.get('BOARD_STREAM_MAXLEN', 10000)),
+        'redis_max_connections': int(os.environ.get('BOARD_REDIS_MAX_CONNECTIONS') or 0),
+        'redis_socket_timeout': float(os.environ.get('BOARD_REDIS_SOCKET_TIMEOUT') or 0),
+        'redis_health_check_interval': int(os.environ.get('BOARD_REDIS_HEALTH_CHECK_INTERVAL', 30)),
+        # Threads running Redis commands out of the event loop
+        'workers': int(os.environ.get('BOARD_BOT_WORKERS', 4)),
+        'parse_cache_size': int(os.environ.get('BOARD_PARSE_CACHE_SIZE', 0)),
+        'edit_debounce_ms': int(os.environ.get('BOARD_EDIT_DEBOUNCE_MS', 2000)),
     },
     'discord': {
         'token':  os.environ['DISCORD_TOKEN'],
@@ -24,12 +38,28 @@ app_config = {
     }
 }
 
-logger = setup_logging(BOT_LABEL)
+def create_bot(shard_id=None, shard_count=None):
+    """Bot for all guilds, or for one shard of `shard_count`"""
+    label = BOT_LABEL
+    kwargs = {}
+    if shard_count:
+        label = '{}-{}'.format(BOT_LABEL, shard_id)
+        kwargs.update(shard_id=shard_id, shard_count=shard_count)
+    logger = setup_logging(label)
 
-bot = Bot(__file__, debug=DEBUG, logger=logger, name=BOT_LABEL)
-bot.master = app_config['discord']['master']
+    bot = Bot(__file__, debug=DEBUG, logger=logger, name=label, **kwargs)
+    bot.master = app_config['discord']['master']
 
-bot.manager = BoardManager(REDIS_URL, app_config['board'])
-bot.board_url = app_config['board']['url']
+    bot.manager = AsyncBoardManager(
+        BoardManager(REDIS_URL, app_config['board']),
+        max_workers=app_config['board']['workers'],
+    )
+    bot.board_url = app_config['board']['url']
+    bot.edit_debounce_sec = app_config['board']['edit_debounce_ms'] / 1000
+    return bot
 
-bot.run(app_config['discord']['token'])
+def run(shard_id=None, shard_count=None):
+    create_bot(shard_id, shard_count).run(app_config['discord']['token'])
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,47 @@
+"""Gunicorn settings of the web server.  Loaded automatically by gunicorn 20.
+
+Each worker is a separate process with its own PubSubServer: one Redis
+subscription and one client list, and events are fanned out to its own
+clients.  Workers share nothing else, so they can be spread over CPUs and
+hosts behind a load balancer.  Every worker decodes and merges every
+event, so run at most one worker per CPU: extra workers on the same CPU
+deliver fewer messages, not more.  Measure with tools/load-websocket.py.
+
+    WEB_CONCURRENCY=4 gunicorn pubsub:app
+
+Workers of one gunicorn accept connections from one shared socket, and
+busy workers may accept more than others.  To let the kernel balance
+connections, run one worker per gunicorn process with SO_REUSEPORT:
+
+    for i in 1 2 3 4; do
+        WEB_CONCURRENCY=1 GUNICORN_REUSE_PORT=1 gunicorn pubsub:app &
+    done
+
+BOARD_MAX_CLIENTS caps clients per worker.  Clients over the cap are
+closed with 1013 and reconnect, landing on another worker.
+
+The worker class negotiates permessage-deflate with browsers.  Set
+BOARD_DEFLATE_LEVEL=0 to send messages uncompressed.
+"""
+import os
+from distutils.util import strtobool
+
+bind = '0.0.0.0:{}'.format(os.environ.get('PORT', 8000))
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+# flask_sockets.worker with permessage-deflate
+worker_class = 'board.worker.DeflateWorker'
+# Max concurrent greenlets (HTTP requests and WebSocket clients) per worker
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 10000))
+reuse_port = bool(strtobool(os.environ.get('GUNICORN_REUSE_PORT') or 'False'))
+# WebSocket clients stay connected while a worker shuts down
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 10))
+accesslog = '-'
+# PubSubServer starts greenlets, which must not be created in the master
+preload_app = False
+
+def post_worker_init(worker):
+    # pubsub.py starts the server on import.  Make sure it runs in every worker
+    from pubsub import board_server
+    if board_server.status == 'initial':
+        board_server.start()
+    worker.log.info('Board server is %s in worker %s', board_server.status, worker.pid)
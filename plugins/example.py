@@ -11,16 +11,31 @@ ROOM_REGEX = re.compile(
 )
 
 class Parser:
+    # Optional.  Contents rejected by PREFILTER are not passed to
+    # `parse_content`.  See board.manager.compile_prefilter.
+    # Not set here because ROOM_REGEX is anchored and fails faster.
+    # PREFILTER = {'min_length': 7, 'any_chars': '0123456789'}
+    PREFILTER = None
+    # Optional.  False if `parse_content` depends on other than content
+    PARSE_CACHE = True
+
     def validate(self, data, *args, **kwargs):
         """Validate data dict.  Basic attributes (owner, guild and time)
         are validated in base class"""
         cleaned = {}
-        cleaned['id'] = str(data.get('id') or "").replace('-', '')
-        if len(cleaned['id']) != 7 or not cleaned['id'].isdigit():
-            raise ValueError('id must be 7 length digits.')
-
+        self.compile()(data, cleaned)
         return cleaned
 
+    def compile(self):
+        """Return a function which validates `data` into `cleaned` in place.
+        Optional.  BoardManager uses it instead of `validate` if exists."""
+        def validate(data, cleaned):
+            room_id = str(data.get('id') or "").replace('-', '')
+            if len(room_id) != 7 or not room_id.isdigit():
+                raise ValueError('id must be 7 length digits.')
+            cleaned['id'] = room_id
+        return validate
+
     def report_for(self, action, obj=None, *args, **kwargs):
         """Message to user on each actions.
         If returned value is falsey, no messages will be sent"""
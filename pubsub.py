@@ -1,11 +1,15 @@
-import gevent
+import json
+import logging
+
 from flask.helpers import url_for
 from flask import Flask, render_template, request, abort, make_response, jsonify
 from flask_sockets import Sockets
 
 import config
+from board.exceptions import PluginError
 from board.manager import BoardManager
 from board.server  import PubSubServer
+from board import websocket
 
 
 config.flask_logging_config()
@@ -35,6 +39,7 @@ del proxy_fix_num
 manager = BoardManager(app.config['REDIS_URL'], board_config)
 board_server = PubSubServer(app, manager)
 SOCKET_PATH = '/room'
+NDJSON_MIMETYPE = 'application/x-ndjson'
 
 @app.route('/')
 def frontend():
@@ -44,7 +49,7 @@ def frontend():
         'invite_url': app.config.get('DISCORD_INVITE_URL'),
     }
     socket_url = board_config.get('socket_url')
-    if not socket_url and board_server.status == 'running':
+    if not socket_url and board_server.status != 'initial':
         socket_url = url_for('fakesocketend', _external=True, _scheme='')
 
     if socket_url:
@@ -59,6 +64,11 @@ def frontend():
         **opts
     )
 
+@app.route('/health')
+def health():
+    status = board_server.health_status()
+    return jsonify(status), 200 if status['status'] == 'running' else 503
+
 @app.route(SOCKET_PATH)
 def fakesocketend():
     abort(406)
@@ -66,7 +76,11 @@ def fakesocketend():
 def backend():
     if board_server.backend_secret != request.headers.get('X-Authorization-Token'):
         abort(401)
+    if request.mimetype == NDJSON_MIMETYPE:
+        return bulk_backend(_read_ndjson())
     data = request.get_json()
+    if isinstance(data, list):
+        return bulk_backend(enumerate(data))
     if not data:
         abort(400, 'Not a valid JSON')
     try:
@@ -78,11 +92,79 @@ def backend():
             abort(400, ex.args[0])
         else:
             abort(400)
+
+def bulk_backend(items):
+    """Validate each room independently and save valid ones at once.
+    `items` yields `(index, data)`, where data may be an exception raised
+    while reading the item."""
+    results = []
+    accepted = {}
+    for index, data in items:
+        if index >= board_config['bulk_max']:
+            abort(413, 'Too many rooms.  Max: {}'.format(board_config['bulk_max']))
+        try:
+            if isinstance(data, Exception):
+                raise data
+            data = manager.validate(data)
+            manager.check_required(data)
+        except (ValueError, PluginError) as ex:
+            results.append({'index': index, 'status': 'error', 'error': str(ex)})
+            continue
+        result = {'index': index, 'status': 'ok', 'id': data['id']}
+        results.append(result)
+        # Rooms of the same owner replace each other.  The last one wins
+        owner_id = str(data['owner']['id'])
+        if owner_id in accepted:
+            accepted[owner_id][0]['status'] = 'replaced'
+            del accepted[owner_id]
+        accepted[owner_id] = (result, data)
+
+    manager.save_many([data for _, data in accepted.values()])
+    return jsonify({'accepted': len(accepted), 'results': results})
+
+def _read_ndjson():
+    """Yield `(index, data)` per non-empty line of the request body"""
+    index = 0
+    for line in request.stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield index, json.loads(line)
+        except ValueError:
+            yield index, ValueError('Not a valid JSON')
+        index += 1
+
+def admin_plugins():
+    """Reload plugins or select a plugin for a guild in all processes.
+    {'action': 'reload', 'plugin': (optional) name}
+    {'action': 'select', 'guild': guild id, 'plugin': name or null for default}"""
+    if board_server.backend_secret != request.headers.get('X-Authorization-Token'):
+        abort(401)
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        try:
+            if data.get('action') == 'reload':
+                manager.publish_control('reload', plugin=data.get('plugin'))
+            elif data.get('action') == 'select' and data.get('guild'):
+                manager.select_plugin(data['guild'], data.get('plugin'))
+            else:
+                abort(400, 'Unknown action')
+        except ValueError as ex:
+            abort(400, ex.args[0])
+    return jsonify({
+        'default': manager.plugins.default,
+        'plugins': manager.plugins.names,
+        'guilds': manager.plugins.guilds,
+    })
+
 if board_server.backend_secret:
     app.logger.info('Open backdoor with %s...', board_server.backend_secret[:8])
     app.add_url_rule('/party', 'backend', backend, methods=['POST'])
+    app.add_url_rule('/admin/plugins', 'admin_plugins', admin_plugins, methods=['GET', 'POST'])
 
 @app.errorhandler(400)
+@app.errorhandler(413)
 def catcher(error):
     if request.is_json:
         response = make_response(jsonify({'error': error.description}), error.code)
@@ -92,12 +174,15 @@ def catcher(error):
 
 def socketend(ws, *args, **kwargs):
     """Handle WebSockets requests"""
-    board_server.register(ws)
-    board_server.send(ws, manager.get_all_as_json())
-
-    while not ws.closed:
-        # Context switch while `Backend.start` is running in the background.
-        gevent.sleep(0.1)
+    if board_server.is_full():
+        board_server.log_socket(logging.INFO, 'Worker is full, refused', ws)
+        # 1013: Try Again Later.  Clients reconnect to another worker
+        websocket.close(ws, 1013, 'Try again later')
+        return
+    client = board_server.register(ws)
+    if not board_server.resume(client):
+        board_server.send_snapshot(client)
+    board_server.listen(client)
 
 if config.is_gunicorn():
     board_server.start()
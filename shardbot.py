@@ -0,0 +1,92 @@
+"""Run discord bot shards in worker processes
+
+    BOARD_SHARD_COUNT=4 python shardbot.py
+
+Each process runs one shard with its own BoardManager.  Processes are
+started one by one because Discord accepts one IDENTIFY per 5 seconds.
+Dead shards are restarted, and stats stored by shards are aggregated."""
+import os
+import json
+import time
+import multiprocessing
+
+import redis
+
+import discordbot
+from board.manager import BoardManager
+
+SHARD_COUNT = int(os.environ.get('BOARD_SHARD_COUNT', 1))
+# Shards run on this host, like '0,1'.  Empty for all shards
+SHARD_IDS = [
+    int(i) for i in (os.environ.get('BOARD_SHARD_IDS') or '').split(',') if i.strip()
+] or list(range(SHARD_COUNT))
+START_INTERVAL_SEC = 5.5
+STATS_INTERVAL_SEC = 60
+# Same as BoardManager.stats_key of shards
+STATS_KEY = (
+    discordbot.app_config['board'].get('prefix') or BoardManager.DEFAULT_CONFIG['prefix']
+) + BoardManager.STATS_SUFFIX
+
+def start(context, shard_id):
+    process = context.Process(
+        target=discordbot.run, args=(shard_id, SHARD_COUNT),
+        name='shard-{}'.format(shard_id), daemon=True,
+    )
+    process.start()
+    return process
+
+def get_stats(client):
+    """Stats stored by shards with `BoardManager.save_stats()`"""
+    return {
+        k.decode('utf-8'): json.loads(v)
+        for k, v in client.hgetall(STATS_KEY).items()
+    }
+
+def aggregate(stats, now=None):
+    """Sum stats of shards.  Shards silent for 3 intervals are counted as stale"""
+    now = now or time.time()
+    total = {'shards': 0, 'stale': [], 'guilds': 0, 'max_latency': None,
+             'events': {}, 'rest': {}, 'parse': {}}
+    for name, shard in sorted(stats.items()):
+        if now - shard.get('updated_at', 0) > STATS_INTERVAL_SEC * 3:
+            total['stale'].append(name)
+            continue
+        total['shards'] += 1
+        total['guilds'] += shard.get('guilds', 0)
+        latency = shard.get('latency')
+        if latency is not None:
+            total['max_latency'] = max(total['max_latency'] or 0, latency)
+        for group in ('events', 'rest', 'parse'):
+            for k, v in (shard.get(group) or {}).items():
+                total[group][k] = total[group].get(k, 0) + v
+    return total
+
+def main():
+    logger = discordbot.setup_logging(discordbot.BOT_LABEL + '-shards')
+    # Only the stats hash is read.  Shards have their own BoardManager
+    client = redis.Redis.from_url(discordbot.REDIS_URL)
+    context = multiprocessing.get_context('spawn')
+
+    processes = {}
+    for shard_id in SHARD_IDS:
+        processes[shard_id] = start(context, shard_id)
+        logger.info('Started shard %d/%d', shard_id, SHARD_COUNT)
+        time.sleep(START_INTERVAL_SEC)
+
+    while True:
+        time.sleep(STATS_INTERVAL_SEC)
+        for shard_id, process in list(processes.items()):
+            if not process.is_alive():
+                logger.warning('Shard %d exited with %s, restarting', shard_id, process.exitcode)
+                processes[shard_id] = start(context, shard_id)
+                time.sleep(START_INTERVAL_SEC)
+        total = aggregate(get_stats(client))
+        logger.info(
+            'Shards: %d (stale: %s), guilds: %d, max latency: %s, events: %s, rest: %s',
+            total['shards'], ','.join(total['stale']) or '-', total['guilds'],
+            '{:.3f}'.format(total['max_latency']) if total['max_latency'] is not None else '-',
+            total['events'], total['rest'],
+        )
+
+if __name__ == '__main__':
+    main()
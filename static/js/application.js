@@ -3,6 +3,8 @@
 
   var connection, template, tbody, connectStatus;
   var EXPIRE_IN_MSEC = 2 * 60 * 1000;
+  var PING_INTERVAL_MSEC = 30 * 1000;
+  var lastReceived = 0;
   var NAME_MAX_LENGTH = 16;
 
   class Room {
@@ -144,6 +146,26 @@
       }
     }
   }
+  // Rooms of a table in `format=compact` messages.  See board/encoding.py
+  function unpack(table) {
+    var rooms = [];
+    for ( let row of table.rows ) {
+      let room = {};
+      table.cols.forEach(function(column, i) {
+        let value = row[i];
+        if ( value === null ) return;
+        if ( table.enums[i] ) value = table.enums[i][value];
+        if ( Array.isArray(column) ) {
+          if ( room[column[0]] === undefined ) room[column[0]] = {};
+          room[column[0]][column[1]] = value;
+        } else {
+          room[column] = value;
+        }
+      });
+      rooms.push(room);
+    }
+    return rooms;
+  }
   function connect(endpoint) {
     var serverUrl;
     var scheme = "ws";
@@ -156,17 +178,30 @@
     } else {
       serverUrl = endpoint;
     }
+    if ( window.filter ) {
+      // Ask the server to send only matching rooms
+      serverUrl += (serverUrl.includes('?') ? '&' : '?') + window.filter.toString();
+    }
+    // Servers which do not know the format send plain JSON
+    serverUrl += (serverUrl.includes('?') ? '&' : '?') + 'format=compact';
     console.info('Connecting to', serverUrl);
     connection = new ReconnectingWebSocket(serverUrl);
+    var epoch;
 
     connection.onopen = function(evt) {
       console.info('Successfully connected to Board server.');
       connectStatus.className = 'success';
+      lastReceived = Date.now();
       if ( ! window.polling ) {
         window.polling = setInterval(function(){
-          if ( connection.readyState == WebSocket.OPEN )
-            connection.send('ping');
-        }, 30*1000);
+          if ( connection.readyState != WebSocket.OPEN ) return;
+          if ( (Date.now() - lastReceived) > PING_INTERVAL_MSEC * 2 ) {
+            console.warn('No response from Board server.  Reconnecting.');
+            connection.refresh();
+            return;
+          }
+          connection.send('ping');
+        }, PING_INTERVAL_MSEC);
       }
     };
     connection.onclose = function(evt) {
@@ -175,6 +210,7 @@
 
     connection.onmessage = function(evt) {
       var message;
+      lastReceived = Date.now();
       try {
         message = JSON.parse(evt.data);
       } catch(e) {
@@ -182,9 +218,25 @@
         console.dir(evt.data);
         return;
       }
+      for ( let name of ['data', 'delete'] ) {
+        if ( message[name] && message[name].rows ) {
+          message[name] = unpack(message[name]);
+        }
+      }
+
+      if ( message.seq !== undefined ) {
+        if ( message.type == 'all' ) {
+          epoch = message.epoch;
+        }
+        // Reconnect with the last event, so that the server sends only missed events
+        connection.url = serverUrl + (serverUrl.includes('?') ? '&' : '?') +
+          'since=' + encodeURIComponent(epoch + ':' + message.seq);
+      }
 
       var room;
-      if ( message.type == 'all' ) {
+      if ( message.type == 'pong' ) {
+        return;
+      } else if ( message.type == 'all' ) {
         Room.delete_all();
       } else if ( message.type == 'delete') {
         for ( let data of message.data ) {
@@ -192,6 +244,12 @@
           room.remove();
         }
         return;
+      } else if ( message.type == 'batch' ) {
+        // Merged events.  Deleted rooms first, then partial in `data`
+        for ( let data of message.delete ) {
+          room = new Room(data);
+          room.remove();
+        }
       }
       for ( let data of message.data ) {
         room = new Room(data);
@@ -0,0 +1,40 @@
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+from board.aio import AsyncBoardManager
+
+class AsyncBoardManagerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = mock.Mock()
+        self.manager.redis.connection_pool.max_connections = 10
+        self.aio = AsyncBoardManager(self.manager, max_workers=2)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.aio.close()
+        self.loop.close()
+
+    def test_redis_calls_run_in_thread(self):
+        threads = []
+        def save(data):
+            threads.append(threading.current_thread())
+            return 'saved'
+        self.manager.save.side_effect = save
+
+        result = self.loop.run_until_complete(self.aio.save({'id': '1111111'}))
+        self.assertEqual(result, 'saved')
+        self.manager.save.assert_called_once_with({'id': '1111111'})
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    def test_errors_are_raised_on_await(self):
+        self.manager.destroy.side_effect = ValueError('owner.id must not be empty.')
+        with self.assertRaises(ValueError):
+            self.loop.run_until_complete(self.aio.destroy({}))
+
+    def test_cpu_only_methods_are_passed_through(self):
+        self.manager.validate.return_value = {'id': '1111111'}
+        self.assertEqual(self.aio.validate({}), {'id': '1111111'})
+        self.assertIs(self.aio.expire_sec, self.manager.expire_sec)
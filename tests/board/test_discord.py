@@ -0,0 +1,210 @@
+import asyncio
+import json
+import logging
+import threading
+import unittest
+from unittest import mock
+
+try:
+    from my.discordmod import Client
+    from board.adapters.discord import Bot
+except ImportError as ex:
+    raise unittest.SkipTest('Discord adapter is not available: {}'.format(ex))
+
+from board.aio import AsyncBoardManager
+
+def create_message(message_id=1, content='1234567 真ミド', channel_id=100):
+    message = mock.Mock(id=message_id, content=content, reactions=[])
+    message.channel.id = channel_id
+    message.channel.guild.id = 10
+    message.author.bot = False
+    message.author.system = False
+    message.mentions = []
+    message.role_mentions = []
+    message.add_reaction = mock.AsyncMock()
+    message.remove_reaction = mock.AsyncMock()
+    return message
+
+def create_channel(channel_id, name=Bot.CHANNEL_NAME):
+    channel = mock.Mock(id=channel_id)
+    channel.name = name
+    channel.guild.id = 10
+    return channel
+
+class BotTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        with mock.patch.object(Client, '__init__', return_value=None):
+            self.bot = Bot()
+        self.bot.loop = self.loop
+        self.bot.logger = logging.getLogger(__name__)
+        self.bot._connection = mock.Mock()
+        self.bot._connection.user.mentioned_in.return_value = False
+        self.bot.manager = mock.Mock()
+        self.bot.edit_debounce_sec = 0.01
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_until_complete(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+class EditTestCase(BotTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.bot.on_message = mock.AsyncMock()
+        self.bot.is_target = mock.Mock(return_value=True)
+
+    async def edit(self, *contents):
+        before = create_message(content='0000000')
+        for content in contents:
+            after = create_message(content=content)
+            await self.bot.on_message_edit(before, after)
+            before = after
+        await asyncio.sleep(0.05)
+
+    def test_rapid_edits_are_saved_once(self):
+        self.run_until_complete(self.edit('1111111', '2222222', '3333333'))
+        self.bot.on_message.assert_awaited_once()
+        self.assertEqual(self.bot.on_message.await_args[0][0].content, '3333333')
+        self.assertEqual(self.bot.rest_stats['edits'], 3)
+        self.assertEqual(self.bot.rest_stats['edits_collapsed'], 2)
+        self.assertEqual(self.bot._pending_edits, {})
+
+    def test_edits_out_of_board_are_ignored(self):
+        self.bot.is_target.return_value = False
+        self.run_until_complete(self.edit('1111111', '2222222'))
+        self.bot.on_message.assert_not_awaited()
+        self.assertEqual(self.bot.rest_stats['edits'], 0)
+
+    def test_unchanged_content(self):
+        self.run_until_complete(self.edit('0000000'))
+        self.bot.is_target.assert_not_called()
+        self.bot.on_message.assert_not_awaited()
+
+class ChannelCacheTestCase(BotTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.board = create_channel(100)
+        self.guild = self.board.guild
+        self.guild.channels = [self.board, create_channel(200, 'general')]
+
+    def test_cached(self):
+        self.assertEqual(self.bot.board_channel_ids(self.guild), {100})
+        self.guild.channels = []
+        self.assertEqual(self.bot.board_channel_ids(self.guild), {100})
+
+    def test_channel_create(self):
+        self.bot.board_channel_ids(self.guild)
+        channel = create_channel(101)
+        self.guild.channels.append(channel)
+        self.run_until_complete(self.bot.on_guild_channel_create(channel))
+        self.assertEqual(self.bot.board_channel_ids(self.guild), {100, 101})
+
+    def test_channel_delete(self):
+        self.bot.board_channel_ids(self.guild)
+        self.guild.channels.remove(self.board)
+        self.run_until_complete(self.bot.on_guild_channel_delete(self.board))
+        self.assertEqual(self.bot.board_channel_ids(self.guild), set())
+
+    def test_channel_rename(self):
+        self.bot.board_channel_ids(self.guild)
+        renamed = create_channel(200)
+        self.guild.channels[1] = renamed
+        self.run_until_complete(self.bot.on_guild_channel_update(create_channel(200, 'general'), renamed))
+        self.assertEqual(self.bot.board_channel_ids(self.guild), {100, 200})
+
+        # Other changes keep the cache
+        self.guild.channels = []
+        self.run_until_complete(self.bot.on_guild_channel_update(renamed, create_channel(200)))
+        self.assertEqual(self.bot.board_channel_ids(self.guild), {100, 200})
+
+    def test_is_target(self):
+        self.guild.channels = [self.board]
+        message = create_message(channel_id=100)
+        message.channel.guild = self.guild
+        self.assertTrue(self.bot.is_target(message))
+        message.channel.id = 200
+        self.assertFalse(self.bot.is_target(message))
+
+class ExtractDataTestCase(BotTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.bot.manager.parse.side_effect = lambda content, message, guild=None: {'id': content}
+        self.bot._connection.user.name = 'board'
+
+    def create_message(self, channel):
+        message = mock.Mock(clean_content='1234567', channel=channel, edited_at=None, created_at=1)
+        message.author.id = 12345
+        return message
+
+    def test_guild(self):
+        data = self.bot.extract_data(self.create_message(create_channel(100)))
+        self.bot.manager.parse.assert_called_once_with('1234567', mock.ANY, guild=10)
+        self.assertEqual(data['guild']['id'], 10)
+
+    def test_dm(self):
+        # DMChannel has no guild
+        dm = mock.Mock(spec=['id', 'send'])
+        self.assertIsNone(self.bot.extract_data(self.create_message(dm)))
+        self.bot.manager.parse.assert_called_once_with('1234567', mock.ANY, guild=None)
+
+        self.bot.manager.parse.side_effect = None
+        self.bot.manager.parse.return_value = {'error': 'Invalid'}
+        self.assertEqual(self.bot.extract_data(self.create_message(dm)), {'error': 'Invalid'})
+
+class ReactionTestCase(BotTestCase):
+
+    def test_unchanged(self):
+        message = create_message()
+        self.run_until_complete(self.bot.set_reaction(message, False))
+        message.add_reaction.assert_not_awaited()
+        message.remove_reaction.assert_not_awaited()
+        self.assertEqual(self.bot.rest_stats['reaction_calls'], 0)
+
+    def test_changed(self):
+        message = create_message()
+        self.run_until_complete(self.bot.set_reaction(message, True))
+        message.add_reaction.assert_awaited_once_with(Bot.REACTION)
+
+        message.reactions = [mock.Mock(me=True, emoji=Bot.REACTION)]
+        self.run_until_complete(self.bot.set_reaction(message, True))
+        self.run_until_complete(self.bot.set_reaction(message, False))
+        message.remove_reaction.assert_awaited_once_with(Bot.REACTION, self.bot.user)
+        self.assertEqual(self.bot.rest_stats['reaction_calls'], 2)
+
+class ControlTestCase(BotTestCase):
+
+    def setUp(self):
+        super().setUp()
+        manager = mock.Mock(CONTROL_CHANNEL='board-control')
+        manager.redis.connection_pool.max_connections = 10
+        self.threads = []
+        manager.apply_control.side_effect = lambda message: self.threads.append(threading.current_thread())
+        self.bot.manager = AsyncBoardManager(manager, loop=self.loop)
+        self.addCleanup(self.bot.manager.close)
+
+    def test_apply_in_executor(self):
+        with mock.patch.object(self.loop, 'add_signal_handler') as add_signal_handler:
+            self.bot.watch_plugins()
+        pubsub = self.bot.manager.redis.pubsub.return_value
+        handler = pubsub.subscribe.call_args[1]['board-control']
+
+        # From the pub/sub thread
+        message = {'data': json.dumps({'action': 'guilds'}).encode('utf-8')}
+        thread = threading.Thread(target=handler, args=(message,))
+        thread.start()
+        thread.join()
+        # SIGHUP
+        add_signal_handler.call_args[0][1]()
+        self.run_until_complete(asyncio.sleep(0.1))
+
+        self.bot.manager.manager.apply_control.assert_has_calls([
+            mock.call({'action': 'guilds'}), mock.call({'action': 'reload'}),
+        ], any_order=True)
+        for thread in self.threads:
+            self.assertNotEqual(thread, threading.main_thread())
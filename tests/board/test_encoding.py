@@ -0,0 +1,55 @@
+import json
+import unittest
+
+from ddt import ddt, data
+
+from board import encoding
+
+def generate_room(room_id, guild='54321', **values):
+    room = {
+        'id': room_id,
+        'owner': {'id': '12345' + room_id, 'name': 'ユーザー'},
+        'guild': {'id': guild, 'name': 'team A'},
+        'time': 1499794027,
+    }
+    room.update(values)
+    return room
+
+@ddt
+class CompactTestCase(unittest.TestCase):
+
+    def roundtrip(self, rooms):
+        table = json.loads(encoding.dumps({'type': 'partial', 'data': rooms}, 'compact'))['data']
+        return table, encoding.unpack(table)
+
+    @data(
+        [],
+        [generate_room('1000001')],
+        [generate_room('1000001'), generate_room('1000002', message='真ミド', slots=0)],
+        [generate_room('1000001', flag=True), generate_room('1000002', flag=1)],
+        [generate_room('1000001', guild='1'), {'id': '1000002', 'owner': {}, 'guild': 'name', 'tags': [1, 2]}],
+    )
+    def test_roundtrip(self, rooms):
+        _, unpacked = self.roundtrip(rooms)
+        self.assertEqual(unpacked, rooms)
+
+    def test_repeated_values_are_interned(self):
+        table, _ = self.roundtrip([generate_room('1000001'), generate_room('1000002', '99999')])
+        columns = [tuple(column) if isinstance(column, list) else column for column in table['cols']]
+        self.assertEqual(table['enums'][columns.index(('guild', 'name'))], ['team A'])
+        self.assertEqual(table['enums'][columns.index(('owner', 'name'))], ['ユーザー'])
+        # Unique values are sent as they are
+        self.assertIsNone(table['enums'][columns.index(('guild', 'id'))])
+        self.assertEqual([row[columns.index('id')] for row in table['rows']], ['1000001', '1000002'])
+
+    def test_other_fields_are_kept(self):
+        message = json.loads(encoding.dumps(
+            {'type': 'batch', 'delete': [{'id': '1000001'}], 'data': [], 'seq': 3}, 'compact'
+        ))
+        self.assertEqual(message['seq'], 3)
+        self.assertEqual(encoding.unpack(message['delete']), [{'id': '1000001'}])
+
+    def test_from_environ(self):
+        self.assertEqual(encoding.from_environ({'QUERY_STRING': 'guild=1&format=compact'}), 'compact')
+        self.assertEqual(encoding.from_environ({'QUERY_STRING': 'format=msgpack'}), 'json')
+        self.assertEqual(encoding.from_environ(None), 'json')
@@ -0,0 +1,416 @@
+import json
+import os
+import time
+import unittest
+import urllib.parse
+from unittest import mock
+
+import redis
+
+from board.manager import BoardManager
+
+# The database is flushed by each test
+REDIS_URL = os.environ.get('TEST_REDIS_URL', 'redis://127.0.0.1:6379/15')
+
+def generate_data(room_id, owner='12345', guild='54321'):
+    return {
+        'id': room_id,
+        'owner': {'id': owner, 'name': 'name'},
+        'guild': {'id': guild, 'name': 'team A'},
+        'time': 1499794027,
+    }
+
+class RedisTestCase(unittest.TestCase):
+    """Tests against a Redis server at TEST_REDIS_URL.
+    Skipped if the server is not available."""
+    config = {}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = redis.Redis.from_url(REDIS_URL)
+        try:
+            cls.client.ping()
+        except redis.exceptions.ConnectionError:
+            raise unittest.SkipTest('Redis is not available at {}'.format(REDIS_URL))
+
+    def setUp(self):
+        self.client.flushdb()
+        self.manager = self.create_manager()
+
+    def create_manager(self, **config):
+        config = dict({'plugin': 'plugins.example', 'notifications': 'off'}, **dict(self.config, **config))
+        return BoardManager(REDIS_URL, config)
+
+    def save(self, room_id, owner='12345', manager=None):
+        manager = manager or self.manager
+        return manager.save(manager.validate(generate_data(room_id, owner)))
+
+    def subscribe(self):
+        """Pub/sub of events, read by `events()`"""
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.manager.CHANNEL)
+        # Subscription confirmation
+        pubsub.get_message(timeout=1)
+        self.addCleanup(pubsub.close)
+        return pubsub
+
+    def events(self, pubsub):
+        """Events published since the last call"""
+        events = []
+        while True:
+            message = pubsub.get_message(timeout=0.05)
+            if message is None:
+                return events
+            events.append(json.loads(message['data']))
+
+    def index(self):
+        """Room keys of the index and their scores"""
+        return {
+            key.decode('utf-8'): score
+            for key, score in self.client.zrange(self.manager.index_key, 0, -1, withscores=True)
+        }
+
+    def owner_index(self, owner='12345'):
+        key = self.manager.owner_index_key({'owner': {'id': owner}})
+        return {key.decode('utf-8') for key in self.client.smembers(key)}
+
+class IndexTestCase(RedisTestCase):
+    config = {'storage': 'index'}
+
+    def test_save(self):
+        started = time.time()
+        self.save('1111111')
+
+        index = self.index()
+        self.assertEqual(list(index), ['room:12345:1111111'])
+        self.assertGreaterEqual(index['room:12345:1111111'], started + self.manager.expire_sec)
+        self.assertEqual(self.owner_index(), {'room:12345:1111111'})
+        self.assertGreater(self.client.ttl(self.manager.owner_index_key({'owner': {'id': '12345'}})), 0)
+
+    def test_replace(self):
+        self.save('1111111')
+        self.save('2222222', owner='67890')
+        self.save('3333333')
+
+        self.assertEqual(set(self.index()), {'room:67890:2222222', 'room:12345:3333333'})
+        self.assertEqual(self.owner_index(), {'room:12345:3333333'})
+        self.assertFalse(self.client.exists('room:12345:1111111'))
+        self.assertEqual(
+            sorted(room['id'] for room in self.manager.get_all()), ['2222222', '3333333']
+        )
+
+    def test_destroy(self):
+        self.save('1111111')
+        self.save('2222222', owner='67890')
+        self.manager.destroy(generate_data('1111111'))
+
+        self.assertEqual(list(self.index()), ['room:67890:2222222'])
+        self.assertEqual(self.owner_index(), set())
+        self.assertFalse(self.client.exists('room:12345:1111111'))
+
+    def test_expired_rooms_are_pruned(self):
+        self.save('1111111')
+        later = time.time() + self.manager.expire_sec + 1
+        with mock.patch('board.manager.time.time', return_value=later):
+            self.assertEqual(self.manager.get_all_keys(), [])
+            self.assertEqual(self.manager.get_all(), [])
+            self.save('2222222', owner='67890')
+        self.assertEqual(list(self.index()), ['room:67890:2222222'])
+
+    def test_rebuild_from_keys(self):
+        keys = self.create_manager(storage='keys')
+        self.save('1111111', manager=keys)
+        self.save('2222222', owner='67890', manager=keys)
+        self.assertEqual(self.index(), {})
+
+        started = time.time()
+        # Built when the index does not exist
+        self.manager = self.create_manager()
+        index = self.index()
+        self.assertEqual(set(index), {'room:12345:1111111', 'room:67890:2222222'})
+        for score in index.values():
+            self.assertLessEqual(score, started + self.manager.expire_sec + 1)
+            self.assertGreater(score, started)
+        self.assertEqual(self.owner_index('67890'), {'room:67890:2222222'})
+
+        # Existing rooms are replaced through the index
+        self.save('3333333')
+        self.assertEqual(set(self.index()), {'room:67890:2222222', 'room:12345:3333333'})
+        self.assertEqual(self.manager.rebuild_index(), 2)
+
+class GetAllTestCase(RedisTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            self.save('100000{}'.format(i), owner=str(i))
+
+    def test_scan_keys(self):
+        self.manager.SCAN_COUNT = 2
+        self.manager.MGET_CHUNK = 2
+        error = AssertionError('Must not block Redis over the keyspace')
+        with mock.patch.object(self.manager.redis, 'keys', side_effect=error), \
+                mock.patch.object(self.manager, '_get_all_script', side_effect=error):
+            rooms = self.manager.get_all()
+        self.assertEqual(sorted(room['id'] for room in rooms), ['100000{}'.format(i) for i in range(5)])
+
+    def test_index(self):
+        manager = self.create_manager(storage='index')
+        with mock.patch.object(manager.redis, 'mget', side_effect=AssertionError('Must use the script')):
+            self.assertEqual(len(manager.get_all()), 5)
+
+class ReplaceTestCase(RedisTestCase):
+    """Save and destroy by the REPLACE script"""
+    scripting = True
+
+    def setUp(self):
+        super().setUp()
+        self.manager.scripting_available = self.scripting
+        self.pubsub = self.subscribe()
+
+    def tearDown(self):
+        self.assertEqual(self.manager.scripting_available, self.scripting)
+
+    def room(self, room_id):
+        return self.manager.validate(generate_data(room_id))
+
+    def test_save(self):
+        self.save('1111111')
+        self.assertEqual(self.events(self.pubsub), [{'type': 'partial', 'data': [self.room('1111111')]}])
+        self.assertEqual(json.loads(self.client.get('room:12345:1111111')), self.room('1111111'))
+        self.assertGreater(self.client.ttl('room:12345:1111111'), 0)
+
+    def test_replace(self):
+        self.save('1111111')
+        self.save('2222222', owner='67890')
+        self.save('3333333')
+        self.assertEqual(self.events(self.pubsub)[2:], [
+            {'type': 'delete', 'data': [{'id': '1111111'}]},
+            {'type': 'partial', 'data': [self.room('3333333')]},
+        ])
+        self.assertEqual(
+            sorted(room['id'] for room in self.manager.get_all()), ['2222222', '3333333']
+        )
+
+    def test_destroy(self):
+        self.save('1111111')
+        self.events(self.pubsub)
+        self.manager.destroy(generate_data('1111111'))
+        self.assertEqual(self.events(self.pubsub), [{'type': 'delete', 'data': [{'id': '1111111'}]}])
+        self.assertFalse(self.client.exists('room:12345:1111111'))
+
+        # Nothing to delete
+        self.manager.destroy(generate_data('1111111'))
+        self.assertEqual(self.events(self.pubsub), [])
+
+class ReplaceFallbackTestCase(ReplaceTestCase):
+    """Save and destroy by separated commands"""
+    scripting = False
+
+    def test_scripting_error(self):
+        self.manager = self.create_manager()
+        error = redis.exceptions.ResponseError('unknown command `EVALSHA`')
+        with mock.patch.object(self.manager, '_replace_script', side_effect=error), \
+                self.assertLogs('board.manager', 'WARNING'):
+            self.save('1111111')
+        self.assertEqual(self.events(self.pubsub), [{'type': 'partial', 'data': [self.room('1111111')]}])
+
+class IndexReplaceTestCase(ReplaceTestCase):
+    config = {'storage': 'index'}
+
+class IndexReplaceFallbackTestCase(ReplaceFallbackTestCase):
+    config = {'storage': 'index'}
+
+class ScriptingErrorTestCase(RedisTestCase):
+    """Only errors of EVAL/EVALSHA themselves fall back to separated commands"""
+    USER = 'board-test'
+
+    def create_user(self, *commands):
+        """Manager connected as an ACL user with `commands` changed"""
+        try:
+            self.client.acl_setuser(
+                self.USER, enabled=True, reset=True, passwords=['+secret'],
+                keys=['*'], commands=['+@all'] + list(commands),
+            )
+        except redis.exceptions.ResponseError:
+            self.skipTest('ACL is not supported by the server')
+        self.addCleanup(self.client.acl_deluser, self.USER)
+        url = urllib.parse.urlsplit(REDIS_URL)
+        netloc = '{}:secret@{}'.format(self.USER, url.netloc.rpartition('@')[2])
+        config = {'plugin': 'plugins.example', 'notifications': 'off'}
+        return BoardManager(url._replace(netloc=netloc).geturl(), config)
+
+    def test_command_denied_in_script(self):
+        # KEYS is called by the REPLACE script of keys storage
+        manager = self.create_user('-keys')
+        with self.assertRaisesRegex(redis.exceptions.ResponseError, 'Error running script'):
+            self.save('1111111', manager=manager)
+        self.assertTrue(manager.scripting_available)
+
+    def test_scripting_denied(self):
+        manager = self.create_user('-@scripting')
+        with self.assertLogs('board.manager', 'WARNING'):
+            self.save('1111111', manager=manager)
+        self.assertFalse(manager.scripting_available)
+        self.assertEqual([room['id'] for room in self.manager.get_all()], ['1111111'])
+
+    def test_messages(self):
+        for message, expected in (
+            ("unknown command `EVALSHA`, with args beginning with: ", True),
+            ("unknown command 'evalsha'", True),
+            ("this user has no permissions to run the 'evalsha' command or its subcommand", True),
+            ("NOPERM this user has no permissions to run the 'eval' command", True),
+            ("This Redis command is not allowed from scripts", False),
+            ("Error running script (call to f_0123): @user_script:1: The user executing "
+             "the script can't run this command or subcommand", False),
+            ("NOPERM this user has no permissions to run the 'keys' command", False),
+            ("WRONGTYPE Operation against a key holding the wrong kind of value", False),
+        ):
+            with self.subTest(message=message):
+                error = redis.exceptions.ResponseError(message)
+                self.assertIs(BoardManager._is_scripting_error(error), expected)
+
+class SaveManyTestCase(RedisTestCase):
+    """Rooms of a bulk request by the REPLACE script"""
+    scripting = True
+
+    def setUp(self):
+        super().setUp()
+        self.manager.scripting_available = self.scripting
+        self.save('1111111')
+        self.pubsub = self.subscribe()
+
+    def test_save_many(self):
+        rooms = [
+            self.manager.validate(generate_data(room_id, owner))
+            for room_id, owner in (('2222222', '12345'), ('3333333', '67890'), ('4444444', '67890'))
+        ]
+        with mock.patch.object(self.manager.redis, 'pipeline', wraps=self.manager.redis.pipeline) as pipeline:
+            msg = self.manager.save_many(rooms)
+        if self.scripting:
+            # Rooms, then events
+            self.assertEqual(pipeline.call_count, 2)
+
+        # The last room of each owner
+        partial = {'type': 'partial', 'data': [rooms[0], rooms[2]]}
+        self.assertEqual(json.loads(msg), partial)
+        self.assertEqual(self.events(self.pubsub), [
+            {'type': 'delete', 'data': [{'id': '1111111'}]},
+            partial,
+        ])
+        self.assertEqual(
+            sorted(room['id'] for room in self.manager.get_all()), ['2222222', '4444444']
+        )
+
+    def test_empty(self):
+        self.assertIsNone(self.manager.save_many([]))
+        self.assertEqual(self.events(self.pubsub), [])
+
+class SaveManyFallbackTestCase(SaveManyTestCase):
+    scripting = False
+
+class LockTestCase(RedisTestCase):
+
+    def test_acquire_lock(self):
+        self.assertTrue(self.manager.acquire_lock('sweeper', 'a', 0.1))
+        self.assertFalse(self.manager.acquire_lock('sweeper', 'b', 0.1))
+        time.sleep(0.15)
+        self.assertTrue(self.manager.acquire_lock('sweeper', 'b', 0.1))
+
+class SweepTestCase(RedisTestCase):
+    config = {'storage': 'index', 'expire_by': 'sweeper', 'notifications': 'auto'}
+
+    def setUp(self):
+        super().setUp()
+        self.pubsub = self.subscribe()
+        for room_id, owner in (('1111111', '1'), ('2222222', '2'), ('3333333', '3')):
+            self.save(room_id, owner)
+        self.events(self.pubsub)
+
+    def sweep(self, limit, delay=0):
+        later = time.time() + self.manager.expire_sec + delay
+        with mock.patch('board.manager.time.time', return_value=later):
+            return self.manager.sweep(limit)
+
+    def test_not_due(self):
+        self.assertEqual(self.sweep(10, delay=-1), (0, 0))
+        self.assertEqual(self.events(self.pubsub), [])
+        self.assertEqual(len(self.index()), 3)
+
+    def test_batches(self):
+        count, lag = self.sweep(2, delay=3)
+        self.assertEqual(count, 2)
+        self.assertGreater(lag, 2)
+        self.assertEqual(self.sweep(2, delay=3)[0], 1)
+        self.assertEqual(self.sweep(2, delay=3), (0, 0))
+
+        # One delete event for each batch, even with keyspace notifications
+        self.assertFalse(self.manager.notifications_available)
+        self.assertEqual(self.events(self.pubsub), [
+            {'type': 'delete', 'data': [{'id': '1111111'}, {'id': '2222222'}]},
+            {'type': 'delete', 'data': [{'id': '3333333'}]},
+        ])
+        self.assertEqual(self.index(), {})
+        self.assertEqual(self.owner_index('1'), set())
+        self.assertEqual(self.client.keys('room:*'), [])
+
+    def test_stream(self):
+        self.manager = self.create_manager(events='stream')
+        # MINID would trim the event, because the time is moved forward
+        self.manager.stream_minid_available = False
+        self.sweep(10, delay=1)
+        events = self.manager.read_events('0-0')
+        self.assertEqual(events[-1][1], {
+            'type': 'delete', 'data': [{'id': '1111111'}, {'id': '2222222'}, {'id': '3333333'}],
+        })
+        # Trimmed by events, not expired as a whole
+        self.assertEqual(self.client.ttl(self.manager.events_key), -1)
+
+class ReadEventsTestCase(RedisTestCase):
+    config = {'events': 'stream'}
+
+    def test_malformed_entries(self):
+        key = self.manager.events_key
+        self.client.xadd(key, {'data': 'not json'}, id='1-1')
+        self.client.xadd(key, {'other': '{}'}, id='1-2')
+        self.client.xadd(key, {'data': '{"type": "delete", "data": []}'}, id='1-3')
+        with self.assertLogs('board.manager', 'WARNING'):
+            events = self.manager.read_events('0-0')
+        self.assertEqual(events, [('1-1', None), ('1-2', None), ('1-3', {'type': 'delete', 'data': []})])
+
+class StreamTrimTestCase(RedisTestCase):
+    """Events older than expire_sec are trimmed from the stream"""
+    config = {'events': 'stream', 'stream_maxlen': 10}
+    scripting = True
+
+    def setUp(self):
+        super().setUp()
+        self.manager.scripting_available = self.scripting
+        # More than a node of the stream, which is the unit of trimming by ~
+        for i in range(150):
+            self.client.xadd(self.manager.events_key, {'data': '{}'}, id='1-{}'.format(i + 1))
+
+    def test_minid(self):
+        if not self.manager.stream_minid_available:
+            self.skipTest('MINID requires Redis 6.2')
+        self.save('1111111')
+        self.assertEqual(self.client.xlen(self.manager.events_key), 51)
+
+        # Recent events are kept however many they are
+        for i in range(20):
+            self.save(str(1000000 + i), owner=str(i))
+        events = self.manager.read_events('1-150')
+        self.assertEqual(len(events), 21)
+
+    def test_maxlen(self):
+        self.manager.stream_minid_available = False
+        self.save('1111111')
+        self.assertLess(self.client.xlen(self.manager.events_key), 100)
+
+    def test_version(self):
+        for version, supported in (('6.0.9', False), ('6.2.0', True), ('7.2.4', True), ('unknown', False)):
+            with mock.patch.object(self.manager.redis, 'info', return_value={'redis_version': version}):
+                self.assertEqual(self.manager._is_minid_supported(), supported, version)
+
+class StreamTrimFallbackTestCase(StreamTrimTestCase):
+    scripting = False
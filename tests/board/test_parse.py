@@ -0,0 +1,61 @@
+import pathlib
+import unittest
+
+from board.manager import ParseCache, compile_prefilter
+from plugins.example import Parser
+
+CORPUS = pathlib.Path(__file__, '../../../tools/parse-corpus.txt').resolve()
+
+class PrefilterTestCase(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertIsNone(compile_prefilter(None))
+        self.assertIsNone(compile_prefilter({}))
+
+    def test_lengths_and_chars(self):
+        accept = compile_prefilter({'min_length': 7, 'max_length': 12, 'any_chars': '0123456789'})
+        self.assertTrue(accept('1234567 真ミド'))
+        self.assertFalse(accept('123456'))
+        self.assertFalse(accept('1234567 真ミド 初心者歓迎'))
+        self.assertFalse(accept('おはようございます'))
+
+    def test_corpus_rooms_are_accepted(self):
+        """Prefilter for the example plugin must not drop any room"""
+        parser = Parser()
+        accept = compile_prefilter({'min_length': 7, 'any_chars': '0123456789'})
+        for content in CORPUS.read_text(encoding='utf-8').splitlines():
+            if parser.parse_content(content):
+                self.assertTrue(accept(content), content)
+
+class ParseCacheTestCase(unittest.TestCase):
+
+    def test_hit_returns_copy(self):
+        cache = ParseCache(2)
+        result = cache.put('1234567', {'id': '1234567'})
+        result['owner'] = {'id': '12345'}
+
+        found, cached = cache.get('1234567')
+        self.assertTrue(found)
+        self.assertEqual(cached, {'id': '1234567'})
+        cached['owner'] = {'id': '12345'}
+        self.assertEqual(cache.get('1234567')[1], {'id': '1234567'})
+        self.assertEqual(cache.stats['hits'], 2)
+
+    def test_none_is_not_cached(self):
+        cache = ParseCache(2)
+        cache.put('1234567', {'id': '1234567'})
+        cache.put('hello', None)
+        cache.put('good morning', None)
+        self.assertEqual(cache.get('hello'), (False, None))
+        self.assertTrue(cache.get('1234567')[0])
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ParseCache(2)
+        cache.put('a', {'id': 'a'})
+        cache.put('b', {'id': 'b'})
+        cache.get('a')
+        cache.put('c', {'id': 'c'})
+
+        self.assertEqual(cache.get('b'), (False, None))
+        self.assertTrue(cache.get('a')[0])
+        self.assertTrue(cache.get('c')[0])
@@ -0,0 +1,82 @@
+import os
+import threading
+import unittest
+
+import redis
+
+from board.pool import BlockingConnectionPool, ConnectionPool, create_pool
+
+class FakeConnection:
+    """Connection which never talks to Redis"""
+    def __init__(self, **kwargs):
+        self.pid = os.getpid()
+
+    def connect(self):
+        pass
+
+    def can_read(self):
+        return False
+
+    def disconnect(self):
+        pass
+
+class PoolStatsTestCase(unittest.TestCase):
+
+    def test_checkouts(self):
+        pool = ConnectionPool(connection_class=FakeConnection)
+        first = pool.get_connection('GET')
+        second = pool.get_connection('GET')
+        pool.release(first)
+        pool.release(pool.get_connection('GET'))
+        pool.release(second)
+
+        stats = pool.get_stats()
+        self.assertEqual(stats['checkouts'], 3)
+        self.assertEqual(stats['in_use'], 0)
+        self.assertEqual(stats['max_in_use'], 2)
+        self.assertEqual(stats['created'], 2)
+        self.assertGreaterEqual(stats['wait_sec_max'], stats['wait_sec_avg'])
+
+    def test_checkouts_from_threads(self):
+        pool = ConnectionPool(connection_class=FakeConnection)
+
+        def checkout():
+            for _ in range(1000):
+                pool.release(pool.get_connection('GET'))
+
+        threads = [threading.Thread(target=checkout) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = pool.get_stats()
+        self.assertEqual(stats['checkouts'], 8000)
+        self.assertEqual(stats['in_use'], 0)
+        self.assertLessEqual(stats['max_in_use'], 8)
+
+    def test_blocking_pool_exhausted(self):
+        pool = BlockingConnectionPool(
+            connection_class=FakeConnection, max_connections=1, timeout=0.01
+        )
+        pool.get_connection('GET')
+        with self.assertRaises(redis.exceptions.ConnectionError):
+            pool.get_connection('GET')
+
+        stats = pool.get_stats()
+        self.assertEqual(stats['checkouts'], 1)
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['max_connections'], 1)
+
+    def test_create_pool(self):
+        pool = create_pool(
+            'redis://127.0.0.1:6379/2', blocking=True, max_connections=5,
+            socket_timeout=3, health_check_interval=30,
+        )
+        self.assertIsInstance(pool, BlockingConnectionPool)
+        self.assertEqual(pool.max_connections, 5)
+        self.assertEqual(pool.connection_kwargs['db'], 2)
+        self.assertEqual(pool.connection_kwargs['socket_timeout'], 3)
+        self.assertEqual(pool.connection_kwargs['health_check_interval'], 30)
+
+        self.assertIsInstance(create_pool('redis://127.0.0.1:6379'), ConnectionPool)
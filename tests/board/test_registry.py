@@ -0,0 +1,76 @@
+import sys
+import types
+import unittest
+
+from board.manager import DefaultValidator, PluginRegistry
+
+def create_plugin(name, message):
+    """Plugin module whose parser returns `message`"""
+    module = types.ModuleType(name, 'Description of {}'.format(name))
+
+    class Parser:
+        def validate(self, data, *args, **kwargs):
+            return {'id': data['id'], 'plugin': message}
+
+        def parse_content(self, content, *args, **kwargs):
+            return {'id': content, 'message': message}
+
+        def report_for(self, action, obj=None, *args, **kwargs):
+            return message
+
+    module.Parser = Parser
+    sys.modules[name] = module
+    return module
+
+class PluginRegistryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.first = create_plugin('tests_plugin_first', 'first')
+        self.second = create_plugin('tests_plugin_second', 'second')
+        self.registry = PluginRegistry(validators=[DefaultValidator()])
+        self.registry.load('tests_plugin_first')
+        self.registry.load(self.second)
+
+    def tearDown(self):
+        sys.modules.pop('tests_plugin_first', None)
+        sys.modules.pop('tests_plugin_second', None)
+
+    def data(self, guild_id):
+        return {'id': '1234567', 'owner': {'id': '12345'}, 'guild': {'id': guild_id}}
+
+    def test_first_loaded_is_default(self):
+        self.assertEqual(self.registry.default, 'tests_plugin_first')
+        self.assertEqual(self.registry.names, ['tests_plugin_first', 'tests_plugin_second'])
+        self.assertEqual(self.registry.for_guild(None).parse('1')['message'], 'first')
+
+    def test_select_per_guild(self):
+        self.registry.set_guilds({54321: 'tests_plugin_second', '111': 'unknown'})
+        self.assertEqual(self.registry.guilds, {'54321': 'tests_plugin_second'})
+
+        plugin = self.registry.for_guild(54321)
+        self.assertEqual(plugin.parse('1')['message'], 'second')
+        self.assertEqual(plugin.validate(self.data(54321))['plugin'], 'second')
+        self.assertEqual(plugin.description, 'Description of tests_plugin_second')
+        self.assertEqual(self.registry.for_guild('111').name, 'tests_plugin_first')
+
+    def test_validators_run_before_plugin(self):
+        plugin = self.registry.for_guild(None)
+        with self.assertRaises(ValueError):
+            plugin.validate({'id': '1234567'})
+        self.assertEqual(plugin.validate(self.data('54321'))['guild'], {'id': '54321'})
+
+    def test_reload_swaps_plugin(self):
+        previous = self.registry.for_guild(None)
+        self.first.Parser.parse_content = lambda self, content, *args, **kwargs: {'id': 'reloaded'}
+        # importlib.reload() needs a spec, so replace load() of the module here
+        self.registry.load(self.first)
+
+        self.assertIsNot(self.registry.for_guild(None), previous)
+        self.assertEqual(self.registry.for_guild(None).parse('1'), {'id': 'reloaded'})
+
+    def test_failed_reload_keeps_previous(self):
+        previous = self.registry.for_guild(None)
+        with self.assertLogs('board.manager', 'ERROR'):
+            failed = self.registry.reload('tests_plugin_first')
+        self.assertEqual(failed, ['tests_plugin_first'])
+        self.assertIs(self.registry.for_guild(None), previous)
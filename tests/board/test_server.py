@@ -0,0 +1,713 @@
+import json
+import struct
+import time
+import unittest
+from unittest import mock
+
+import gevent
+import redis
+from gevent.exceptions import ConcurrentObjectUseError
+from geventwebsocket.exceptions import WebSocketError
+
+from board.encoding import unpack
+from board.manager import BoardManager
+from board.server import Client, PubSubServer
+from board.websocket import DeflateWebSocket
+from .test_manager import RedisTestCase, generate_data
+from .test_websocket import FakeStream, client_frame
+
+class FakeWebSocket:
+    def __init__(self, fail=False, query=''):
+        self.closed = False
+        self.close_code = None
+        self.environ = {'QUERY_STRING': query}
+        self.sent = []
+        self.fail = fail
+
+    def send(self, data):
+        if self.fail:
+            raise WebSocketError('Socket is dead')
+        self.sent.append(data)
+
+    def raw_write(self, frame):
+        """Unpack an unmasked frame and save its payload"""
+        if self.fail:
+            raise OSError('Socket is dead')
+        opcode = frame[0] & 0x0f
+        length = frame[1] & 0x7f
+        offset = 2
+        if length == 126:
+            length, = struct.unpack('!H', frame[2:4])
+            offset = 4
+        elif length == 127:
+            length, = struct.unpack('!Q', frame[2:10])
+            offset = 10
+        payload = frame[offset:offset + length]
+        if opcode == 0x8:
+            self.close_code, = struct.unpack('!H', payload[:2])
+            return
+        self.sent.append(payload.decode('utf-8'))
+
+class BlockingWebSocket(FakeWebSocket):
+    """Each write takes `delay` seconds.  Concurrent writes fail in the same
+    way as gevent sockets.  Nothing is received until closed."""
+    def __init__(self, delay, **kwargs):
+        super().__init__(**kwargs)
+        self.delay = delay
+        self.writing = False
+
+    def raw_write(self, frame):
+        if self.writing:
+            raise ConcurrentObjectUseError('Another greenlet is writing')
+        self.writing = True
+        try:
+            gevent.sleep(self.delay)
+            super().raw_write(frame)
+        finally:
+            self.writing = False
+
+    def receive(self):
+        while not self.closed:
+            gevent.sleep(0.01)
+
+class BlockingStream(FakeStream):
+    """Stream of DeflateWebSocket whose writes take `delay` seconds.
+    Concurrent writes fail in the same way as gevent sockets."""
+    def __init__(self, data, delay):
+        super().__init__(data)
+        self.delay = delay
+        self.writing = False
+
+    def write(self, data):
+        if self.writing:
+            raise ConcurrentObjectUseError('Another greenlet is writing')
+        self.writing = True
+        try:
+            gevent.sleep(self.delay)
+            super().write(data)
+        finally:
+            self.writing = False
+
+def create_server(notifications_available=False, events='pubsub', **config):
+    app = mock.Mock()
+    app.config = config
+    manager = mock.Mock(
+        notifications_available=notifications_available, events=events,
+        events_key='room:events',
+        CHANNEL='newroom', CONTROL_CHANNEL='board-control',
+        KEY_GLUE=':', prefix='room', expire_sec=120,
+        keyevent_pattern='__keyevent@0__:*',
+    )
+    manager.get_all.return_value = []
+    manager._decode_message = BoardManager._decode_message
+    manager.is_room_key = lambda key: BoardManager.is_room_key(manager, key)
+    manager.split_key = lambda key: BoardManager.split_key(manager, key)
+    return PubSubServer(app, manager)
+
+def generate_room(room_id, guild, room_type=None):
+    room = {
+        'id': room_id,
+        'owner': {'id': '12345', 'name': 'name'},
+        'guild': {'id': guild, 'name': 'team'},
+        'time': 1499794027,
+    }
+    if room_type:
+        room['type'] = room_type
+    return room
+
+class ClientTestCase(unittest.TestCase):
+
+    def test_send_all(self):
+        server = create_server()
+        sockets = [FakeWebSocket(), FakeWebSocket()]
+        for ws in sockets:
+            server.register(ws)
+        server.send_all('message')
+        gevent.sleep(0)
+        for ws in sockets:
+            self.assertEqual(ws.sent, ['message'])
+
+    def test_max_clients(self):
+        server = create_server(BOARD_MAX_CLIENTS=1)
+        self.assertFalse(server.is_full())
+        client = server.register(FakeWebSocket())
+        self.assertTrue(server.is_full())
+        server.unregister(client)
+        self.assertFalse(server.is_full())
+        self.assertFalse(create_server().is_full())
+
+    def test_close_with_code(self):
+        server = create_server()
+        ws = FakeWebSocket()
+        client = server.register(ws)
+        client.close(1001)
+        gevent.sleep(0)
+        self.assertEqual(ws.close_code, 1001)
+        self.assertTrue(ws.closed)
+
+    def test_dead_client_is_removed(self):
+        server = create_server()
+        server.register(FakeWebSocket(fail=True))
+        server.send_all('message')
+        gevent.sleep(0)
+        self.assertEqual(server.clients, {})
+
+    def test_overflow_drop_oldest(self):
+        server = create_server(BOARD_SEND_QUEUE_SIZE=2, BOARD_SEND_OVERFLOW='drop_oldest')
+        ws = FakeWebSocket()
+        server.register(ws)
+        for i in range(4):
+            server.send_all(str(i))
+        gevent.sleep(0)
+        self.assertEqual(ws.sent, ['2', '3'])
+
+    def test_overflow_coalesce(self):
+        server = create_server(BOARD_SEND_QUEUE_SIZE=2, BOARD_SEND_OVERFLOW='coalesce')
+        ws = FakeWebSocket()
+        server.register(ws)
+        for i in range(4):
+            server.send_all(str(i))
+        gevent.sleep(0)
+        self.assertEqual(ws.sent, [server.snapshot.encoded(seq=0, epoch=server.replay.epoch), '3'])
+
+    def test_overflow_disconnect(self):
+        server = create_server(BOARD_SEND_QUEUE_SIZE=2, BOARD_SEND_OVERFLOW='disconnect')
+        ws = FakeWebSocket()
+        server.register(ws)
+        for i in range(4):
+            server.send_all(str(i))
+        gevent.sleep(0)
+        self.assertEqual(ws.close_code, 1008)
+        self.assertEqual(server.clients, {})
+
+    def test_overflow_disconnect_while_writing(self):
+        server = create_server(BOARD_SEND_QUEUE_SIZE=1, BOARD_SEND_OVERFLOW='disconnect')
+        slow = BlockingWebSocket(0.05)
+        other = FakeWebSocket()
+        server.register(slow)
+        server.register(other)
+        server.send_all('0')
+        # The writer of `slow` is blocked in writing '0'
+        gevent.sleep(0.01)
+        for i in range(1, 3):
+            server.send_all(str(i))
+            gevent.sleep(0)
+        gevent.sleep(0.1)
+        self.assertEqual(slow.sent, ['0'])
+        self.assertEqual(slow.close_code, 1008)
+        self.assertEqual(other.sent, ['0', '1', '2'])
+        self.assertEqual(list(server.clients), [other])
+
+    def test_heartbeat_timeout_while_writing(self):
+        server = create_server(BOARD_HEARTBEAT_SEC=0.05)
+        ws = BlockingWebSocket(0.1)
+        client = server.register(ws)
+        client.send('message')
+        server.listen(client)
+        self.assertEqual(ws.sent, ['message'])
+        self.assertEqual(ws.close_code, 1001)
+        self.assertEqual(server.clients, {})
+
+    def test_stuck_writer_is_aborted(self):
+        server = create_server(BOARD_HEARTBEAT_SEC=0.05)
+        ws = BlockingWebSocket(10)
+        client = server.register(ws)
+        client.send('message')
+        with mock.patch.object(Client, 'CLOSE_TIMEOUT_SEC', 0.05):
+            server.listen(client)
+        self.assertTrue(client.writer.dead)
+        self.assertTrue(ws.closed)
+        self.assertIsNone(ws.close_code)
+        self.assertEqual(server.clients, {})
+
+    def test_unregister_on_error(self):
+        server = create_server()
+        ws = FakeWebSocket()
+        ws.receive = mock.Mock(side_effect=RuntimeError('Unexpected'))
+        client = server.register(ws)
+        with self.assertRaises(RuntimeError):
+            server.listen(client)
+        gevent.sleep(0)
+        self.assertEqual(server.clients, {})
+        self.assertTrue(ws.closed)
+
+class ControlFrameTestCase(unittest.TestCase):
+    """Replies to control frames from the client while the writer is busy"""
+
+    def connect(self, *frames):
+        self.server = create_server()
+        self.stream = BlockingStream(b''.join(frames), delay=0.05)
+        self.ws = DeflateWebSocket({'QUERY_STRING': ''}, self.stream, mock.Mock())
+        client = self.server.register(self.ws)
+        # The writer is writing this while frames are read
+        client.send('x' * 1000)
+        gevent.sleep(0)
+        return client
+
+    def written(self):
+        """(opcode, payload) of written short frames"""
+        return [(data[0] & 0x0f, data[2:]) for data in self.stream.written if data[1] < 126]
+
+    def test_ping(self):
+        self.connect(client_frame(b'hello', opcode=0x9), client_frame(b'ping'))
+        self.assertEqual(self.ws.receive(), 'ping')
+        gevent.sleep(0.15)
+        self.assertEqual(len(self.stream.written), 2)
+        self.assertEqual(self.written(), [(0xa, b'hello')])
+
+    def test_close(self):
+        client = self.connect(client_frame(struct.pack('!H', 1001), opcode=0x8))
+        self.server.listen(client)
+        self.assertEqual(self.server.clients, {})
+        self.assertTrue(self.ws.closed)
+        self.assertEqual(self.written(), [(0x8, struct.pack('!H', 1001))])
+
+    def test_protocol_error(self):
+        client = self.connect(client_frame(b'\x03\xe8', opcode=0x3))
+        self.server.listen(client)
+        self.assertTrue(self.ws.closed)
+        self.assertEqual(self.written(), [(0x8, struct.pack('!H', 1002))])
+
+class SubscriptionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = create_server()
+        self.everyone = FakeWebSocket()
+        self.guild_a = FakeWebSocket(query='guild=111')
+        self.guild_b = FakeWebSocket(query='guild=222&type=raid')
+        for ws in (self.everyone, self.guild_a, self.guild_b):
+            self.server.register(ws)
+        # Load from Redis before events
+        self.server.snapshot.encoded()
+
+    def received(self, ws):
+        gevent.sleep(0)
+        messages = [json.loads(data) for data in ws.sent]
+        ws.sent.clear()
+        return [(message['type'], [room['id'] for room in message['data']]) for message in messages]
+
+    def test_partial_is_routed_by_guild(self):
+        self.server.publish({'type': 'partial', 'data': [
+            generate_room('1000001', '111'),
+            generate_room('1000002', '222', 'raid'),
+            generate_room('1000003', '222', 'event'),
+        ]})
+        self.assertEqual(self.received(self.everyone), [('partial', ['1000001', '1000002', '1000003'])])
+        self.assertEqual(self.received(self.guild_a), [('partial', ['1000001'])])
+        self.assertEqual(self.received(self.guild_b), [('partial', ['1000002'])])
+
+    def test_delete_is_routed_by_known_guild(self):
+        self.server.publish({'type': 'partial', 'data': [generate_room('1000001', '111')]})
+        for ws in (self.everyone, self.guild_a, self.guild_b):
+            self.received(ws)
+
+        self.server.publish({'type': 'delete', 'data': [{'id': '1000001'}]})
+        self.assertEqual(self.received(self.everyone), [('delete', ['1000001'])])
+        self.assertEqual(self.received(self.guild_a), [('delete', ['1000001'])])
+        self.assertEqual(self.received(self.guild_b), [])
+
+    def test_delete_of_unknown_room_is_sent_to_everyone(self):
+        self.server.publish({'type': 'delete', 'data': [{'id': '1000009'}]})
+        for ws in (self.everyone, self.guild_a, self.guild_b):
+            self.assertEqual(self.received(ws), [('delete', ['1000009'])])
+
+    def test_filtered_snapshot(self):
+        self.server.publish({'type': 'partial', 'data': [
+            generate_room('1000001', '111'),
+            generate_room('1000002', '222', 'raid'),
+        ]})
+        for ws in (self.everyone, self.guild_a, self.guild_b):
+            self.received(ws)
+            self.server.send_snapshot(self.server.clients[ws])
+
+        self.assertEqual(self.received(self.everyone), [('all', ['1000001', '1000002'])])
+        self.assertEqual(self.received(self.guild_a), [('all', ['1000001'])])
+        self.assertEqual(self.received(self.guild_b), [('all', ['1000002'])])
+
+    def test_compact_clients(self):
+        compact = FakeWebSocket(query='guild=111&format=compact')
+        self.server.register(compact)
+        self.server.publish({'type': 'partial', 'data': [
+            generate_room('1000001', '111'),
+            generate_room('1000002', '222', 'raid'),
+        ]})
+        self.server.send_snapshot(self.server.clients[compact])
+        gevent.sleep(0)
+        partial, snapshot = [json.loads(data) for data in compact.sent]
+        self.assertEqual(unpack(partial['data']), [generate_room('1000001', '111')])
+        self.assertEqual(unpack(snapshot['data']), [generate_room('1000001', '111')])
+        # JSON clients of the same subscription are not affected
+        self.assertEqual(self.received(self.guild_a), [('partial', ['1000001'])])
+
+    def test_unregister(self):
+        for ws in (self.everyone, self.guild_a, self.guild_b):
+            self.server.unregister(self.server.clients[ws])
+        self.assertEqual(self.server.guilds, {})
+
+class BatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = create_server(BOARD_BATCH_WINDOW_MS=50, BOARD_BATCH_SIZE=10)
+        self.ws = FakeWebSocket()
+        self.server.register(self.ws)
+        self.server.snapshot.encoded()
+
+    def received(self):
+        gevent.sleep(0.1)
+        return [json.loads(data) for data in self.ws.sent]
+
+    def test_merged_into_one_message(self):
+        for i in range(3):
+            self.server.publish({'type': 'partial', 'data': [generate_room(str(i), '111')]})
+        self.server.publish({'type': 'delete', 'data': [{'id': '9'}]})
+        self.assertEqual(self.ws.sent, [])
+
+        messages = self.received()
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0]['type'], 'batch')
+        self.assertEqual(messages[0]['delete'], [{'id': '9'}])
+        self.assertEqual([room['id'] for room in messages[0]['data']], ['0', '1', '2'])
+
+    def test_new_room_deleted_in_window_is_dropped(self):
+        self.server.publish({'type': 'partial', 'data': [generate_room('1', '111')]})
+        self.server.publish({'type': 'delete', 'data': [{'id': '1'}]})
+        self.server.publish({'type': 'partial', 'data': [generate_room('2', '111')]})
+
+        messages = self.received()
+        self.assertEqual(messages, [{'type': 'partial', 'data': [generate_room('2', '111')], 'seq': 1}])
+
+    def test_known_room_deleted_in_window_is_deleted(self):
+        self.server.publish({'type': 'partial', 'data': [generate_room('1', '111')]})
+        self.received()
+        self.ws.sent.clear()
+
+        self.server.publish({'type': 'partial', 'data': [generate_room('1', '111')]})
+        self.server.publish({'type': 'delete', 'data': [{'id': '1'}]})
+        self.assertEqual(self.received(), [{'type': 'delete', 'data': [{'id': '1'}], 'seq': 2}])
+
+    def connect(self):
+        ws = FakeWebSocket()
+        self.server.send_snapshot(self.server.register(ws))
+        return ws
+
+    def rooms(self, ws):
+        """Rooms which the client has after applying received messages"""
+        gevent.sleep(0.1)
+        rooms = {}
+        for message in map(json.loads, ws.sent):
+            data_type = message['type']
+            if data_type == 'all':
+                rooms = {}
+            deleted = message.get('delete', []) if data_type != 'delete' else message['data']
+            for room in deleted:
+                rooms.pop(room['id'], None)
+            if data_type != 'delete':
+                rooms.update((room['id'], room) for room in message['data'])
+        return rooms
+
+    def test_client_connected_in_window(self):
+        self.server.publish({'type': 'partial', 'data': [generate_room('1000001', '111')]})
+        early = self.connect()
+        self.server.publish({'type': 'partial', 'data': [generate_room('1000002', '111')]})
+        self.server.publish({'type': 'delete', 'data': [{'id': '1000001'}]})
+        late = self.connect()
+
+        self.assertEqual(list(self.rooms(self.ws)), ['1000002'])
+        self.assertEqual(list(self.rooms(early)), ['1000002'])
+        self.assertEqual(list(self.rooms(late)), ['1000002'])
+        self.assertEqual(list(self.server.snapshot.rooms), ['1000002'])
+
+    def test_client_connected_after_reload_in_window(self):
+        self.server.publish({'type': 'partial', 'data': [generate_room('1000001', '111')]})
+        # The snapshot is reloaded from Redis, which has the new room
+        self.server.manager.get_all.return_value = [generate_room('1000001', '111')]
+        self.server.snapshot.refresh()
+        ws = self.connect()
+        self.server.publish({'type': 'delete', 'data': [{'id': '1000001'}]})
+
+        self.assertEqual(self.rooms(ws), {})
+        self.assertEqual(self.rooms(self.ws), {})
+        self.assertEqual(self.server.snapshot.rooms, {})
+
+    def test_flush_on_batch_size(self):
+        for i in range(10):
+            self.server.publish({'type': 'delete', 'data': [{'id': str(i)}]})
+        gevent.sleep(0)
+        self.assertEqual(len(self.ws.sent), 1)
+
+class ResumeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = create_server(BOARD_REPLAY_SIZE=3)
+        self.server.snapshot.encoded()
+
+    def connect(self, query=''):
+        ws = FakeWebSocket(query=query)
+        client = self.server.register(ws)
+        if not self.server.resume(client):
+            self.server.send_snapshot(client)
+        gevent.sleep(0)
+        return [json.loads(data) for data in ws.sent]
+
+    def test_snapshot_has_cursor(self):
+        self.server.publish({'type': 'partial', 'data': [generate_room('1', '111')]})
+        message, = self.connect()
+        self.assertEqual(message['type'], 'all')
+        self.assertEqual(message['seq'], 1)
+        self.assertEqual(message['epoch'], self.server.replay.epoch)
+
+    def test_missed_events_are_merged(self):
+        self.server.publish({'type': 'partial', 'data': [generate_room('1', '111')]})
+        cursor = '{}:1'.format(self.server.replay.epoch)
+        self.server.publish({'type': 'partial', 'data': [generate_room('2', '111')]})
+        self.server.publish({'type': 'partial', 'data': [generate_room('3', '222')]})
+        self.server.publish({'type': 'delete', 'data': [{'id': '1'}]})
+
+        message, = self.connect('guild=111&since=' + cursor)
+        self.assertEqual(message, {
+            'type': 'batch', 'delete': [{'id': '1'}], 'data': [generate_room('2', '111')], 'seq': 4,
+        })
+        self.assertEqual(self.server.health_status()['replay']['resumed'], 1)
+
+    def test_up_to_date(self):
+        self.server.publish({'type': 'partial', 'data': [generate_room('1', '111')]})
+        message, = self.connect('since={}:1'.format(self.server.replay.epoch))
+        self.assertEqual(message, {'type': 'batch', 'delete': [], 'data': [], 'seq': 1})
+
+    def test_snapshot_if_not_available(self):
+        for i in range(5):
+            self.server.publish({'type': 'partial', 'data': [generate_room(str(i), '111')]})
+        epoch = self.server.replay.epoch
+        for query in ('since=other:4', 'since={}:1'.format(epoch), 'since={}:9'.format(epoch), 'since=1'):
+            message, = self.connect(query)
+            self.assertEqual(message['type'], 'all', query)
+        self.assertEqual(self.connect('since={}:2'.format(epoch))[0]['type'], 'batch')
+
+        # Events might be lost while Redis is disconnected
+        self.server.replay.reset()
+        self.assertEqual(self.connect('since={}:5'.format(epoch))[0]['type'], 'all')
+
+class ListenerTestCase(unittest.TestCase):
+
+    def test_reconnect(self):
+        server = create_server()
+        server.RECONNECT_MIN_SEC = 0.01
+        failures = [redis.exceptions.ConnectionError('Connection refused')] * 2
+
+        def listen():
+            if failures:
+                raise failures.pop()
+            gevent.sleep(10)
+            yield
+
+        server.manager.redis.pubsub.return_value.listen.side_effect = listen
+        with self.assertLogs('board.server', 'WARNING'):
+            server.start()
+            gevent.sleep(0.1)
+        status = server.health_status()
+        self.assertEqual(status['status'], 'running')
+        self.assertEqual(status['reconnects'], 2)
+        # Reloaded on start and after each reconnection
+        self.assertEqual(server.manager.get_all.call_count, 3)
+        server.stop()
+        self.assertEqual(server.status, 'stopped')
+
+    def test_control_message(self):
+        server = create_server()
+        server.control_handler({'type': 'pmessage', 'data': b'{"action": "reload"}'})
+        server.manager.apply_control.assert_called_once_with({'action': 'reload'})
+
+class StreamTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = self.create_server()
+        self.ws = FakeWebSocket()
+        self.server.register(self.ws)
+
+    def create_server(self):
+        server = create_server(events='stream', BOARD_BATCH_WINDOW_MS=0, BOARD_BATCH_SIZE=2)
+        server.manager.event_ids.return_value = ('1-0', '5-0')
+
+        def listen():
+            gevent.sleep(10)
+            yield
+
+        server.manager.redis.pubsub.return_value.listen.side_effect = listen
+        return server
+
+    def read(self, *replies, server=None):
+        """Let the reader receive `replies` of XREAD, then wait forever"""
+        server = server or self.server
+        replies = list(replies)
+
+        def read_events(last_id, count=100, block=None):
+            if replies:
+                reply = replies.pop(0)
+                if isinstance(reply, Exception):
+                    raise reply
+                return reply
+            gevent.sleep(10)
+            return []
+
+        server.manager.read_events.side_effect = read_events
+        server.RECONNECT_MIN_SEC = 0.01
+        server.start()
+        gevent.sleep(0.1)
+        server.stop()
+        return [json.loads(data) for data in self.ws.sent]
+
+    def test_events_are_read_from_last_id(self):
+        messages = self.read([('6-0', {'type': 'partial', 'data': [generate_room('1', '111')]})])
+        self.assertEqual([message['type'] for message in messages], ['partial'])
+        self.assertEqual(self.server.health_status()['stream']['last_id'], '6-0')
+        self.server.manager.read_events.assert_any_call('5-0', count=2, block=5000)
+        # Only control messages are subscribed
+        patterns = self.server.pubsub.psubscribe.call_args[1]
+        self.assertEqual(list(patterns), ['board-control'])
+
+    def test_resync_if_trimmed(self):
+        # The first ID is after 5-0, the last read ID, when reconnected
+        self.server.manager.event_ids.side_effect = [('1-0', '5-0'), ('7-0', '9-0')]
+        with self.assertLogs('board.server', 'WARNING'):
+            messages = self.read(
+                redis.exceptions.ConnectionError('Connection refused'),
+                [('9-0', {'type': 'delete', 'data': [{'id': '1'}]})],
+            )
+        self.assertEqual(self.server.stream_stats['resyncs'], 1)
+        self.assertEqual([message['type'] for message in messages], ['all', 'delete'])
+
+        # Clients which were on the gap cannot resume
+        self.assertIsNone(self.server.replay.since(('room:events', '5-0')))
+        self.assertIsNotNone(self.server.replay.since(('room:events', '9-0')))
+
+    def test_malformed_entries_are_skipped(self):
+        messages = self.read([
+            ('6-0', None),
+            ('7-0', {'type': 'partial', 'data': [generate_room('1', '111')]}),
+            ('8-0', None),
+        ])
+        self.assertEqual([message['seq'] for message in messages], ['7-0'])
+        self.assertEqual(self.server.stream_stats['skipped'], 2)
+        self.assertEqual(self.server.stream_stats['last_id'], '8-0')
+
+    def test_retry_on_redis_error(self):
+        with self.assertLogs('board.server', 'WARNING'):
+            messages = self.read(
+                redis.exceptions.ResponseError('WRONGTYPE Operation against a key'),
+                [('6-0', {'type': 'partial', 'data': [generate_room('1', '111')]})],
+            )
+        self.assertEqual([message['type'] for message in messages], ['partial'])
+
+    def test_failed_if_reader_dies(self):
+        self.server.manager.read_events.side_effect = RuntimeError('Unexpected')
+        with self.assertLogs('board.server', 'ERROR'):
+            self.server.start()
+            gevent.sleep(0.05)
+        status = self.server.health_status()
+        self.assertEqual(status['status'], 'failed')
+        self.assertFalse(status['stream']['running'])
+        self.assertIn('Unexpected', status['last_error'])
+        self.server.stop()
+        self.assertEqual(self.server.status, 'stopped')
+
+    def test_resume_on_other_worker(self):
+        events = [
+            ('6-0', {'type': 'partial', 'data': [generate_room('1', '111')]}),
+            ('7-0', {'type': 'partial', 'data': [generate_room('2', '111')]}),
+        ]
+        messages = self.read(events[:1], events[1:])
+        self.assertEqual([message['seq'] for message in messages], ['6-0', '7-0'])
+
+        # The other worker read both events at once
+        other = self.create_server()
+        self.read(events, server=other)
+        ws = FakeWebSocket(query='since=room%3Aevents%3A6-0')
+        client = other.register(ws)
+        self.assertTrue(other.resume(client))
+        gevent.sleep(0)
+        self.assertEqual(json.loads(ws.sent[0]), {
+            'type': 'batch', 'delete': [], 'data': [generate_room('2', '111')], 'seq': '7-0',
+        })
+
+        # Before the worker started, or not read by it yet
+        for seq in ('4-0', '8-0'):
+            client = other.register(FakeWebSocket(query='since=room%3Aevents%3A' + seq))
+            self.assertFalse(other.resume(client), seq)
+
+class SweeperTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = create_server(BOARD_SWEEPER_TICK_MS=20, BOARD_SWEEPER_BATCH=2)
+        self.server.manager.sweep.side_effect = [(2, 0.5), (1, 0.1)] + [(0, 0)] * 100
+
+    def run_sweeper(self):
+        sweeper = gevent.spawn(self.server._sweep_loop)
+        gevent.sleep(0.05)
+        sweeper.kill()
+        return self.server.sweeper_stats
+
+    def test_sweep_until_no_more_due(self):
+        self.server.manager.acquire_lock.return_value = True
+        stats = self.run_sweeper()
+        self.assertEqual(stats['swept'], 3)
+        self.assertEqual(stats['max_lag'], 0.5)
+        self.server.manager.sweep.assert_called_with(2)
+        name, _, ttl = self.server.manager.acquire_lock.call_args[0]
+        self.assertEqual((name, ttl), ('sweeper', 0.02))
+
+    def test_swept_by_other_worker(self):
+        self.server.manager.acquire_lock.return_value = False
+        stats = self.run_sweeper()
+        self.server.manager.sweep.assert_not_called()
+        self.assertGreater(stats['skipped'], 0)
+
+class NotificationModeTestCase(RedisTestCase):
+    """Clients must receive the same events whether delete events are
+    published by BoardManager or by keyspace notifications."""
+
+    def run_manager(self, **config):
+        """Frames sent to a client while rooms are saved and destroyed"""
+        self.client.flushdb()
+        manager = self.create_manager(**config)
+        app = mock.Mock()
+        app.config = {'BOARD_BATCH_WINDOW_MS': 0}
+        server = PubSubServer(app, manager)
+        server.snapshot.refresh()
+        ws = FakeWebSocket()
+        server.register(ws)
+        server._subscribe()
+        self.addCleanup(server.pubsub.close)
+
+        # The owner posts a room, replaces it with another and deletes it
+        for room_id, owner in (('1111111', '12345'), ('2222222', '12345'), ('3333333', '67890')):
+            self.save(room_id, owner, manager=manager)
+        manager.destroy(generate_data('2222222'))
+
+        deadline = time.monotonic() + 0.3
+        while time.monotonic() < deadline:
+            # Messages are passed to handlers
+            server.pubsub.get_message(timeout=0.05)
+        gevent.sleep(0)
+        return manager, [json.loads(data) for data in ws.sent]
+
+    def test_same_events(self):
+        for storage in ('keys', 'index'):
+            with self.subTest(storage=storage):
+                manager, published = self.run_manager(notifications='off', storage=storage)
+                self.assertFalse(manager.notifications_available)
+                manager, notified = self.run_manager(notifications='auto', storage=storage)
+                self.assertTrue(manager.notifications_available)
+
+                self.assertEqual([message['type'] for message in published], [
+                    'partial', 'delete', 'partial', 'partial', 'delete',
+                ])
+                self.assertEqual(published, notified)
+
+class KeyeventSubscriptionTestCase(unittest.TestCase):
+
+    def test_keyevents_are_subscribed_only_if_available(self):
+        for available in (False, True):
+            server = create_server(notifications_available=available)
+            server._subscribe()
+            patterns = server.pubsub.psubscribe.call_args[1]
+            self.assertEqual('__keyevent@0__:*' in patterns, available)
@@ -0,0 +1,66 @@
+import json
+import unittest
+from unittest import mock
+
+from board.snapshot import Snapshot
+
+def generate_room(room_id, owner='12345'):
+    return {
+        'id': room_id,
+        'owner': {'id': owner, 'name': 'name'},
+        'guild': {'id': '54321', 'name': 'team A'},
+        'time': 1499794027,
+    }
+
+class SnapshotTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = mock.Mock(expire_sec=120)
+        self.manager.get_all.return_value = [generate_room('1111111')]
+        self.snapshot = Snapshot(self.manager, ttl=30)
+
+    def decoded(self):
+        return json.loads(self.snapshot.encoded())
+
+    def test_initial_load(self):
+        message = self.decoded()
+        self.assertEqual(message['type'], 'all')
+        self.assertEqual([room['id'] for room in message['data']], ['1111111'])
+        self.manager.get_all.assert_called_once_with()
+
+    def test_cached_until_changed(self):
+        first = self.snapshot.encoded()
+        version = self.snapshot.version
+        self.assertIs(self.snapshot.encoded(), first)
+        self.assertEqual(self.snapshot.version, version)
+        self.manager.get_all.assert_called_once_with()
+
+    def test_apply_events(self):
+        self.snapshot.encoded()
+        version = self.snapshot.version
+        self.snapshot.apply({'type': 'partial', 'data': [generate_room('2222222')]})
+        self.snapshot.apply({'type': 'delete', 'data': [{'id': '1111111'}]})
+
+        self.assertEqual(self.snapshot.version, version + 2)
+        self.assertEqual([room['id'] for room in self.decoded()['data']], ['2222222'])
+        self.manager.get_all.assert_called_once_with()
+
+    def test_unknown_event_is_ignored(self):
+        self.snapshot.encoded()
+        version = self.snapshot.version
+        self.snapshot.apply({'type': 'unknown', 'data': []})
+        self.assertEqual(self.snapshot.version, version)
+
+    def test_reload_after_ttl(self):
+        with mock.patch('board.snapshot.time.monotonic', return_value=1000):
+            self.snapshot.encoded()
+        with mock.patch('board.snapshot.time.monotonic', return_value=1031):
+            self.snapshot.encoded()
+        self.assertEqual(self.manager.get_all.call_count, 2)
+
+    def test_prune_expired(self):
+        with mock.patch('board.snapshot.time.monotonic', return_value=1000):
+            self.snapshot.ttl = None
+            self.snapshot.encoded()
+        with mock.patch('board.snapshot.time.monotonic', return_value=1121):
+            self.assertEqual(self.decoded()['data'], [])
@@ -3,7 +3,8 @@ import datetime
 
 from ddt import ddt, data, unpack
 
-from board.manager import DefaultValidator
+from board.manager import DefaultValidator, compile_validators
+from plugins.example import Parser
 
 def generate_data(override=None, remove=None):
     data = {
@@ -68,6 +69,16 @@ class ValidatorTestCase(unittest.TestCase):
             DefaultValidator.validate(data)
         self.assertEqual(cm.exception.args[0], expected)
 
+    @data(
+        generate_data({'owner': 'x'}),
+        generate_data({'guild': ['54321']}),
+        generate_data({'time': [1499794027]}),
+        generate_data({'time': {'at': 1499794027}}),
+    )
+    def test_wrong_types(self, data):
+        with self.assertRaises(ValueError):
+            DefaultValidator.validate(data)
+
     def test_time_aware(self):
         utc = datetime.datetime.fromisoformat("2017-07-11T17:27:07.299000+00:00")
         local = datetime.datetime.fromisoformat("2017-07-11T18:27:07.299000+01:00")
@@ -117,3 +128,36 @@ class ValidatorTestCase(unittest.TestCase):
         data = generate_data({'time': 'Not a time'})
         with self.assertRaises(ValueError):
             cleaned = DefaultValidator.validate(data)
+
+class CompiledValidatorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.validate = compile_validators([DefaultValidator(), Parser()])
+
+    def test_chain(self):
+        data = generate_data({'id': '123-4567', 'message': 'hello'})
+        cleaned = self.validate(data)
+        self.assertEqual(cleaned['id'], '1234567')
+        self.assertEqual(cleaned['message'], 'hello')
+        self.assertEqual(cleaned['owner'], data['owner'])
+
+    def test_same_as_validators(self):
+        data = generate_data({'id': '1234567', 'time': '1499794027'})
+        expected = DefaultValidator.validate(data)
+        expected.update(Parser().validate(data, expected))
+        self.assertEqual(self.validate(data), expected)
+
+    def test_first_error_stops_chain(self):
+        data = generate_data({'id': 'invalid'}, remove=('guild',))
+        with self.assertRaises(ValueError) as cm:
+            self.validate(data)
+        self.assertEqual(cm.exception.args[0], 'guild.id must not be empty.')
+
+    def test_plugin_error(self):
+        with self.assertRaises(ValueError) as cm:
+            self.validate(generate_data({'id': 'invalid'}))
+        self.assertEqual(cm.exception.args[0], 'id must be 7 length digits.')
+
+    def test_not_object(self):
+        with self.assertRaises(ValueError):
+            self.validate([generate_data()])
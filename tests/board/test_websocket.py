@@ -0,0 +1,134 @@
+import io
+import os
+import struct
+import unittest
+import zlib
+from unittest import mock
+
+from ddt import ddt, data, unpack
+from geventwebsocket.exceptions import ProtocolError
+
+from board.websocket import Deflate, DeflateWebSocket, Frame, negotiate_deflate, DEFLATE_RESPONSE
+
+class FakeStream:
+    def __init__(self, data=b''):
+        self.buffer = io.BytesIO(data)
+        self.written = []
+
+    def read(self, size):
+        return self.buffer.read(size)
+
+    def write(self, data):
+        self.written.append(data)
+
+def deflate_payload(payload):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return (compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH))[:-4]
+
+def inflate_payload(payload):
+    return zlib.decompressobj(-zlib.MAX_WBITS).decompress(payload + b'\x00\x00\xff\xff')
+
+def client_frame(payload, opcode=0x1, fin=True, compressed=False):
+    """Masked frame from a browser"""
+    mask = os.urandom(4)
+    first = opcode | (0x80 if fin else 0) | (0x40 if compressed else 0)
+    masked = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+    return bytes([first, 0x80 | len(payload)]) + mask + masked
+
+def split_frame(data):
+    """(flags byte, payload) of a short unmasked frame"""
+    return data[0], data[2:2 + (data[1] & 0x7f)]
+
+@ddt
+class NegotiateTestCase(unittest.TestCase):
+
+    @data(
+        ('permessage-deflate', True),
+        ('permessage-deflate; client_max_window_bits', True),
+        ('permessage-deflate; server_max_window_bits=15; client_no_context_takeover', True),
+        ('x-webkit-deflate-frame, permessage-deflate', True),
+        ('permessage-deflate; server_max_window_bits=10', False),
+        ('permessage-deflate; server_max_window_bits=10, permessage-deflate', True),
+        ('permessage-deflate; unknown_param', False),
+        ('x-webkit-deflate-frame', False),
+        ('', False),
+        (None, False),
+    )
+    @unpack
+    def test_offers(self, extensions, accepted):
+        self.assertEqual(negotiate_deflate(extensions), DEFLATE_RESPONSE if accepted else None)
+
+class FrameTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.deflate = Deflate(level=6, min_size=64)
+        self.text = '{"type": "partial", "data": [' + ', '.join(['{"id": "1000001"}'] * 20) + ']}'
+
+    def test_shared_compressed_frame(self):
+        frame = Frame(self.text)
+        plain = mock.Mock(closed=False, deflate=False)
+        compressed = [mock.Mock(closed=False, deflate=True) for i in range(3)]
+        for ws in [plain] + compressed:
+            frame.send_to(ws, self.deflate)
+
+        self.assertEqual(plain.raw_write.call_args[0][0], frame.data)
+        flags, payload = split_frame(compressed[0].raw_write.call_args[0][0])
+        self.assertEqual(flags, 0x80 | 0x40 | 0x1)
+        self.assertEqual(inflate_payload(payload).decode('utf-8'), self.text)
+        for ws in compressed:
+            self.assertIs(ws.raw_write.call_args[0][0], frame.deflated)
+        self.assertEqual(self.deflate.stats['messages'], 1)
+        self.assertLess(self.deflate.stats['deflated_bytes'], self.deflate.stats['raw_bytes'])
+
+    def test_small_frames(self):
+        frame = Frame('{"type": "pong"}')
+        ws = mock.Mock(closed=False, deflate=True)
+        frame.send_to(ws, self.deflate)
+        self.assertEqual(ws.raw_write.call_args[0][0], frame.data)
+        self.assertEqual(self.deflate.stats['skipped'], 1)
+
+    def test_control_frames(self):
+        frame = Frame(struct.pack('!H', 1013) + b'x' * 100, 0x8)
+        ws = mock.Mock(closed=False, deflate=True)
+        frame.send_to(ws, self.deflate)
+        self.assertEqual(ws.raw_write.call_args[0][0], frame.data)
+
+class DeflateWebSocketTestCase(unittest.TestCase):
+
+    def create_websocket(self, data, deflate=True):
+        return DeflateWebSocket({}, FakeStream(data), mock.Mock(), deflate=deflate)
+
+    def test_compressed_message(self):
+        ws = self.create_websocket(client_frame(deflate_payload(b'ping'), compressed=True))
+        self.assertEqual(ws.receive(), 'ping')
+
+    def test_fragmented_message(self):
+        payload = deflate_payload('真ミド 初心者歓迎'.encode('utf-8'))
+        ws = self.create_websocket(
+            client_frame(payload[:5], fin=False, compressed=True)
+            + client_frame(b'', opcode=0x9)
+            + client_frame(payload[5:], opcode=0x0)
+        )
+        self.assertEqual(ws.receive(), '真ミド 初心者歓迎')
+        # Pong of the ping between fragments
+        self.assertEqual(split_frame(ws.stream.written[0])[0], 0x80 | 0xA)
+
+    def test_plain_message(self):
+        ws = self.create_websocket(client_frame(b'ping'))
+        self.assertEqual(ws.receive(), 'ping')
+
+    def test_not_negotiated(self):
+        ws = self.create_websocket(client_frame(deflate_payload(b'ping'), compressed=True), deflate=False)
+        with self.assertRaises(ProtocolError):
+            ws.read_frame()
+
+    def test_compressed_control_frame(self):
+        ws = self.create_websocket(client_frame(deflate_payload(b'ping'), opcode=0x9, compressed=True))
+        with self.assertRaises(ProtocolError):
+            ws.read_frame()
+
+    def test_too_large(self):
+        ws = self.create_websocket(client_frame(deflate_payload(b'x' * 100), compressed=True))
+        ws.MAX_MESSAGE_SIZE = 16
+        with self.assertRaises(ProtocolError):
+            ws.read_frame()
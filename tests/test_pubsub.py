@@ -0,0 +1,75 @@
+import importlib
+import json
+import os
+from unittest import mock
+
+from .board.test_manager import REDIS_URL, RedisTestCase, generate_data
+
+SECRET = 'secret'
+
+def import_app():
+    """pubsub module with /party enabled.
+    Logging of the test process is not reconfigured."""
+    environ = {'REDIS_URL': REDIS_URL, 'BACKEND_SECRET': SECRET, 'BOARD_NOTIFICATIONS': 'off'}
+    with mock.patch.dict(os.environ, environ):
+        import config
+        with mock.patch.object(config, 'flask_logging_config'):
+            return importlib.import_module('pubsub')
+
+class BulkBackendTestCase(RedisTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app = import_app()
+        self.http = self.app.app.test_client()
+        self.pubsub = self.subscribe()
+
+    def post(self, **kwargs):
+        response = self.http.post('/party', headers={'X-Authorization-Token': SECRET}, **kwargs)
+        return response.status_code, response.get_json()
+
+    def test_mixed_items(self):
+        status, body = self.post(json=[
+            generate_data('1111111', owner='1'),
+            dict(generate_data('2222222'), owner='x'),
+            dict(generate_data('3333333'), time=[1499794027]),
+            generate_data('invalid'),
+            generate_data('4444444', owner='2'),
+            generate_data('5555555', owner='1'),
+            'not an object',
+        ])
+        self.assertEqual(status, 200)
+        self.assertEqual(body['accepted'], 2)
+        self.assertEqual(
+            [result['status'] for result in body['results']],
+            ['replaced', 'error', 'error', 'error', 'ok', 'ok', 'error'],
+        )
+        self.assertEqual(body['results'][1]['error'], 'owner must be an object.')
+        self.assertEqual(body['results'][2]['error'], 'time is not a valid time')
+
+        events = self.events(self.pubsub)
+        self.assertEqual(len(events), 1)
+        self.assertEqual([room['id'] for room in events[0]['data']], ['4444444', '5555555'])
+        self.assertEqual(
+            sorted(room['id'] for room in self.manager.get_all()), ['4444444', '5555555']
+        )
+
+    def test_ndjson(self):
+        lines = [json.dumps(generate_data('1111111')), '', '{"broken', json.dumps(generate_data('2222222', '2'))]
+        status, body = self.post(data='\n'.join(lines), content_type='application/x-ndjson')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['accepted'], 2)
+        self.assertEqual(
+            [(result['index'], result['status']) for result in body['results']],
+            [(0, 'ok'), (1, 'error'), (2, 'ok')],
+        )
+        self.assertEqual(len(self.events(self.pubsub)), 1)
+
+    def test_empty_array(self):
+        self.assertEqual(self.post(json=[]), (200, {'accepted': 0, 'results': []}))
+        self.assertEqual(self.events(self.pubsub), [])
+
+    def test_single_room(self):
+        status, _ = self.post(json=generate_data('1111111'))
+        self.assertEqual(status, 200)
+        self.assertEqual(self.post(json={})[0], 400)
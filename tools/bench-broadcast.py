@@ -0,0 +1,60 @@
+"""Compare broadcast costs of `WebSocket.send` and pre-encoded `Frame`.
+Sockets are fake, so only the encoding work on the server is measured.
+
+    python tools/bench-broadcast.py [clients] [rooms]
+"""
+import sys
+import json
+import pathlib
+import timeit
+
+APP_ROOT = pathlib.Path(__file__, '../../').resolve()
+sys.path.append(str(APP_ROOT))
+
+from geventwebsocket.websocket import WebSocket
+
+from board.websocket import Frame
+
+class NullStream:
+    def __init__(self):
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+
+    def read(self, size):
+        return b''
+
+def generate_message(rooms):
+    data = [
+        {
+            'id': str(1000000 + i),
+            'time': 1499794027 + i,
+            'message': '真ミド 初心者歓迎 {}'.format(i),
+            'owner': {'id': str(80351110224678912 + i), 'name': 'ユーザー{}'.format(i)},
+            'guild': {'id': '54321', 'name': 'マルチ募集サーバー'},
+        }
+        for i in range(rooms)
+    ]
+    return json.dumps({'type': 'partial', 'data': data})
+
+def send_text(sockets, message):
+    for ws in sockets:
+        ws.send(message)
+
+def send_frame(sockets, message):
+    frame = Frame(message)
+    for ws in sockets:
+        frame.send_to(ws)
+
+if __name__ == '__main__':
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rooms = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    message = generate_message(rooms)
+    sockets = [WebSocket({}, NullStream(), None) for _ in range(clients)]
+
+    print('{} clients, {} bytes per message'.format(clients, len(message.encode('utf-8'))))
+    for func in (send_text, send_frame):
+        number = 20
+        elapsed = timeit.timeit(lambda: func(sockets, message), number=number)
+        print('{:>10}: {:8.2f} ms per broadcast'.format(func.__name__, elapsed / number * 1000))
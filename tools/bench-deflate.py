@@ -0,0 +1,68 @@
+"""Compare permessage-deflate levels for board messages.
+Each message is compressed once per broadcast and shared by all clients,
+so the CPU cost does not grow with clients, but bandwidth does.
+
+    python tools/bench-deflate.py [rooms] [clients]
+
+Reported for each message, encoding and level:
+    bytes: payload written to each client
+    compress: server time per message
+    inflate: zlib time per message, as a rough client cost
+    per broadcast: bytes written to all clients
+"""
+import sys
+import pathlib
+import timeit
+import zlib
+
+APP_ROOT = pathlib.Path(__file__, '../../').resolve()
+sys.path.append(str(APP_ROOT))
+
+from board.encoding import dumps
+from board.websocket import Deflate, DEFLATE_TAIL
+
+def generate_rooms(rooms, guilds):
+    return [
+        {
+            'id': str(1000000 + i),
+            'time': 1499794027 + i,
+            'message': '真ミド 初心者歓迎 {}'.format(i),
+            'owner': {'id': str(80351110224678912 + i), 'name': 'ユーザー{}'.format(i)},
+            'guild': {'id': str(54321000000000000 + i % guilds), 'name': 'マルチ募集サーバー{}'.format(i % guilds)},
+            'type': ['ミド', 'ムム', 'マキュ'][i % 3],
+        }
+        for i in range(rooms)
+    ]
+
+def inflate(data):
+    return zlib.decompressobj(-zlib.MAX_WBITS).decompress(data + DEFLATE_TAIL)
+
+if __name__ == '__main__':
+    rooms = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    data = generate_rooms(rooms, 5)
+    messages = {
+        'all ({} rooms)'.format(rooms): {'type': 'all', 'data': data, 'seq': 1, 'epoch': '0a1b2c3d'},
+        'partial (1 room)': {'type': 'partial', 'data': data[:1], 'seq': 2},
+    }
+
+    print('{} clients'.format(clients))
+    for name, message in messages.items():
+        print(name)
+        for encoding in ('json', 'compact'):
+            payload = dumps(message, encoding).encode('utf-8')
+            print('  {:>8} level -: {:7d} bytes, per broadcast {:8.1f} KB'.format(
+                encoding, len(payload), len(payload) * clients / 1024
+            ))
+            for level in (1, 6, 9):
+                deflate = Deflate(level, min_size=0)
+                compressed = deflate.compress(payload)
+                assert inflate(compressed) == payload
+                number = 50
+                compress_sec = timeit.timeit(lambda: deflate.compress(payload), number=number) / number
+                inflate_sec = timeit.timeit(lambda: inflate(compressed), number=number) / number
+                print('  {:>8} level {}: {:7d} bytes, per broadcast {:8.1f} KB, '
+                      'compress {:5.2f} ms, inflate {:5.2f} ms'.format(
+                    encoding, level, len(compressed), len(compressed) * clients / 1024,
+                    compress_sec * 1000, inflate_sec * 1000,
+                ))
@@ -0,0 +1,63 @@
+"""Compare sizes and encoding costs of 'json' and 'compact' messages.
+Rooms look like posts of a few busy guilds, as tools/random-post.py makes.
+
+    python tools/bench-encoding.py [rooms] [guilds]
+
+Reported for each encoding:
+    bytes: size of the `all` snapshot
+    deflated: size after zlib, for reference with compressing proxies
+    encode: server time per message (once per broadcast and subscription)
+    decode: json.loads and `unpack()` in Python, as a rough client cost
+"""
+import sys
+import json
+import pathlib
+import random
+import timeit
+import zlib
+
+APP_ROOT = pathlib.Path(__file__, '../../').resolve()
+sys.path.append(str(APP_ROOT))
+
+from board.encoding import dumps, unpack
+
+def generate_rooms(rooms, guilds):
+    random.seed(0)
+    guilds = [
+        {'id': str(54321000000000000 + i), 'name': 'マルチ募集サーバー{}'.format(i)}
+        for i in range(guilds)
+    ]
+    return [
+        {
+            'id': str(1000000 + i),
+            'time': 1499794027 + i,
+            'message': '真ミド 初心者歓迎 {}'.format(i),
+            'owner': {'id': str(80351110224678912 + i), 'name': 'ユーザー{}'.format(i)},
+            'guild': random.choice(guilds),
+            'type': random.choice(['ミド', 'ムム', 'マキュ']),
+        }
+        for i in range(rooms)
+    ]
+
+def decode(text):
+    message = json.loads(text)
+    if isinstance(message['data'], dict):
+        message['data'] = unpack(message['data'])
+    return message
+
+if __name__ == '__main__':
+    rooms = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    guilds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    message = {'type': 'all', 'data': generate_rooms(rooms, guilds), 'seq': 1, 'epoch': '0a1b2c3d'}
+
+    print('{} rooms in {} guilds'.format(rooms, guilds))
+    for encoding in ('json', 'compact'):
+        payload = dumps(message, encoding).encode('utf-8')
+        assert decode(payload)['data'] == message['data']
+        number = 50
+        encode_sec = timeit.timeit(lambda: dumps(message, encoding), number=number) / number
+        decode_sec = timeit.timeit(lambda: decode(payload), number=number) / number
+        print('{:>8}: {:7d} bytes, deflated {:6d} bytes, encode {:6.2f} ms, decode {:6.2f} ms'.format(
+            encoding, len(payload), len(zlib.compress(payload)),
+            encode_sec * 1000, decode_sec * 1000,
+        ))
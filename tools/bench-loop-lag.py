@@ -0,0 +1,81 @@
+"""Event loop lag of the discord bot under a burst of posts.
+
+A ticker coroutine stands in for the gateway heartbeat.  Posts are saved
+with blocking `BoardManager.save` and with `AsyncBoardManager.save`.
+Requires a running Redis at REDIS_URL.  Rooms are written with prefix
+'bench' and expire in a few seconds.  Keyspace notifications are not
+touched.  `workers` is the size of the thread pool (BOARD_BOT_WORKERS).
+
+The executor hides the round trips to Redis, but the threads parse
+replies while holding the GIL.  Measure against a Redis as far away as
+the production one: on the same host the gain is small and noisy, and
+more workers make the loop lag worse.
+
+    REDIS_URL=redis://127.0.0.1:6379 python tools/bench-loop-lag.py [posts] [workers]
+"""
+import os
+import sys
+import time
+import asyncio
+import pathlib
+
+APP_ROOT = pathlib.Path(__file__, '../../').resolve()
+sys.path.append(str(APP_ROOT))
+
+from board.aio import AsyncBoardManager
+from board.manager import BoardManager
+
+TICK_SEC = 0.01
+
+def generate_room(i):
+    return {
+        'id': '{:07d}'.format(i),
+        'owner': {'id': str(i), 'name': 'bench'},
+        'guild': {'id': 'bench'},
+        'message': 'bench',
+    }
+
+async def ticker(lags, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK_SEC)
+        lags.append(time.perf_counter() - started - TICK_SEC)
+
+async def burst(save, posts):
+    lags = []
+    stop = asyncio.Event()
+    tick = asyncio.ensure_future(ticker(lags, stop))
+    await asyncio.sleep(TICK_SEC * 2)
+    started = time.perf_counter()
+    await asyncio.gather(*[save(i) for i in range(posts)])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await tick
+    return elapsed, max(lags)
+
+def main(posts, workers):
+    manager = BoardManager(os.environ['REDIS_URL'], {
+        'plugin': 'plugins.example', 'prefix': 'bench', 'expire_sec': 5,
+        'redis_max_connections': 8, 'notifications': 'off',
+    })
+    async_manager = AsyncBoardManager(manager, max_workers=workers)
+
+    async def blocking_save(i):
+        manager.save(manager.validate(generate_room(i)))
+
+    async def async_save(i):
+        await async_manager.save(manager.validate(generate_room(i)))
+
+    loop = asyncio.get_event_loop()
+    for name, save in [('blocking', blocking_save), ('executor', async_save)]:
+        elapsed, max_lag = loop.run_until_complete(burst(save, posts))
+        print('{:>10}: {} posts in {:7.1f} ms, max loop lag {:7.1f} ms'.format(
+            name, posts, elapsed * 1000, max_lag * 1000
+        ))
+    async_manager.close()
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 4,
+    )
@@ -0,0 +1,70 @@
+"""Messages parsed per second by a parser plugin.
+
+Compare calling `parse_content` for every message with `LoadedPlugin.parse`,
+the path of `BoardManager.parse`, with and without the parse cache.
+Messages are read from tools/parse-corpus.txt, one per line, and measured
+separately for repeated rooms (e.g. edits), new rooms with unique IDs and
+other chat.  PREFILTER can be given as JSON to try one.
+
+The cache is off by default (`parse_cache_size`), because a lookup costs
+more than the regex of the example plugin, and only repeated contents
+are found.  Enable it for plugins whose `parse_content` is slower.
+
+    python tools/bench-parse.py [plugin] [corpus] [prefilter]
+"""
+import sys
+import json
+import time
+import random
+import pathlib
+import importlib
+
+APP_ROOT = pathlib.Path(__file__, '../../').resolve()
+sys.path.append(str(APP_ROOT))
+
+from board.manager import PluginRegistry
+
+def loaded(plugin, cache_size):
+    """`LoadedPlugin.parse` as built by BoardManager"""
+    registry = PluginRegistry(cache_size=cache_size)
+    registry.load(plugin)
+    return registry.for_guild().parse
+
+def measure(parse, messages, seconds=1.0):
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        for content in messages:
+            parse(content)
+        count += len(messages)
+    return count / (time.perf_counter() - started)
+
+def unique_rooms(rooms, count=100000):
+    """Rooms with random IDs, which are never found in the cache"""
+    return [
+        '{:07d}{}'.format(random.randrange(10 ** 7), rooms[i % len(rooms)][7:])
+        for i in range(count)
+    ]
+
+if __name__ == '__main__':
+    plugin = importlib.import_module(sys.argv[1] if len(sys.argv) > 1 else 'plugins.example')
+    corpus = pathlib.Path(sys.argv[2] if len(sys.argv) > 2 else APP_ROOT / 'tools/parse-corpus.txt')
+    messages = corpus.read_text(encoding='utf-8').splitlines()
+    if len(sys.argv) > 3:
+        plugin.Parser.PREFILTER = json.loads(sys.argv[3])
+    parser = plugin.Parser()
+
+    rooms = [content for content in messages if parser.parse_content(content)]
+    others = [content for content in messages if not parser.parse_content(content)]
+    new_rooms = unique_rooms([content for content in rooms if content[:7].isdigit()])
+    print('{} rooms, {} others, prefilter: {}'.format(
+        len(rooms), len(others), getattr(parser, 'PREFILTER', None)
+    ))
+    for name, parse in [
+        ('plain', parser.parse_content),
+        ('no cache', loaded(plugin, 0)),
+        ('cache 256', loaded(plugin, 256)),
+    ]:
+        print('{:>10}: {:10,.0f} repeated/sec {:10,.0f} new rooms/sec {:10,.0f} others/sec'.format(
+            name, measure(parse, rooms), measure(parse, new_rooms), measure(parse, others)
+        ))
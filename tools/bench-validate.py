@@ -0,0 +1,68 @@
+"""Validations per second of /party payloads.
+
+Compare `compile_validators` with the previous loop which called
+`validate(data, cleaned)` of each validator and merged the results.
+
+    python tools/bench-validate.py [plugin]
+"""
+import sys
+import time
+import pathlib
+import importlib
+
+APP_ROOT = pathlib.Path(__file__, '../../').resolve()
+sys.path.append(str(APP_ROOT))
+
+from board.manager import DefaultValidator, compile_validators
+
+PAYLOADS = [
+    {
+        'id': '123-4567',
+        'time': 1499794027,
+        'message': '真ミド 初心者歓迎',
+        'owner': {'id': 80351110224678912, 'name': 'ユーザー'},
+        'guild': {'id': '54321', 'name': 'マルチ募集サーバー'},
+    },
+    {
+        'id': '7654321',
+        'time': '1499794027',
+        'message': 'x' * 100,
+        'owner': {'id': '80351110224678913', 'name': 'n' * 100},
+        'guild': {'id': 54322},
+    },
+    # Rejected at the first field
+    {
+        'id': '1234567',
+        'guild': {'id': '54321'},
+    },
+]
+
+def merge_loop(validators):
+    def validate(data):
+        cleaned = {}
+        for validator in validators:
+            cleaned.update(validator.validate(data, cleaned))
+        return cleaned
+    return validate
+
+def measure(validate, seconds=1.0):
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        for data in PAYLOADS:
+            try:
+                validate(data)
+            except ValueError:
+                pass
+        count += len(PAYLOADS)
+    return count / (time.perf_counter() - started)
+
+if __name__ == '__main__':
+    plugin = importlib.import_module(sys.argv[1] if len(sys.argv) > 1 else 'plugins.example')
+    validators = [DefaultValidator(), plugin.Parser()]
+
+    for name, validate in [
+        ('loop', merge_loop(validators)),
+        ('compiled', compile_validators(validators)),
+    ]:
+        print('{:>10}: {:10,.0f} validations/sec'.format(name, measure(validate)))
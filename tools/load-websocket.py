@@ -0,0 +1,201 @@
+"""Open many WebSocket clients against /room and report how many are served.
+
+Clients are plain gevent sockets speaking just enough of RFC 6455, so
+thousands fit in one process.  Run it for 1, 2, 4... workers to see how
+capacity grows, e.g. with BOARD_MAX_CLIENTS set to the per-worker limit.
+
+    [REDIS_URL=...] python tools/load-websocket.py ws://127.0.0.1:8000/room [clients] [seconds] [deflate]
+
+Clients are held for `seconds` after all of them connected or failed.
+Pass 'deflate' to offer permessage-deflate, as browsers do.  If REDIS_URL
+is set, PUBLISH_RATE partial events per second (default 100) are
+published to the channel of the server in the meantime.  Workers merge
+events for BOARD_BATCH_WINDOW_MS, so a client receives fewer messages.
+
+Reported:
+    connected: clients which received the first snapshot
+    refused: clients closed with 1013 by a full worker
+    failed: connection errors and timeouts
+    snapshot p50/p99: time until the first snapshot arrived
+    snapshot bytes: payload of the first snapshot on the wire and inflated
+    events: events published per second
+    delivered: messages received by all clients per second, and per client
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import os
+import sys
+import time
+import base64
+import socket
+import struct
+import urllib.parse
+import zlib
+
+import gevent
+import gevent.event
+import gevent.pool
+
+def handshake(url, timeout, deflate=False):
+    parsed = urllib.parse.urlparse(url)
+    sock = socket.create_connection((parsed.hostname, parsed.port or 80), timeout=timeout)
+    key = base64.b64encode(struct.pack('!QQ', id(sock), int(time.time() * 1000))).decode()
+    path = parsed.path + ('?' + parsed.query if parsed.query else '')
+    sock.sendall((
+        'GET {} HTTP/1.1\r\nHost: {}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+        'Sec-WebSocket-Key: {}\r\nSec-WebSocket-Version: 13\r\n{}\r\n'
+    ).format(
+        path or '/', parsed.netloc, key,
+        'Sec-WebSocket-Extensions: permessage-deflate; client_max_window_bits\r\n' if deflate else '',
+    ).encode())
+    response = b''
+    while b'\r\n\r\n' not in response:
+        chunk = sock.recv(4096)
+        if not chunk:
+            raise ConnectionError('closed during handshake')
+        response += chunk
+    if not response.startswith(b'HTTP/1.1 101'):
+        raise ConnectionError(response.split(b'\r\n', 1)[0].decode())
+    return sock, response.split(b'\r\n\r\n', 1)[1]
+
+def read_frame(sock, buffer):
+    """Returns (opcode, compressed, payload, rest of buffer)"""
+    def need(size):
+        nonlocal buffer
+        while len(buffer) < size:
+            chunk = sock.recv(65536)
+            if not chunk:
+                raise ConnectionError('closed')
+            buffer += chunk
+    need(2)
+    opcode = buffer[0] & 0x0f
+    compressed = bool(buffer[0] & 0x40)
+    length = buffer[1] & 0x7f
+    offset = 2
+    if length == 126:
+        need(4)
+        length, = struct.unpack('!H', buffer[2:4])
+        offset = 4
+    elif length == 127:
+        need(10)
+        length, = struct.unpack('!Q', buffer[2:10])
+        offset = 10
+    need(offset + length)
+    return opcode, compressed, buffer[offset:offset + length], buffer[offset + length:]
+
+def client(url, results, done, timeout, deflate):
+    started = time.perf_counter()
+    try:
+        sock, buffer = handshake(url, timeout, deflate)
+        opcode, compressed, payload, buffer = read_frame(sock, buffer)
+        if opcode == 0x8:
+            code = struct.unpack('!H', payload[:2])[0] if len(payload) >= 2 else None
+            results['refused' if code == 1013 else 'failed'] += 1
+            return
+        results['snapshot_sec'].append(time.perf_counter() - started)
+        results['connected'] += 1
+        results['wire_bytes'] += len(payload)
+        if compressed:
+            payload = zlib.decompressobj(-zlib.MAX_WBITS).decompress(payload + b'\x00\x00\xff\xff')
+        results['raw_bytes'] += len(payload)
+    except (OSError, ConnectionError):
+        results['failed'] += 1
+        return
+    # Keep the connection open and read events, as browsers do
+    reader = gevent.spawn(read_events, sock, buffer, results)
+    done.wait()
+    reader.kill()
+    sock.close()
+
+def read_events(sock, buffer, results):
+    sock.settimeout(None)
+    try:
+        while True:
+            opcode, _, _, buffer = read_frame(sock, buffer)
+            if opcode == 0x8:
+                results['closed'] += 1
+                return
+            if results['publishing']:
+                results['messages'] += 1
+    except (OSError, ConnectionError):
+        results['closed'] += 1
+
+def publish(redis_url, rate, seconds, results):
+    """PUBLISH partial events to the channel read by PubSubServer"""
+    import json
+    import redis
+    client = redis.Redis.from_url(redis_url)
+    channel = 'newroom'
+    results['publishing'] = True
+    started = time.perf_counter()
+    count = 0
+    while time.perf_counter() - started < seconds:
+        count += 1
+        client.publish(channel, json.dumps({'type': 'partial', 'data': [{
+            'id': '{:07d}'.format(count % 10000000),
+            'owner': {'id': str(count % 1000), 'name': 'load'},
+            'guild': {'id': 'load', 'name': 'load'},
+            'time': int(time.time()),
+        }]}))
+        gevent.sleep(max(0, started + count / rate - time.perf_counter()))
+    results['publishing'] = False
+    results['events'] = count
+    results['publish_sec'] = time.perf_counter() - started
+
+def percentile(values, ratio):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+def main(url, clients, hold_sec, deflate=False, redis_url=None, rate=100):
+    results = {
+        'connected': 0, 'refused': 0, 'failed': 0, 'closed': 0, 'snapshot_sec': [],
+        'wire_bytes': 0, 'raw_bytes': 0,
+        'publishing': False, 'events': 0, 'publish_sec': 0, 'messages': 0,
+    }
+    done = gevent.event.Event()
+    pool = gevent.pool.Pool(clients)
+    started = time.perf_counter()
+    for _ in range(clients):
+        pool.spawn(client, url, results, done, 30, deflate)
+        # Do not flood the accept queue
+        gevent.sleep(0.001)
+    while results['connected'] + results['refused'] + results['failed'] < clients:
+        gevent.sleep(0.1)
+    elapsed = time.perf_counter() - started
+    if redis_url:
+        publish(redis_url, rate, hold_sec, results)
+    else:
+        gevent.sleep(hold_sec)
+    done.set()
+    pool.join()
+    print('clients: {}, connected: {}, refused: {}, failed: {}, elapsed: {:.1f} s'.format(
+        clients, results['connected'], results['refused'], results['failed'], elapsed
+    ))
+    print('snapshot p50: {:.1f} ms, p99: {:.1f} ms'.format(
+        percentile(results['snapshot_sec'], 0.5) * 1000,
+        percentile(results['snapshot_sec'], 0.99) * 1000,
+    ))
+    if results['connected']:
+        print('snapshot bytes: {:.0f} on the wire, {:.0f} inflated'.format(
+            results['wire_bytes'] / results['connected'],
+            results['raw_bytes'] / results['connected'],
+        ))
+    if results['publish_sec']:
+        delivered = results['messages'] / results['publish_sec']
+        print('events: {:.0f}/s, delivered: {:.0f} messages/s, {:.1f}/s per client, closed: {}'.format(
+            results['events'] / results['publish_sec'], delivered,
+            delivered / max(1, results['connected']), results['closed'],
+        ))
+
+if __name__ == '__main__':
+    main(
+        sys.argv[1] if len(sys.argv) > 1 else 'ws://127.0.0.1:8000/room',
+        int(sys.argv[2]) if len(sys.argv) > 2 else 1000,
+        float(sys.argv[3]) if len(sys.argv) > 3 else 10,
+        len(sys.argv) > 4 and sys.argv[4] == 'deflate',
+        os.environ.get('REDIS_URL'),
+        float(os.environ.get('PUBLISH_RATE', 100)),
+    )
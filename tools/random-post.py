@@ -1,4 +1,5 @@
 import os
+import sys
 import string
 import random
 import time
@@ -26,8 +27,11 @@ for _ in range(5):
 types = ['ミド', 'ムム', 'マキュ']
 url = f"http://127.0.0.1:{os.environ.get('PORT', 8000)}/party"
 
-while True:
-    data = {
+# Rooms per request.  More than 1 posts a JSON array
+bulk = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+
+def random_room():
+    return {
         'id': random_id(),
         'time': int(time.time()),
         'message': random_name(),
@@ -39,6 +43,12 @@ while True:
         'type': random.choice(types)
     }
 
+while True:
+    if bulk > 1:
+        data = [random_room() for _ in range(bulk)]
+    else:
+        data = random_room()
+
     response = requests.post(url, json=data, headers={'X-Authorization-Token': token})
     print(response.status_code, response.reason)
     try: